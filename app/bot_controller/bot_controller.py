@@ -1,11 +1,21 @@
+import asyncio
 import logging
 from asyncio import CancelledError
+from typing import Optional
 
-from aiogram import Bot, Dispatcher
-from aiogram.enums import ParseMode
+from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
 from aiohttp.web_runner import GracefulExit
 
+import settings
 from bot_controller import middlewares, services
+from bot_controller.notifications import NotificationDispatcher
+from bot_controller.outbox import OutboxConsumer
+
+BOT_MODE_WEBHOOK = "webhook"
 
 
 class BotController:
@@ -19,25 +29,95 @@ class BotController:
     ]
 
     def __init__(self, telegram_api_key: str):
-        self._bot = Bot(token=telegram_api_key)
+        session = AiohttpSession(api=TelegramAPIServer.from_base(settings.TELEGRAM_API_URL)) if settings.TELEGRAM_API_URL else None
+        self._bot = Bot(token=telegram_api_key, session=session)
         self._dispatcher = Dispatcher()
+        self._notifications = NotificationDispatcher(
+            self._bot,
+            rate=settings.NOTIFICATION_RATE_LIMIT,
+            chat_period=settings.NOTIFICATION_CHAT_PERIOD,
+            max_retries=settings.NOTIFICATION_MAX_RETRIES,
+        )
+        self._outbox = OutboxConsumer(
+            self._notifications,
+            batch_size=settings.OUTBOX_BATCH_SIZE,
+            poll_period=settings.OUTBOX_POLL_PERIOD,
+            claim_timeout=settings.OUTBOX_CLAIM_TIMEOUT,
+            digest_period=settings.DIGEST_PERIOD,
+            retry_period=settings.OUTBOX_RETRY_PERIOD,
+        )
 
         self._register_middlewares()
         self._register_routers()
 
-    async def start(self):
+    async def start(self, notifications: bool = True):
+        """Serve the updates by long polling or by the webhook (`BOT_MODE`), optionally sending the notifications too."""
+        if notifications:
+            self.start_workers()
         try:
-            await self._dispatcher.start_polling(self._bot)
+            if settings.BOT_MODE == BOT_MODE_WEBHOOK:
+                await self._serve_webhook()
+            else:
+                # Telegram refuses `getUpdates` while a webhook is set
+                await self._bot.delete_webhook()
+                await self._dispatcher.start_polling(self._bot)
         except Exception as error:
             logging.exception("Unexpected error: %r", error, exc_info=error)
         except (GracefulExit, KeyboardInterrupt, CancelledError):
             logging.info("Bot graceful shutdown...")
+        finally:
+            if notifications:
+                await self.stop_workers()
+
+    async def set_webhook(self, url: str) -> None:
+        await self._bot.set_webhook(
+            url,
+            secret_token=settings.WEBHOOK_SECRET,
+            allowed_updates=self._dispatcher.resolve_used_update_types(),
+        )
+        logging.info("Webhook is set to %s", url)
+
+    def make_webhook_app(self) -> web.Application:
+        app = web.Application()
+        # Telegram gets the answer at once, the update is handled in background
+        SimpleRequestHandler(self._dispatcher, self._bot, secret_token=settings.WEBHOOK_SECRET).register(app, path=settings.WEBHOOK_PATH)
+        return app
 
-    async def send_message(self, user_external_id: int, answer: str, parse_mode=ParseMode.HTML):
+    async def start_webhook(self, host: str, port: int, reuse_port: bool = False) -> web.AppRunner:
+        runner = web.AppRunner(self.make_webhook_app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port, reuse_port=reuse_port).start()
+        logging.info("Webhook is served on http://%s:%s%s", host, port, settings.WEBHOOK_PATH)
+        return runner
+
+    async def _serve_webhook(self) -> None:
+        runner = await self.start_webhook(settings.WEBHOOK_HOST, settings.WEBHOOK_PORT, reuse_port=settings.WEBHOOK_WORKERS > 1)
         try:
-            await self._bot.send_message(user_external_id, answer, parse_mode=parse_mode)
-        except Exception as error:
-            logging.exception("Unexpected error: %r", error, exc_info=error)
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    def start_workers(self) -> None:
+        """Start sending notifications, the updates are received by `start` or fed by `feed_update`."""
+        self._notifications.start(settings.NOTIFICATION_WORKERS)
+        self._outbox.start()
+
+    async def stop_workers(self) -> None:
+        await self._outbox.stop()
+        await self._notifications.stop()
+
+    async def feed_update(self, update: types.Update) -> None:
+        await self._dispatcher.feed_update(self._bot, update)
+
+    async def close(self) -> None:
+        await self._bot.session.close()
+
+    def notify_outbox(self):
+        self._outbox.wakeup()
+
+    def set_repository_primer(self, prime_repositories: Optional[services.PrimeRepositories]) -> None:
+        """New subscriptions are fetched at once by the release monitor of this process, if any."""
+        self._dispatcher["prime_repositories"] = prime_repositories
 
     def _register_middlewares(self):
         for middleware in self.MIDDLEWARES:
@@ -3,10 +3,22 @@ from typing import Any, Awaitable, Callable, Dict
 from aiogram import BaseMiddleware, types
 
 import db_helper
+import metrics
+from bot_controller import services
 from bot_controller.services import logs
 from models import async_session
 
 
+def get_command_label(message: types.Message) -> str:
+    """Known command of the message, the other messages share one label to keep the metric cardinality low."""
+    text = message.text or ""
+    if not text.startswith("/"):
+        return "message"
+
+    command = text.split(maxsplit=1)[0][1:].split("@", 1)[0]
+    return command if command in services.subscriptions_router.commands else "unknown"
+
+
 class DbTransactionMiddleware(BaseMiddleware):
     async def __call__(
         self,
@@ -27,7 +39,8 @@ class UserMiddleware(BaseMiddleware):
         data: Dict[str, Any],
     ) -> Any:
         session = data["session"]
-        data["user"] = await db_helper.get_or_create_user(session, event.message)
+        # Messages and callback queries (inline keyboard buttons)
+        data["user"] = await db_helper.get_or_create_user(session, event.message or event.callback_query)
         return await handler(event, data)
 
 
@@ -39,8 +52,13 @@ class AutoReplyMiddleware(BaseMiddleware):
         data: Dict[str, Any],
     ) -> Any:
         message = event.message
+        if message is None:
+            with metrics.COMMAND_DURATION.labels(command="callback_query").time():
+                return await handler(event, data)
+
         logs.log_bot_incomming_message(message)
-        result = await handler(event, data)
+        with metrics.COMMAND_DURATION.labels(command=get_command_label(message)).time():
+            result = await handler(event, data)
         logs.log_bot_outgoing_message(message, result)
 
         if result is not None:
@@ -0,0 +1,209 @@
+import asyncio
+import collections
+import contextlib
+import heapq
+import logging
+import time
+from typing import Deque, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+import metrics
+from rate_limiter import TokenBucket
+
+
+class Notification(NamedTuple):
+    chat_id: int
+    text: str
+    parse_mode: str = ParseMode.HTML
+
+
+class QueuedMessage(NamedTuple):
+    notification: Notification
+    # `True` once the message is done: delivered or failed for good, `False` if it is to be sent again later
+    result: asyncio.Future
+    attempt: int = 1
+
+
+class ChatQueues:
+    """
+    Notifications waiting for the turn of their chat: one message per `period` seconds to the same chat.
+
+    A chat is paced slightly under its limit. A chat with waiting messages is in a heap by the time of its next turn and
+    has no more than one message in flight, so the messages of a busy chat wait here, not in a worker.
+    """
+
+    CLEANUP_SIZE = 10_000
+    PACE_MARGIN = 0.9
+
+    def __init__(self, period: float):
+        self._period = period
+        self._waiting: Dict[int, Deque[QueuedMessage]] = {}
+        # Turn time of the chats with waiting messages, a chat with a message in flight gets its turn when it is done
+        self._turns: List[Tuple[float, int]] = []
+        self._busy: Set[int] = set()
+        self._next_turn_at: Dict[int, float] = {}
+        self._sent_at: Dict[int, float] = {}
+        self._changed = asyncio.Event()
+
+    def __len__(self) -> int:
+        return sum(len(waiting) for waiting in self._waiting.values())
+
+    def put(self, message: QueuedMessage) -> None:
+        self._waiting.setdefault(message.notification.chat_id, collections.deque()).append(message)
+        self._schedule(message.notification.chat_id)
+
+    async def get(self) -> QueuedMessage:
+        """The next message of the chat with the earliest turn, once the turn comes."""
+        while True:
+            now = time.monotonic()
+            if self._turns and self._turns[0][0] <= now:
+                _, chat_id = heapq.heappop(self._turns)
+                waiting = self._waiting[chat_id]
+                message = waiting.popleft()
+                if not waiting:
+                    del self._waiting[chat_id]
+                return message
+
+            self._changed.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._changed.wait(), self._turns[0][0] - now if self._turns else None)
+
+    def retry(self, message: QueuedMessage, delay: float) -> None:
+        """The failed message goes back to the head of its chat queue and gets the turn in `delay` seconds."""
+        chat_id = message.notification.chat_id
+        self._waiting.setdefault(chat_id, collections.deque()).appendleft(message._replace(attempt=message.attempt + 1))
+        self.done(chat_id, delay)
+
+    def done(self, chat_id: int, delay: float = 0.0) -> None:
+        """The message in flight is processed: the next turn of the chat comes after its pace or after `delay` if longer."""
+        now = time.monotonic()
+        if len(self._next_turn_at) > self.CLEANUP_SIZE:
+            self._next_turn_at = {key: value for key, value in self._next_turn_at.items() if value > now}
+            self._sent_at = {key: value for key, value in self._sent_at.items() if value > now - self._period}
+
+        self._next_turn_at[chat_id] = now + max(self._period / self.PACE_MARGIN, delay)
+        if not delay:
+            self._sent_at[chat_id] = now
+
+        self._busy.discard(chat_id)
+        self._schedule(chat_id)
+
+    def is_paced(self, chat_id: int) -> bool:
+        """Nothing has been sent to the chat during the last `period`, so it is within the limit of the chat."""
+        sent_at = self._sent_at.get(chat_id)
+        return self._period > 0 and (sent_at is None or time.monotonic() - sent_at >= self._period)
+
+    def _schedule(self, chat_id: int) -> None:
+        if chat_id in self._busy or chat_id not in self._waiting:
+            return
+
+        self._busy.add(chat_id)
+        heapq.heappush(self._turns, (self._next_turn_at.get(chat_id, 0.0), chat_id))
+        self._changed.set()
+
+
+class NotificationDispatcher:
+    """
+    Sends queued notifications with a pool of workers.
+
+    Messages wait for the turn of their chat in `ChatQueues`, then a worker takes a token of the bucket for the global
+    bot limit and sends the message: a busy chat holds neither a worker nor a token. Telegram flood control
+    (`retry_after`) delays the chat of the message. Every worker pauses only when that chat was within its pace:
+    the 429 can't come from the chat limit, so it is the global one.
+
+    A message is done when it is delivered or fails for good (the bot is blocked, the chat is not found). A message
+    that still fails after `max_retries` attempts is given back to the caller to be sent again later.
+    """
+
+    def __init__(self, bot: Bot, rate: float, chat_period: float, max_retries: int):
+        self._bot = bot
+        self._max_retries = max_retries
+        self._chats = ChatQueues(chat_period)
+        # A small bucket: no burst above the rate, e.g. of the whole limit at once on start
+        self._rate_limiter = TokenBucket(rate=rate, capacity=1)
+        self._workers: List[asyncio.Task] = []
+        metrics.NOTIFICATION_QUEUE_SIZE.set_function(lambda: self.queue_size)
+
+    @property
+    def queue_size(self) -> int:
+        return len(self._chats)
+
+    async def dispatch(self, notifications: List[Notification]) -> List[bool]:
+        """Send notifications, whether each one is done: `False` for the ones to send again later."""
+        loop = asyncio.get_running_loop()
+        messages = [QueuedMessage(notification, loop.create_future()) for notification in notifications]
+        for message in messages:
+            self._chats.put(message)
+
+        return list(await asyncio.gather(*(message.result for message in messages)))
+
+    def start(self, workers: int) -> None:
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(workers)]
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _worker(self) -> None:
+        while True:
+            message = await self._chats.get()
+            chat_id = message.notification.chat_id
+            try:
+                delay = await self._send(message.notification, message.attempt)
+            except Exception as error:
+                logging.exception("Unexpected error: %r", error, exc_info=error)
+                # Not sent: the message is given back
+                self._chats.done(chat_id)
+                self._set_result(message, False)
+                continue
+
+            if delay is not None and message.attempt < self._max_retries:
+                self._chats.retry(message, delay)
+                continue
+
+            if delay is not None:
+                metrics.NOTIFICATIONS.labels(result="postponed").inc()
+                logging.error("[%s] Message postponed after %s attempts", chat_id, message.attempt)
+
+            self._chats.done(chat_id, delay or 0.0)
+            self._set_result(message, delay is None)
+
+    @staticmethod
+    def _set_result(message: QueuedMessage, done: bool) -> None:
+        # The caller may be gone, e.g. on shutdown
+        if not message.result.done():
+            message.result.set_result(done)
+
+    async def _send(self, notification: Notification, attempt: int) -> Optional[float]:
+        """Send the message, the delay before the next attempt if it failed and may be sent later."""
+        await self._rate_limiter.acquire()
+        try:
+            await self._bot.send_message(notification.chat_id, notification.text, parse_mode=notification.parse_mode)
+            metrics.NOTIFICATIONS.labels(result="sent").inc()
+            return None
+        except TelegramRetryAfter as error:
+            metrics.NOTIFICATIONS.labels(result="flood_control").inc()
+            self._on_flood_control(notification.chat_id, error.retry_after)
+            return error.retry_after
+        except (TelegramNetworkError, TelegramServerError) as error:
+            metrics.NOTIFICATIONS.labels(result="error").inc()
+            logging.warning("[%s] Failed to send message (attempt %s): %r", notification.chat_id, attempt, error)
+            return float(2**attempt)
+        except (TelegramForbiddenError, TelegramBadRequest) as error:
+            # The bot is blocked, the chat is not found or the message is invalid: sending it again won't help
+            metrics.NOTIFICATIONS.labels(result="failed").inc()
+            logging.warning("[%s] Failed to send message: %r", notification.chat_id, error)
+            return None
+
+    def _on_flood_control(self, chat_id: int, retry_after: float) -> None:
+        if self._chats.is_paced(chat_id):
+            logging.warning("[%s] Flood control of the bot, all chats retry after %s seconds", chat_id, retry_after)
+            self._rate_limiter.pause(retry_after)
+        else:
+            logging.warning("[%s] Flood control of the chat, retry after %s seconds", chat_id, retry_after)
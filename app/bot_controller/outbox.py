@@ -0,0 +1,134 @@
+import asyncio
+import datetime
+import functools
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import sqlalchemy as sa
+
+import db_helper
+from bot_controller.notifications import Notification, NotificationDispatcher
+from models import async_session
+
+# Telegram limit of a text message
+MESSAGE_MAX_LENGTH = 4096
+# Longest delay of a row that failed to be sent
+RETRY_MAX_DELAY = datetime.timedelta(days=1)
+
+
+def split_message(lines: Iterable[str], max_length: int = MESSAGE_MAX_LENGTH) -> List[str]:
+    """Join lines into as few messages as possible, a line is never split between messages."""
+    messages: List[str] = []
+    for line in lines:
+        if messages and len(messages[-1]) + 1 + len(line) <= max_length:
+            messages[-1] += "\n" + line
+        else:
+            messages.append(line)
+
+    return messages
+
+
+def make_notifications(rows: List[sa.Row]) -> List[Tuple[Notification, List[int]]]:
+    """
+    Notifications and the ids of their rows: digest rows of the same chat are coalesced, other rows are sent one by one.
+
+    The messages of a digest share all its rows, so a digest is sent again as a whole if any message of it failed.
+    """
+    notifications: List[Tuple[Notification, List[int]]] = []
+    digests: Dict[Tuple[int, str], List[sa.Row]] = {}
+    for row in rows:
+        if row.digest:
+            digests.setdefault((row.chat_id, row.parse_mode), []).append(row)
+        else:
+            notifications.append((Notification(row.chat_id, row.text, row.parse_mode), [row.id]))
+
+    for (chat_id, parse_mode), digest_rows in digests.items():
+        row_ids = [row.id for row in digest_rows]
+        notifications.extend((Notification(chat_id, text, parse_mode), row_ids) for text in split_message(row.text for row in digest_rows))
+
+    return notifications
+
+
+def get_retry_delay(attempts: int, retry_period: datetime.timedelta) -> datetime.timedelta:
+    """Exponential backoff of a row after its `attempts` failed ones."""
+    return min(retry_period * 2 ** min(attempts, 20), RETRY_MAX_DELAY)
+
+
+class OutboxConsumer:
+    """
+    Drains the `outbox` table in batches: claims rows, sends them and deletes the sent ones.
+
+    A row is deleted only after it is delivered or failed for good, so every message is delivered at least once across
+    restarts. The claim of a row that failed on a transient error is released with a backoff of `retry_period` doubled
+    by each failed attempt.
+    """
+
+    def __init__(
+        self,
+        notifications: NotificationDispatcher,
+        *,
+        batch_size: int,
+        poll_period: float,
+        claim_timeout: datetime.timedelta,
+        digest_period: datetime.timedelta,
+        retry_period: datetime.timedelta,
+    ):
+        self._notifications = notifications
+        self._batch_size = batch_size
+        self._poll_period = poll_period
+        self._claim_outbox = functools.partial(db_helper.claim_outbox, claim_timeout=claim_timeout, digest_period=digest_period)
+        self._retry_period = retry_period
+        self._wakeup_event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def wakeup(self) -> None:
+        self._wakeup_event.set()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup_event.clear()
+            try:
+                processed = await self._process_batch()
+            except Exception as error:
+                logging.exception("Unexpected error: %r", error, exc_info=error)
+                processed = 0
+
+            if processed < self._batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup_event.wait(), self._poll_period)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _process_batch(self) -> int:
+        async with async_session() as session:
+            rows = await self._claim_outbox(session, self._batch_size)
+
+        if not rows:
+            return 0
+
+        notifications = make_notifications(rows)
+        results = await self._notifications.dispatch([notification for notification, _ in notifications])
+        failed_ids: Set[int] = set()
+        for (_, row_ids), done in zip(notifications, results):
+            if not done:
+                failed_ids.update(row_ids)
+
+        async with async_session() as session:
+            await db_helper.delete_outbox(session, [row.id for row in rows if row.id not in failed_ids])
+            if failed_ids:
+                delays = {row.id: get_retry_delay(row.attempts, self._retry_period) for row in rows if row.id in failed_ids}
+                await db_helper.postpone_outbox(session, delays)
+
+        logging.info("Outbox: %s notifications processed, %s postponed", len(rows) - len(failed_ids), len(failed_ids))
+        return len(rows)
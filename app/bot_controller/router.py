@@ -1,4 +1,4 @@
-from typing import Callable, List, Optional
+from typing import Callable, List, Optional, Set
 
 import aiogram
 from aiogram.filters import Command
@@ -10,6 +10,7 @@ class Router(aiogram.Router):
     def __init__(self, *, name: Optional[str] = None) -> None:
         super().__init__(name=name)
         self.command_list: List[str] = []
+        self.commands: Set[str] = set()
 
     def register(
         self,
@@ -28,6 +29,7 @@ class Router(aiogram.Router):
                 handler = skip_empty_command(command=command)(command_handler)
 
             self.message(command_filter)(handler)
+            self.commands.add(command)
 
             if description:
                 self.command_list.append(f"/{command} - {description}")
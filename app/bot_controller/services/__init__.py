@@ -1 +1,2 @@
+from .subscriptions import PrimeRepositories  # noqa: F401
 from .subscriptions import router as subscriptions_router  # noqa: F401
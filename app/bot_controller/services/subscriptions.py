@@ -1,16 +1,21 @@
 import logging
 import re
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
 
 from aiogram import types
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters.callback_data import CallbackData
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import db_helper
 import settings
 from bot_controller.router import Router
-from db_helper import STMT_USER_SUBSCRIPTION
-from models import User, UserRepository
+from models import User
+from subscriptions_cache import SubscriptionsPage, subscriptions_cache
 
 router = Router(name=__name__)
+# Fetches the repositories by ids at once and returns their latest tags, provided by the release monitor
+PrimeRepositories = Callable[[Iterable[int]], Awaitable[Dict[int, Optional[str]]]]
 
 
 @router.register(
@@ -25,18 +30,96 @@ async def send_welcome(*_) -> str:
     return "\n".join(router.command_list)
 
 
+class SubscriptionsPageCallback(CallbackData, prefix="subscriptions"):
+    after: Optional[int] = None
+    before: Optional[int] = None
+
+
+async def get_subscriptions_page(session: AsyncSession, user: User, after: Optional[int], before: Optional[int]) -> SubscriptionsPage:
+    page = subscriptions_cache.get(user.id, (after, before))
+    if page is not None:
+        return page
+
+    rows, has_previous, has_next = await db_helper.get_subscriptions_page(
+        session, user, settings.SUBSCRIPTIONS_PAGE_SIZE, after=after, before=before
+    )
+    if not rows and (after is not None or before is not None):
+        # The page is gone after unsubscriptions: start over
+        return await get_subscriptions_page(session, user, None, None)
+
+    lines = [f'{row.latest_tag if row.latest_tag else "<fetch in progress>"} - {row.url}' for row in rows]
+    total = await db_helper.count_subscriptions(session, user) if rows else 0
+    page = SubscriptionsPage(
+        text=f"Subscriptions ({total}):\n" + "\n".join(lines) if lines else "Subscriptions: empty",
+        repository_ids=frozenset(row.repository_id for row in rows),
+        previous_before=rows[0].repository_id if has_previous else None,
+        next_after=rows[-1].repository_id if has_next else None,
+    )
+    subscriptions_cache.put(user.id, (after, before), page)
+    return page
+
+
+def make_page_keyboard(page: SubscriptionsPage) -> Optional[types.InlineKeyboardMarkup]:
+    buttons = []
+    if page.previous_before is not None:
+        buttons.append(
+            types.InlineKeyboardButton(text="« Prev", callback_data=SubscriptionsPageCallback(before=page.previous_before).pack())
+        )
+    if page.next_after is not None:
+        buttons.append(types.InlineKeyboardButton(text="Next »", callback_data=SubscriptionsPageCallback(after=page.next_after).pack()))
+
+    return types.InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+
+
 @router.register(
     command="my_subscriptions",
     description="view all subscriptions",
 )
 async def my_subscriptions(message: types.Message, session: AsyncSession, user: User) -> None:
-    answer = ""
-    repositories = await session.scalars(STMT_USER_SUBSCRIPTION.where(UserRepository.user_id == user.id))
-    for repository in repositories:
-        answer += f'\n{repository.latest_tag if repository.latest_tag else "<fetch in progress>"} - {repository.url}'
+    page = await get_subscriptions_page(session, user, None, None)
+    await message.reply(text=page.text, reply_markup=make_page_keyboard(page), disable_web_page_preview=True)
+
+
+@router.callback_query(SubscriptionsPageCallback.filter())
+async def my_subscriptions_page(
+    callback_query: types.CallbackQuery,
+    callback_data: SubscriptionsPageCallback,
+    session: AsyncSession,
+    user: User,
+) -> None:
+    try:
+        page = await get_subscriptions_page(session, user, callback_data.after, callback_data.before)
+        if callback_query.message is not None:
+            await callback_query.message.edit_text(text=page.text, reply_markup=make_page_keyboard(page), disable_web_page_preview=True)
+    except TelegramBadRequest as ex:
+        # A repeated tap or a page unchanged since it was sent: the message is already up to date
+        if "message is not modified" not in ex.message:
+            raise
+    finally:
+        # Otherwise the button keeps spinning in the client
+        await callback_query.answer()
+
+
+def parse_repository_urls(message: types.Message) -> Tuple[Dict[str, str], List[str]]:
+    """Split command arguments to valid `{repository_url: short_name}` and invalid urls."""
+    repositories: Dict[str, str] = {}
+    invalid_urls: List[str] = []
+    for repository_url in message.text.split()[1:]:
+        match = re.fullmatch(settings.GITHUB_PATTERN, repository_url)
+        if match is None:
+            logging.warning("Repository skipped by check: %s", repository_url)
+            invalid_urls.append(repository_url)
+            continue
+
+        repositories[repository_url] = match.group(1)
+
+    return repositories, invalid_urls
+
 
-    answer = f'Subscriptions: {answer if answer else "empty"}'
-    await message.reply(text=answer, disable_web_page_preview=True)
+def make_report(**sections: List[str]) -> str:
+    return "\n".join(
+        f"{title.replace('_', ' ').capitalize()} ({len(urls)}):\n" + "\n".join(urls) for title, urls in sections.items() if urls
+    )
 
 
 @router.register(
@@ -44,17 +127,25 @@ async def my_subscriptions(message: types.Message, session: AsyncSession, user:
     description="[github repo urls] subscribe to the new GitHub repository",
     skip_empty_messages=True,
 )
-async def subscribe(message: types.Message, session: AsyncSession, user: User) -> str:
-    for repository_url in message.text.split():
-        matches = re.findall(settings.GITHUB_PATTERN, repository_url)
-        if not matches:
-            logging.warning("Repository skipped by check: %s", repository_url)
-            continue
-
-        await db_helper.make_subscription(session, user, repository_url, short_name=matches[0])
-
+async def subscribe(
+    message: types.Message,
+    session: AsyncSession,
+    user: User,
+    prime_repositories: Optional[PrimeRepositories] = None,
+) -> str:
+    repositories, invalid_urls = parse_repository_urls(message)
+    added = await db_helper.make_subscriptions(session, user, repositories) if repositories else {}
     await session.commit()
-    return "Successfully subscribed!"
+    subscriptions_cache.invalidate(user.id)
+    # The tag writer drops the pages cached while the fetch was in progress
+    latest_tags = await prime_repositories(added.values()) if prime_repositories is not None and added else {}
+    return make_report(
+        subscribed=[
+            f"{latest_tags[repository_id]} - {url}" if latest_tags.get(repository_id) else url for url, repository_id in added.items()
+        ],
+        already_subscribed=[url for url in repositories if url not in added],
+        invalid=invalid_urls,
+    )
 
 
 @router.register(
@@ -63,15 +154,15 @@ async def subscribe(message: types.Message, session: AsyncSession, user: User) -
     skip_empty_messages=True,
 )
 async def unsubscribe(message: types.Message, session: AsyncSession, user: User) -> str:
-    for repository_url in message.text.split():
-        if not re.fullmatch(settings.GITHUB_PATTERN, repository_url):
-            logging.warning("Repository skipped by check: %s", repository_url)
-            continue
-
-        await db_helper.make_unsubscription(session, user, repository_url)
-
+    repositories, invalid_urls = parse_repository_urls(message)
+    removed_urls = await db_helper.make_unsubscriptions(session, user, list(repositories)) if repositories else []
     await session.commit()
-    return "Successfully unsubscribed!"
+    subscriptions_cache.invalidate(user.id)
+    return make_report(
+        unsubscribed=removed_urls,
+        not_subscribed=[url for url in repositories if url not in removed_urls],
+        invalid=invalid_urls,
+    )
 
 
 @router.register(
@@ -81,9 +172,20 @@ async def unsubscribe(message: types.Message, session: AsyncSession, user: User)
 async def remove_all_subscriptions(_: types.Message, session: AsyncSession, user: User) -> str:
     await db_helper.remove_all_subscriptions(session, user)
     await session.commit()
+    subscriptions_cache.invalidate(user.id)
     return "Successfully unsubscribed!"
 
 
+@router.register(
+    command="digest",
+    description="switch digest mode: new releases in a few combined messages",
+)
+async def digest(_: types.Message, session: AsyncSession, user: User) -> str:
+    digest_mode = await db_helper.toggle_digest_mode(session, user)
+    await session.commit()
+    return f"Digest mode is {'on' if digest_mode else 'off'}"
+
+
 @router.register()
 async def no_hello(*_) -> str:
     return "Say /help"
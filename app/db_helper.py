@@ -1,91 +1,378 @@
+import datetime
 import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
 
 import sqlalchemy as sa
 from aiogram import types
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 
-from models import Repository, User, UserRepository
+from models import Outbox, Release, Repository, RepositoryHttpCache, User, UserRepository, utcnow
+from user_cache import user_cache
 
 # Common prebuilt queries
 STMT_USER = sa.select(User)
 STMT_REPOSITORY = sa.select(Repository)
+# Only the columns the release monitor needs, for subscribed repositories
+STMT_REPOSITORY_RECORD = (
+    sa.select(
+        Repository.id,
+        Repository.short_name,
+        Repository.latest_tag,
+        Repository.check_interval,
+        Repository.release_interval,
+        Repository.last_release_at,
+        Repository.tag_source,
+        Repository.tag_source_checked_at,
+        Repository.subscribers_count,
+        sa.select(Release.tag)
+        .where(Release.repository_id == Repository.id)
+        .order_by(Release.id.desc())
+        .limit(1)
+        .correlate(Repository)
+        .scalar_subquery()
+        .label("last_seen_tag"),
+    )
+    .where(sa.exists().where(UserRepository.repository_id == Repository.id))
+    .order_by(Repository.id)
+)
+STMT_REPOSITORY_HTTP_CACHE = sa.select(
+    RepositoryHttpCache.repository_id,
+    RepositoryHttpCache.endpoint,
+    RepositoryHttpCache.etag,
+    RepositoryHttpCache.last_modified,
+)
 STMT_USER_REPOSITORY = sa.select(UserRepository)
 STMT_USER_SUBSCRIPTION = sa.select(Repository).join(UserRepository)
 STMT_USER_WITH_REPOSITORIES = sa.select(User).join(UserRepository)
+# Keyset pages of subscriptions follow the unique (user_id, repository_id) index
+STMT_SUBSCRIPTION_PAGE = sa.select(UserRepository.repository_id, Repository.url, Repository.latest_tag).join(
+    Repository, Repository.id == UserRepository.repository_id
+)
 
 
-async def get_or_create_user(session: AsyncSession, message: types.Message) -> User:
+class RepositoryRecord(NamedTuple):
+    """Read-only snapshot of a repository for the release monitor: no identity map or instance state per row."""
+
+    id: int
+    short_name: str
+    latest_tag: Optional[str]
+    check_interval: Optional[int]
+    release_interval: Optional[int]
+    last_release_at: Optional[datetime.datetime]
+    tag_source: Optional[str]
+    tag_source_checked_at: Optional[datetime.datetime]
+    subscribers_count: int
+    last_seen_tag: Optional[str]
+    # `{endpoint: (etag, last_modified)}`
+    http_cache: Dict[str, Tuple[Optional[str], Optional[str]]]
+
+
+def insert(session: AsyncSession, model: Any) -> Union[postgresql.Insert, sqlite.Insert]:
+    """INSERT with `on_conflict_do_nothing` support of the current database."""
+    dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+
+async def get_or_create_user(session: AsyncSession, message: Union[types.Message, types.CallbackQuery]) -> User:
     user_id = message.from_user.id
+    cached_user = user_cache.get(user_id)
+    if cached_user is not None:
+        # Known identity: attach it to the session without a round trip
+        user = User()
+        user.id = cached_user.id
+        user.external_id = cached_user.external_id
+        make_transient_to_detached(user)
+        session.add(user)
+        return user
+
     user = (await session.scalars(STMT_USER.where(User.external_id == user_id))).one_or_none()
     if user is None:
         user = User()
         user.external_id = user_id
-        await session.merge(user)
+        user = await session.merge(user)
         await session.commit()
         logging.info("[%s] New user added", user.external_id)
 
+    user_cache.put(user)
     return user
 
 
-async def update_repository_latest_tag(session: AsyncSession, repository: Repository, latest_tag: str) -> None:
-    session.add(repository)
-    repository.latest_tag = latest_tag
-    await session.merge(repository)
+class NewRelease(NamedTuple):
+    tag: str
+    url: Optional[str]
+    published_at: Optional[datetime.datetime] = None
+    prerelease: bool = False
+    # Notification text, `None` for the releases stored without a notification
+    answer: Optional[str] = None
+
+
+class TagChange(NamedTuple):
+    repository_id: int
+    short_name: str
+    latest_tag: str
+    # Oldest first
+    releases: Tuple[NewRelease, ...]
+    parse_mode: Optional[str] = None
+    # Validator of the response with the new tag: stored together with the tag, never ahead of it
+    endpoint: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+# Notifications for all subscribers of one repository, executed once per change
+STMT_INSERT_TAG_NOTIFICATIONS = sa.insert(Outbox.__table__).from_select(
+    [Outbox.chat_id, Outbox.text, Outbox.parse_mode, Outbox.digest],
+    sa.select(
+        User.external_id,
+        sa.bindparam("answer", type_=sa.TEXT),
+        sa.bindparam("parse_mode", type_=sa.VARCHAR),
+        User.digest_mode,
+    )
+    .join(UserRepository)
+    .where(UserRepository.repository_id == sa.bindparam("repository_id")),
+)
+
+
+async def get_repository_records(session: AsyncSession, repository_ids: List[int]) -> List[RepositoryRecord]:
+    rows = (await session.execute(STMT_REPOSITORY_RECORD.where(Repository.id.in_(repository_ids)))).all()
+    http_cache: Dict[int, Dict[str, Tuple[Optional[str], Optional[str]]]] = {}
+    if rows:
+        for repository_id, endpoint, etag, last_modified in await session.execute(
+            STMT_REPOSITORY_HTTP_CACHE.where(RepositoryHttpCache.repository_id.in_([row.id for row in rows]))
+        ):
+            http_cache.setdefault(repository_id, {})[endpoint] = (etag, last_modified)
+
+    return [RepositoryRecord(*row, http_cache=http_cache.get(row.id, {})) for row in rows]
+
+
+async def update_repositories_latest_tags(session: AsyncSession, changes: List[TagChange]) -> None:
+    """Store new tags, releases, validators and notifications by a few executemany statements in one transaction."""
+    await session.execute(sa.update(Repository), [{"id": change.repository_id, "latest_tag": change.latest_tag} for change in changes])
+    validators = [
+        {"repository_id": change.repository_id, "endpoint": change.endpoint, "etag": change.etag, "last_modified": change.last_modified}
+        for change in changes
+        if change.endpoint is not None
+    ]
+    if validators:
+        await upsert_repository_http_cache(session, validators)
+
+    # Known releases are skipped, so notifications come from the inserted rows only
+    inserted = set(
+        (
+            await session.execute(
+                insert(session, Release.__table__).on_conflict_do_nothing().returning(Release.repository_id, Release.tag),
+                [
+                    {
+                        "repository_id": change.repository_id,
+                        "tag": release.tag,
+                        "url": release.url,
+                        "published_at": release.published_at,
+                        "prerelease": release.prerelease,
+                    }
+                    for change in changes
+                    for release in change.releases
+                ],
+            )
+        ).all()
+    )
+    notifications = [
+        {"repository_id": change.repository_id, "answer": release.answer, "parse_mode": change.parse_mode}
+        for change in changes
+        for release in change.releases
+        if release.answer is not None and (change.repository_id, release.tag) in inserted
+    ]
+    # Notifications are stored in the same transaction: a release is never lost between the commit and the sending
+    if notifications:
+        await session.execute(STMT_INSERT_TAG_NOTIFICATIONS, notifications)
+
     await session.commit()
-    logging.info("[%s] New tag %s", repository.short_name, latest_tag)
-
-
-async def make_subscription(session: AsyncSession, user: User, repository_url: str, short_name: str) -> None:
-    repository = (await session.scalars(STMT_REPOSITORY.where(Repository.url == repository_url))).one_or_none()
-    if repository is None:
-        repository = Repository()
-        repository.url = repository_url
-        repository.short_name = short_name
-        session.add(repository)
-        await session.flush()
-        logging.info(
-            "Repository `%s` doesn't exists: create new repository url",
-            repository_url,
+    for change in changes:
+        logging.info("[%s] New tag %s", change.short_name, change.latest_tag)
+
+
+async def update_repository_tag_source(session: AsyncSession, repository: RepositoryRecord, tag_source: Optional[str]) -> None:
+    await session.execute(
+        sa.update(Repository)
+        .where(Repository.id == repository.id)
+        .values(tag_source=tag_source, tag_source_checked_at=utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    logging.info("[%s] Tag source: %s", repository.short_name, tag_source)
+
+
+async def claim_outbox(
+    session: AsyncSession,
+    batch_size: int,
+    claim_timeout: datetime.timedelta,
+    digest_period: datetime.timedelta,
+) -> List[sa.Row]:
+    now = utcnow()
+    # Rows claimed by a dead consumer become available again after `claim_timeout`, postponed rows after `available_at`
+    unclaimed = sa.and_(
+        sa.or_(Outbox.claimed_at.is_(None), Outbox.claimed_at < now - claim_timeout),
+        sa.or_(Outbox.available_at.is_(None), Outbox.available_at <= now),
+    )
+    claimable = (
+        sa.select(Outbox.id)
+        .where(unclaimed, Outbox.digest.is_(False))
+        .order_by(Outbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    # Digest rows wait until the oldest one of the chat is `digest_period` old, then all of them go in the same batch
+    due_chats = (
+        sa.select(Outbox.chat_id)
+        .where(unclaimed, Outbox.digest.is_(True))
+        .group_by(Outbox.chat_id)
+        .having(sa.func.min(Outbox.created_at) <= now - digest_period)  # pylint: disable=not-callable
+        .order_by(sa.func.min(Outbox.id))  # pylint: disable=not-callable
+        .limit(batch_size)
+    )
+    claimable_digests = (
+        sa.select(Outbox.id).where(unclaimed, Outbox.digest.is_(True), Outbox.chat_id.in_(due_chats)).with_for_update(skip_locked=True)
+    )
+    rows = (
+        await session.execute(
+            sa.update(Outbox)
+            .where(sa.or_(Outbox.id.in_(claimable), Outbox.id.in_(claimable_digests)))
+            .values(claimed_at=now)
+            .returning(Outbox.id, Outbox.chat_id, Outbox.text, Outbox.parse_mode, Outbox.digest, Outbox.attempts)
         )
+    ).all()
+    await session.commit()
+    return rows
 
-    user_repository = (
-        await session.scalars(
-            STMT_USER_REPOSITORY.where(
-                UserRepository.user_id == user.id,
-                UserRepository.repository_id == repository.id,
+
+async def delete_outbox(session: AsyncSession, outbox_ids: List[int]) -> None:
+    await session.execute(sa.delete(Outbox).where(Outbox.id.in_(outbox_ids)))
+    await session.commit()
+
+
+async def postpone_outbox(session: AsyncSession, delays: Dict[int, datetime.timedelta]) -> None:
+    """Release the claim of the rows `{id: delay}` to send them again after the delay."""
+    now = utcnow()
+    outbox = Outbox.__table__
+    await session.execute(
+        sa.update(outbox)
+        .where(outbox.c.id == sa.bindparam("outbox_id"))
+        .values(claimed_at=None, attempts=outbox.c.attempts + 1, available_at=sa.bindparam("available_at")),
+        [{"outbox_id": outbox_id, "available_at": now + delay} for outbox_id, delay in delays.items()],
+    )
+    await session.commit()
+
+
+async def upsert_repository_http_cache(session: AsyncSession, validators: List[Dict[str, Optional[str]]]) -> None:
+    """Insert or update `{repository_id, endpoint, etag, last_modified}` validators by one executemany."""
+    stmt = insert(session, RepositoryHttpCache.__table__)
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[RepositoryHttpCache.repository_id, RepositoryHttpCache.endpoint],
+            set_={"etag": stmt.excluded.etag, "last_modified": stmt.excluded.last_modified},
+        ),
+        validators,
+    )
+
+
+async def make_subscriptions(session: AsyncSession, user: User, repositories: Dict[str, str]) -> Dict[str, int]:
+    """Subscribe the user to `{repository_url: short_name}` in constant round trips, return `{url: id}` of the new subscriptions."""
+    await session.execute(
+        insert(session, Repository)
+        .values([{"url": url, "short_name": short_name} for url, short_name in repositories.items()])
+        .on_conflict_do_nothing()
+    )
+    repository_ids: Dict[str, int] = dict(
+        (await session.execute(sa.select(Repository.url, Repository.id).where(Repository.url.in_(repositories)))).all()
+    )
+    if not repository_ids:
+        return {}
+
+    added_ids = set(
+        (
+            await session.scalars(
+                insert(session, UserRepository)
+                .values([{"user_id": user.id, "repository_id": repository_id} for repository_id in repository_ids.values()])
+                .on_conflict_do_nothing()
+                .returning(UserRepository.repository_id)
             )
-        )
-    ).one_or_none()
-    if user_repository is None:
-        user_repository = UserRepository()
-        user_repository.user = user
-        user_repository.repository = repository
-        session.add(user_repository)
-        logging.info("Subscribe user %s to %s", user.external_id, repository_url)
-
-
-async def make_unsubscription(session: AsyncSession, user: User, repository_url: str) -> None:
-    repository = (await session.scalars(STMT_REPOSITORY.where(Repository.url == repository_url))).one_or_none()
-    if repository is None:
-        logging.info("Repository `%s` doesn't exists: skip", repository_url)
-        return
-
-    user_repository = (
-        await session.scalars(
-            STMT_USER_REPOSITORY.where(
-                UserRepository.user_id == user.id,
-                UserRepository.repository_id == repository.id,
+        ).all()
+    )
+    # New subscribers deserve fresh data: check these repositories as soon as possible
+    now = utcnow()
+    await session.execute(
+        sa.update(Repository)
+        .where(Repository.id.in_(added_ids), Repository.next_check_at > now)
+        .values(next_check_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    added = {url: repository_id for url, repository_id in repository_ids.items() if repository_id in added_ids}
+    logging.info("Subscribe user %s to %s", user.external_id, list(added))
+    return added
+
+
+async def make_unsubscriptions(session: AsyncSession, user: User, repository_urls: List[str]) -> List[str]:
+    """Unsubscribe the user from repositories with one DELETE, return the unsubscribed urls."""
+    repository_ids: Dict[str, int] = dict(
+        (await session.execute(sa.select(Repository.url, Repository.id).where(Repository.url.in_(repository_urls)))).all()
+    )
+    if not repository_ids:
+        return []
+
+    removed_ids = set(
+        (
+            await session.scalars(
+                sa.delete(UserRepository)
+                .where(UserRepository.user_id == user.id, UserRepository.repository_id.in_(repository_ids.values()))
+                .returning(UserRepository.repository_id)
             )
-        )
-    ).one_or_none()
-    if user_repository:
-        await session.delete(user_repository)
-        logging.info("Unsubscribe user %s from %s", user.external_id, repository_url)
+        ).all()
+    )
+    removed_urls = [url for url, repository_id in repository_ids.items() if repository_id in removed_ids]
+    logging.info("Unsubscribe user %s from %s", user.external_id, removed_urls)
+    return removed_urls
 
 
-async def remove_all_subscriptions(session: AsyncSession, user: User) -> None:
-    user_repositories = await session.scalars(STMT_USER_REPOSITORY.where(UserRepository.user_id == user.id))
-    for user_repository in user_repositories:
-        await session.delete(user_repository)
+async def get_subscriptions_page(
+    session: AsyncSession,
+    user: User,
+    page_size: int,
+    after: Optional[int] = None,
+    before: Optional[int] = None,
+) -> Tuple[List[sa.Row], bool, bool]:
+    """Subscriptions after or before the repository id and whether there are previous and next pages."""
+    stmt = STMT_SUBSCRIPTION_PAGE.where(UserRepository.user_id == user.id)
+    if before is not None:
+        stmt = stmt.where(UserRepository.repository_id < before).order_by(UserRepository.repository_id.desc())
+        rows = (await session.execute(stmt.limit(page_size + 1))).all()
+        return rows[:page_size][::-1], len(rows) > page_size, True
+
+    if after is not None:
+        stmt = stmt.where(UserRepository.repository_id > after)
+
+    rows = (await session.execute(stmt.order_by(UserRepository.repository_id).limit(page_size + 1))).all()
+    return rows[:page_size], after is not None, len(rows) > page_size
 
+
+async def count_subscriptions(session: AsyncSession, user: User) -> int:
+    return await session.scalar(
+        sa.select(sa.func.count(UserRepository.id)).where(UserRepository.user_id == user.id)  # pylint: disable=not-callable
+    )
+
+
+async def toggle_digest_mode(session: AsyncSession, user: User) -> bool:
+    digest_mode = await session.scalar(
+        sa.update(User)
+        .where(User.id == user.id)
+        .values(digest_mode=sa.not_(User.digest_mode))
+        .returning(User.digest_mode)
+        .execution_options(synchronize_session=False)
+    )
+    logging.info("Digest mode of user %s: %s", user.external_id, digest_mode)
+    return digest_mode
+
+
+async def remove_all_subscriptions(session: AsyncSession, user: User) -> None:
+    await session.execute(sa.delete(UserRepository).where(UserRepository.user_id == user.id))
     logging.info("Full unsubscribe for user %s", user.external_id)
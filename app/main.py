@@ -1,25 +1,111 @@
 import asyncio
+import contextlib
 import logging
+import multiprocessing
 import os
+import signal
+from typing import List
 
+import settings
 from bot_controller import BotController
+from bot_controller.bot_controller import BOT_MODE_WEBHOOK
+from metrics import start_metrics_server
+from models import init_db
 from release_monitor import run_release_monitor
+from subscriptions_cache import subscriptions_cache
 
+APP_ROLE_BOT = "bot"
+APP_ROLE_MONITOR = "monitor"
 
-async def main() -> None:
+
+def get_webhook_workers() -> int:
+    if settings.BOT_MODE != BOT_MODE_WEBHOOK or settings.APP_ROLE == APP_ROLE_MONITOR:
+        return 1
+
+    return settings.WEBHOOK_WORKERS
+
+
+def start_webhook_workers(count: int) -> List[multiprocessing.Process]:
+    # Spawned, not forked: a child must not inherit the event loop and the connections of the parent
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run_webhook_worker, args=(index,), daemon=True) for index in range(1, count)]
+    for process in processes:
+        process.start()
+
+    return processes
+
+
+def stop_webhook_workers(processes: List[multiprocessing.Process]) -> None:
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join(timeout=10)
+
+
+async def serve_notifications(bot_controller: BotController, task: asyncio.Task) -> None:
+    bot_controller.start_workers()
+    try:
+        await task
+    except asyncio.CancelledError:
+        logging.info("Release monitor graceful shutdown...")
+    finally:
+        await bot_controller.stop_workers()
+
+
+async def main(worker_index: int = 0) -> None:
+    # SIGTERM (e.g. `docker stop`) shuts down gracefully like Ctrl+C, long polling installs its own handler
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    engine = await init_db()
+    metrics_port = settings.METRICS_PORT + worker_index if settings.METRICS_PORT else 0
+    metrics_runner = await start_metrics_server(settings.METRICS_HOST, metrics_port) if metrics_port else None
     bot_controller = BotController(os.getenv("TELEGRAM_API_KEY"))
-    task = asyncio.create_task(run_release_monitor(bot_controller))
+    webhook_workers = get_webhook_workers()
+    if webhook_workers > 1:
+        # A subscription change handled by one worker can't drop the pages cached by another one
+        subscriptions_cache.maxsize = 0
+
+    # The first process runs the release monitor and sends the notifications, the other ones serve the webhook only
+    monitor = worker_index == 0 and settings.APP_ROLE != APP_ROLE_BOT
+    task = asyncio.create_task(run_release_monitor(bot_controller)) if monitor else None
+    processes = start_webhook_workers(webhook_workers) if worker_index == 0 else []
 
     try:
-        await bot_controller.start()
+        if settings.APP_ROLE == APP_ROLE_MONITOR:
+            await serve_notifications(bot_controller, task)
+        else:
+            if worker_index == 0 and settings.BOT_MODE == BOT_MODE_WEBHOOK and settings.WEBHOOK_URL:
+                await bot_controller.set_webhook(settings.WEBHOOK_URL)
+
+            await bot_controller.start(notifications=monitor)
     finally:
-        task.cancel()
+        stop_webhook_workers(processes)
+        if task is not None:
+            task.cancel()
+            # The release monitor flushes buffered tags on cancellation
+            await asyncio.gather(task, return_exceptions=True)
 
+        await bot_controller.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
-if __name__ == "__main__":
+        await engine.dispose()
+
+
+def setup_logging() -> None:
     logging.basicConfig(
         level=logging.INFO,
-        format="%(levelname)9s | %(asctime)s | %(name)30s | %(filename)20s | %(lineno)6s | %(message)s",
+        format="%(levelname)9s | %(asctime)s | %(process)7s | %(name)30s | %(filename)20s | %(lineno)6s | %(message)s",
         force=True,
     )
-    asyncio.run(main())
+
+
+def run_webhook_worker(worker_index: int) -> None:
+    setup_logging()
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(main(worker_index))
+
+
+if __name__ == "__main__":
+    setup_logging()
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(main())
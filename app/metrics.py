@@ -0,0 +1,49 @@
+import logging
+from typing import Tuple
+
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SWEEP_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 300.0, 900.0, 1800.0, 3600.0, 7200.0)
+
+# The default registry also exports the process and Python runtime metrics
+GITHUB_REQUEST_DURATION = Histogram(
+    "github_request_duration_seconds", "GitHub API request latency.", ["endpoint", "status"], buckets=DEFAULT_BUCKETS
+)
+GITHUB_RATE_LIMIT_REMAINING = Gauge("github_rate_limit_remaining", "Remaining GitHub API quota of a token.", ["token"])
+SWEEP_DURATION = Histogram("release_monitor_sweep_duration_seconds", "Duration of a release monitor sweep.", buckets=SWEEP_BUCKETS)
+SWEEP_REPOSITORIES = Counter("release_monitor_repositories_checked_total", "Repositories checked by the release monitor.")
+SWEEP_REPOSITORIES_RATE = Gauge("release_monitor_repositories_per_second", "Repositories per second of the latest sweep.")
+DB_QUERY_DURATION = Histogram("db_query_duration_seconds", "Database statement latency.", ["operation"], buckets=DEFAULT_BUCKETS)
+COMMAND_DURATION = Histogram("bot_command_duration_seconds", "Latency of the bot command handlers.", ["command"], buckets=DEFAULT_BUCKETS)
+NOTIFICATION_QUEUE_SIZE = Gauge("notification_queue_size", "Notifications waiting for a sending worker.")
+NOTIFICATIONS = Counter("notifications_total", "Notification sending attempts by result.", ["result"])
+USER_CACHE_LOOKUPS = Counter("user_cache_lookups_total", "Lookups of the bot user cache by result.", ["result"])
+
+
+def get_summary(histogram: Histogram) -> Tuple[int, float]:
+    """Count and sum of the observations of all label values of a histogram."""
+    count, total = 0, 0.0
+    for metric in histogram.collect():
+        for sample in metric.samples:
+            if sample.name == f"{metric.name}_count":
+                count += int(sample.value)
+            elif sample.name == f"{metric.name}_sum":
+                total += sample.value
+
+    return count, total
+
+
+async def handle_metrics(_: web.Request) -> web.Response:
+    return web.Response(body=generate_latest(REGISTRY), headers={"Content-Type": CONTENT_TYPE_LATEST, "Cache-Control": "no-cache"})
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info("Metrics are available on http://%s:%s/metrics", host, port)
+    return runner
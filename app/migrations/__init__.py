@@ -0,0 +1,54 @@
+import importlib
+import logging
+import pkgutil
+import re
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Migration modules `mNNNN_<name>.py` are applied in the order of their names, never change the applied ones
+MIGRATIONS = [
+    importlib.import_module(f"{__name__}.{module.name}")
+    for module in sorted(pkgutil.iter_modules(__path__), key=lambda module: module.name)
+    if re.fullmatch(r"m\d{4}_\w+", module.name)
+]
+
+metadata = sa.MetaData()
+schema_version = sa.Table(
+    "schema_version",
+    metadata,
+    sa.Column("version", sa.INT, primary_key=True, nullable=False, autoincrement=False),
+    sa.Column("applied_at", sa.TIMESTAMP, nullable=False, server_default=sa.sql.func.now()),  # pylint: disable=not-callable
+)
+
+
+# Key of the PostgreSQL advisory lock of the migrations
+MIGRATIONS_LOCK_KEY = 0x72656C6D
+
+
+def lock(connection: sa.Connection) -> None:
+    """Till the end of the transaction: the processes started at once against the same database migrate one by one."""
+    if connection.dialect.name == "sqlite":
+        # The write lock at once: the driver starts a transaction only before DML and runs DDL out of it
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+    elif connection.dialect.name == "postgresql":
+        connection.execute(sa.select(sa.func.pg_advisory_xact_lock(MIGRATIONS_LOCK_KEY)))
+
+
+def upgrade(connection: sa.Connection) -> None:
+    lock(connection)
+    # Read within the lock: another process may have migrated the database meanwhile
+    schema_version.create(connection, checkfirst=True)
+    current_version = connection.scalar(sa.select(sa.func.max(schema_version.c.version))) or 0
+    for migration in MIGRATIONS:
+        if migration.VERSION <= current_version:
+            continue
+
+        logging.info("Apply migration %s: %s", migration.VERSION, migration.__name__)
+        migration.upgrade(connection)
+        connection.execute(sa.insert(schema_version).values(version=migration.VERSION))
+
+
+async def apply_migrations(engine: AsyncEngine) -> None:
+    async with engine.begin() as connection:
+        await connection.run_sync(upgrade)
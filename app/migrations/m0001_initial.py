@@ -0,0 +1,84 @@
+import sqlalchemy as sa
+
+VERSION = 1
+
+# Frozen copy of the schema, the models may change with the next migrations
+metadata = sa.MetaData()
+STMT_NOW_TIMESTAMP = sa.sql.func.now()  # pylint: disable=not-callable
+TABLE_ARGS = {"sqlite_autoincrement": True}
+
+user = sa.Table(
+    "user",
+    metadata,
+    sa.Column("id", sa.INT, primary_key=True, nullable=False, unique=True, autoincrement=True),
+    sa.Column("external_id", sa.BIGINT, nullable=False),
+    sa.Column("created_at", sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP),
+    sa.Column("updated_at", sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP),
+    **TABLE_ARGS,
+)
+repository = sa.Table(
+    "repository",
+    metadata,
+    sa.Column("id", sa.INT, primary_key=True, nullable=False, unique=True, autoincrement=True),
+    sa.Column("url", sa.VARCHAR(100), nullable=False, unique=True),
+    sa.Column("short_name", sa.VARCHAR(50), nullable=False, unique=True),
+    sa.Column("latest_tag", sa.VARCHAR(50), nullable=True),
+    sa.Column("created_at", sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP),
+    sa.Column("updated_at", sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP),
+    **TABLE_ARGS,
+)
+repository_http_cache = sa.Table(
+    "repository_http_cache",
+    metadata,
+    sa.Column("id", sa.INT, primary_key=True, nullable=False, unique=True, autoincrement=True),
+    sa.Column("repository_id", sa.BIGINT, sa.ForeignKey("repository.id"), nullable=False),
+    sa.Column("endpoint", sa.VARCHAR(20), nullable=False),
+    sa.Column("etag", sa.VARCHAR(100), nullable=True),
+    sa.Column("last_modified", sa.VARCHAR(50), nullable=True),
+    sa.Column("created_at", sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP),
+    sa.Column("updated_at", sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP),
+    sa.UniqueConstraint("repository_id", "endpoint"),
+    **TABLE_ARGS,
+)
+user_repository = sa.Table(
+    "user_repository",
+    metadata,
+    sa.Column("id", sa.INT, primary_key=True, nullable=False, unique=True, autoincrement=True),
+    sa.Column("user_id", sa.BIGINT, sa.ForeignKey("user.id"), nullable=False),
+    sa.Column("repository_id", sa.BIGINT, sa.ForeignKey("repository.id"), nullable=False),
+    sa.Column("created_at", sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP),
+    sa.Column("updated_at", sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP),
+    **TABLE_ARGS,
+)
+outbox = sa.Table(
+    "outbox",
+    metadata,
+    sa.Column("id", sa.INT, primary_key=True, nullable=False, unique=True, autoincrement=True),
+    sa.Column("chat_id", sa.BIGINT, nullable=False),
+    sa.Column("text", sa.TEXT, nullable=False),
+    sa.Column("parse_mode", sa.VARCHAR(20), nullable=True),
+    sa.Column("claimed_at", sa.TIMESTAMP, nullable=True),
+    sa.Column("created_at", sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP),
+    sa.Column("updated_at", sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP),
+    **TABLE_ARGS,
+)
+ux_user_repository = sa.Index(
+    "ux_user_repository_user_id_repository_id", user_repository.c.user_id, user_repository.c.repository_id, unique=True
+)
+
+
+def upgrade(connection: sa.Connection) -> None:
+    # Databases created before the migrations already have some of the tables: create only the missing ones
+    metadata.create_all(connection, checkfirst=True)
+    if sa.inspect(connection).has_index(user_repository.name, ux_user_repository.name):
+        return
+
+    # Old databases may contain duplicated subscriptions
+    connection.execute(
+        sa.delete(user_repository).where(
+            user_repository.c.id.not_in(
+                sa.select(sa.func.min(user_repository.c.id)).group_by(user_repository.c.user_id, user_repository.c.repository_id)
+            )
+        )
+    )
+    ux_user_repository.create(connection)
@@ -0,0 +1,17 @@
+import sqlalchemy as sa
+
+VERSION = 2
+
+metadata = sa.MetaData()
+user = sa.Table("user", metadata, sa.Column("external_id", sa.BIGINT))
+user_repository = sa.Table("user_repository", metadata, sa.Column("repository_id", sa.BIGINT))
+# `user_repository.user_id` is covered by the leading column of the unique (user_id, repository_id) index
+INDEXES = [
+    sa.Index("ix_user_external_id", user.c.external_id),
+    sa.Index("ix_user_repository_repository_id", user_repository.c.repository_id),
+]
+
+
+def upgrade(connection: sa.Connection) -> None:
+    for index in INDEXES:
+        index.create(connection, checkfirst=True)
@@ -0,0 +1,23 @@
+import sqlalchemy as sa
+
+from migrations.operations import add_column
+
+VERSION = 3
+
+metadata = sa.MetaData()
+repository = sa.Table(
+    "repository",
+    metadata,
+    sa.Column("next_check_at", sa.TIMESTAMP, nullable=True),
+    sa.Column("check_interval", sa.INT, nullable=True),
+    sa.Column("release_interval", sa.INT, nullable=True),
+    sa.Column("last_release_at", sa.TIMESTAMP, nullable=True),
+)
+ix_repository_next_check_at = sa.Index("ix_repository_next_check_at", repository.c.next_check_at)
+
+
+def upgrade(connection: sa.Connection) -> None:
+    for column in repository.columns:
+        add_column(connection, column)
+
+    ix_repository_next_check_at.create(connection, checkfirst=True)
@@ -0,0 +1,18 @@
+import sqlalchemy as sa
+
+from migrations.operations import add_column
+
+VERSION = 4
+
+metadata = sa.MetaData()
+repository = sa.Table(
+    "repository",
+    metadata,
+    sa.Column("tag_include", sa.VARCHAR(200), nullable=True),
+    sa.Column("tag_exclude", sa.VARCHAR(200), nullable=True),
+)
+
+
+def upgrade(connection: sa.Connection) -> None:
+    for column in repository.columns:
+        add_column(connection, column)
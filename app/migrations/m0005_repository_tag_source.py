@@ -0,0 +1,18 @@
+import sqlalchemy as sa
+
+from migrations.operations import add_column
+
+VERSION = 5
+
+metadata = sa.MetaData()
+repository = sa.Table(
+    "repository",
+    metadata,
+    sa.Column("tag_source", sa.VARCHAR(20), nullable=True),
+    sa.Column("tag_source_checked_at", sa.TIMESTAMP, nullable=True),
+)
+
+
+def upgrade(connection: sa.Connection) -> None:
+    for column in repository.columns:
+        add_column(connection, column)
@@ -0,0 +1,14 @@
+import sqlalchemy as sa
+
+from migrations.operations import add_column
+
+VERSION = 6
+
+metadata = sa.MetaData()
+user = sa.Table("user", metadata, sa.Column("digest_mode", sa.BOOLEAN, nullable=False, server_default=sa.false()))
+outbox = sa.Table("outbox", metadata, sa.Column("digest", sa.BOOLEAN, nullable=False, server_default=sa.false()))
+
+
+def upgrade(connection: sa.Connection) -> None:
+    for column in [*user.columns, *outbox.columns]:
+        add_column(connection, column)
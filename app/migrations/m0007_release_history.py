@@ -0,0 +1,30 @@
+import sqlalchemy as sa
+
+VERSION = 7
+
+metadata = sa.MetaData()
+STMT_NOW_TIMESTAMP = sa.sql.func.now()  # pylint: disable=not-callable
+
+# Only the referenced column, the table itself already exists
+repository = sa.Table("repository", metadata, sa.Column("id", sa.INT, primary_key=True))
+release = sa.Table(
+    "release",
+    metadata,
+    sa.Column("id", sa.INT, primary_key=True, nullable=False, unique=True, autoincrement=True),
+    sa.Column("repository_id", sa.BIGINT, sa.ForeignKey("repository.id"), nullable=False),
+    sa.Column("tag", sa.VARCHAR(100), nullable=False),
+    sa.Column("url", sa.VARCHAR(300), nullable=True),
+    sa.Column("published_at", sa.TIMESTAMP, nullable=True),
+    sa.Column("prerelease", sa.BOOLEAN, nullable=False, server_default=sa.false()),
+    sa.Column("created_at", sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP),
+    sa.Column("updated_at", sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP),
+    sa.UniqueConstraint("repository_id", "tag"),
+    sqlite_autoincrement=True,
+)
+# The last seen release of a repository is its row with the greatest id
+ix_release_repository_id_id = sa.Index("ix_release_repository_id_id", release.c.repository_id, release.c.id)
+
+
+def upgrade(connection: sa.Connection) -> None:
+    release.create(connection, checkfirst=True)
+    ix_release_repository_id_id.create(connection, checkfirst=True)
@@ -0,0 +1,21 @@
+import sqlalchemy as sa
+
+from migrations.operations import add_column
+
+VERSION = 8
+
+metadata = sa.MetaData()
+repository = sa.Table(
+    "repository",
+    metadata,
+    sa.Column("lease_owner", sa.VARCHAR(100), nullable=True),
+    sa.Column("lease_expires_at", sa.TIMESTAMP, nullable=True),
+)
+ix_repository_lease_owner = sa.Index("ix_repository_lease_owner", repository.c.lease_owner)
+
+
+def upgrade(connection: sa.Connection) -> None:
+    for column in repository.columns:
+        add_column(connection, column)
+
+    ix_repository_lease_owner.create(connection, checkfirst=True)
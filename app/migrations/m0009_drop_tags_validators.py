@@ -0,0 +1,15 @@
+import sqlalchemy as sa
+
+VERSION = 9
+
+metadata = sa.MetaData()
+repository_http_cache = sa.Table(
+    "repository_http_cache",
+    metadata,
+    sa.Column("endpoint", sa.VARCHAR(20), nullable=False),
+)
+
+
+def upgrade(connection: sa.Connection) -> None:
+    # The validators of the first page of long tag lists hid the new tags of the next pages
+    connection.execute(sa.delete(repository_http_cache).where(repository_http_cache.c.endpoint == "tags"))
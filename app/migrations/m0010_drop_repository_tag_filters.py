@@ -0,0 +1,11 @@
+import sqlalchemy as sa
+
+from migrations.operations import drop_column
+
+VERSION = 10
+
+
+def upgrade(connection: sa.Connection) -> None:
+    # Nothing ever set the tag filters per repository, the settings are the only ones
+    for column_name in ("tag_include", "tag_exclude"):
+        drop_column(connection, "repository", column_name)
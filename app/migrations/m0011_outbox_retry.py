@@ -0,0 +1,18 @@
+import sqlalchemy as sa
+
+from migrations.operations import add_column
+
+VERSION = 11
+
+metadata = sa.MetaData()
+outbox = sa.Table(
+    "outbox",
+    metadata,
+    sa.Column("attempts", sa.INT, nullable=False, server_default="0"),
+    sa.Column("available_at", sa.TIMESTAMP, nullable=True),
+)
+
+
+def upgrade(connection: sa.Connection) -> None:
+    for column in outbox.columns:
+        add_column(connection, column)
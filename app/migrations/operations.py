@@ -0,0 +1,20 @@
+import sqlalchemy as sa
+
+
+def add_column(connection: sa.Connection, column: sa.Column) -> None:
+    table_name = column.table.name
+    if column.name in {item["name"] for item in sa.inspect(connection).get_columns(table_name)}:
+        return
+
+    preparer = connection.dialect.identifier_preparer
+    column_ddl = sa.schema.CreateColumn(column).compile(dialect=connection.dialect)
+    connection.execute(sa.text(f"ALTER TABLE {preparer.quote(table_name)} ADD COLUMN {column_ddl}"))
+
+
+def drop_column(connection: sa.Connection, table_name: str, column_name: str) -> None:
+    # SQLite 3.35+ drops columns without indexes or constraints
+    if column_name not in {item["name"] for item in sa.inspect(connection).get_columns(table_name)}:
+        return
+
+    preparer = connection.dialect.identifier_preparer
+    connection.execute(sa.text(f"ALTER TABLE {preparer.quote(table_name)} DROP COLUMN {preparer.quote(column_name)}"))
@@ -1,24 +1,81 @@
 import datetime
-from typing import Any
+import time
+from typing import Any, List
 
 import sqlalchemy as sa
-from sqlalchemy import create_engine
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import Mapped, declarative_base, relationship, sessionmaker
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import Mapped, column_property, declarative_base, relationship, sessionmaker
 
-from settings import DB_NAME
+import metrics
+import settings
+from migrations import apply_migrations
 
 STMT_NOW_TIMESTAMP = sa.sql.func.now()  # pylint: disable=not-callable
 
-engine_lite = create_async_engine(f"sqlite+aiosqlite:///{DB_NAME}")
+# Bound to the engine by `init_db` on startup
 async_session = sessionmaker(  # noqa
-    bind=engine_lite,
     class_=AsyncSession,
     autoflush=False,
     autocommit=False,
     expire_on_commit=False,
 )
-Base = declarative_base()  # Yes, without alembic
+Base = declarative_base()  # Yes, without alembic: see `migrations`
+
+
+def set_sqlite_pragmas(dbapi_connection: Any, _connection_record: Any) -> None:
+    # WAL: readers don't block the writer and vice versa, NORMAL sync is safe with WAL and skips most fsync calls
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT:d}")
+    cursor.execute(f"PRAGMA cache_size={settings.SQLITE_CACHE_SIZE:d}")
+    cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE:d}")
+    cursor.close()
+
+
+def before_cursor_execute(connection: sa.Connection, *_) -> None:
+    connection.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+def after_cursor_execute(connection: sa.Connection, _cursor: Any, statement: str, *_) -> None:
+    started_at = connection.info["query_started_at"].pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    metrics.DB_QUERY_DURATION.labels(operation=operation).observe(time.perf_counter() - started_at)
+
+
+def handle_error(context: sa.engine.ExceptionContext) -> None:
+    # A failed statement never reaches `after_cursor_execute`
+    if context.connection is not None and context.connection.info.get("query_started_at"):
+        context.connection.info["query_started_at"].pop()
+
+
+def create_engine(database_url: str = settings.DATABASE_URL) -> AsyncEngine:
+    engine = create_async_engine(
+        database_url,
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+    )
+    if engine.dialect.name == "sqlite":
+        sa.event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
+
+    sa.event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    sa.event.listen(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+    sa.event.listen(engine.sync_engine, "handle_error", handle_error)
+
+    return engine
+
+
+async def init_db(database_url: str = settings.DATABASE_URL) -> AsyncEngine:
+    engine = create_engine(database_url)
+    await apply_migrations(engine)
+    async_session.configure(bind=engine)
+    return engine
+
+
+def utcnow() -> datetime.datetime:
+    # Naive UTC, the same as `CURRENT_TIMESTAMP` of server defaults
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
 
 
 class BaseModel:
@@ -35,7 +92,9 @@ class User(BaseModel, Base):
     __tablename__ = "user"
 
     id: Mapped[int] = sa.Column(sa.INT, primary_key=True, nullable=False, unique=True, autoincrement=True)
-    external_id: Mapped[int] = sa.Column(sa.BIGINT, nullable=False)
+    external_id: Mapped[int] = sa.Column(sa.BIGINT, nullable=False, index=True)
+    # Release notifications are coalesced into a few messages per `DIGEST_PERIOD`
+    digest_mode: Mapped[bool] = sa.Column(sa.BOOLEAN, nullable=False, server_default=sa.false())
     created_at: Mapped[datetime.datetime] = sa.Column(sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP)
     updated_at: Mapped[datetime.datetime] = sa.Column(sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP)
 
@@ -47,16 +106,69 @@ class Repository(BaseModel, Base):
     url: Mapped[str] = sa.Column(sa.VARCHAR(100), nullable=False, unique=True)
     short_name: Mapped[str] = sa.Column(sa.VARCHAR(50), nullable=False, unique=True)
     latest_tag: Mapped[str] = sa.Column(sa.VARCHAR(50), nullable=True)
+    # Adaptive polling schedule, NULL `next_check_at` means "check as soon as possible"
+    next_check_at: Mapped[datetime.datetime] = sa.Column(sa.TIMESTAMP, nullable=True, index=True)
+    check_interval: Mapped[int] = sa.Column(sa.INT, nullable=True)
+    release_interval: Mapped[int] = sa.Column(sa.INT, nullable=True)
+    last_release_at: Mapped[datetime.datetime] = sa.Column(sa.TIMESTAMP, nullable=True)
+    # GitHub API endpoint with the latest tag of the repository (releases or tags), NULL until it is known
+    tag_source: Mapped[str] = sa.Column(sa.VARCHAR(20), nullable=True)
+    tag_source_checked_at: Mapped[datetime.datetime] = sa.Column(sa.TIMESTAMP, nullable=True)
+    # Monitor instance checking the repository, the lease of a crashed instance expires and is taken over
+    lease_owner: Mapped[str] = sa.Column(sa.VARCHAR(100), nullable=True, index=True)
+    lease_expires_at: Mapped[datetime.datetime] = sa.Column(sa.TIMESTAMP, nullable=True)
+    created_at: Mapped[datetime.datetime] = sa.Column(sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP)
+    updated_at: Mapped[datetime.datetime] = sa.Column(sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP)
+
+    http_cache: Mapped[List["RepositoryHttpCache"]] = relationship("RepositoryHttpCache")
+
+
+class RepositoryHttpCache(BaseModel, Base):
+    __tablename__ = "repository_http_cache"
+    __table_args__ = (
+        sa.UniqueConstraint("repository_id", "endpoint"),
+        BaseModel.__table_args__,
+    )
+
+    id: Mapped[int] = sa.Column(sa.INT, primary_key=True, nullable=False, unique=True, autoincrement=True)
+    repository_id: Mapped[int] = sa.Column(sa.BIGINT, sa.ForeignKey("repository.id"), nullable=False)
+    endpoint: Mapped[str] = sa.Column(sa.VARCHAR(20), nullable=False)
+    etag: Mapped[str] = sa.Column(sa.VARCHAR(100), nullable=True)
+    last_modified: Mapped[str] = sa.Column(sa.VARCHAR(50), nullable=True)
+    created_at: Mapped[datetime.datetime] = sa.Column(sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP)
+    updated_at: Mapped[datetime.datetime] = sa.Column(sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP)
+
+
+class Release(BaseModel, Base):
+    """History of the releases (or tags of repositories without releases) seen by the release monitor."""
+
+    __tablename__ = "release"
+    __table_args__ = (
+        sa.UniqueConstraint("repository_id", "tag"),
+        sa.Index("ix_release_repository_id_id", "repository_id", "id"),
+        BaseModel.__table_args__,
+    )
+
+    id: Mapped[int] = sa.Column(sa.INT, primary_key=True, nullable=False, unique=True, autoincrement=True)
+    repository_id: Mapped[int] = sa.Column(sa.BIGINT, sa.ForeignKey("repository.id"), nullable=False)
+    tag: Mapped[str] = sa.Column(sa.VARCHAR(100), nullable=False)
+    url: Mapped[str] = sa.Column(sa.VARCHAR(300), nullable=True)
+    published_at: Mapped[datetime.datetime] = sa.Column(sa.TIMESTAMP, nullable=True)
+    prerelease: Mapped[bool] = sa.Column(sa.BOOLEAN, nullable=False, server_default=sa.false())
     created_at: Mapped[datetime.datetime] = sa.Column(sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP)
     updated_at: Mapped[datetime.datetime] = sa.Column(sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP)
 
 
 class UserRepository(BaseModel, Base):
     __tablename__ = "user_repository"
+    __table_args__ = (
+        sa.Index("ux_user_repository_user_id_repository_id", "user_id", "repository_id", unique=True),
+        BaseModel.__table_args__,
+    )
 
     id: Mapped[int] = sa.Column(sa.INT, primary_key=True, nullable=False, unique=True, autoincrement=True)
     user_id: Mapped[int] = sa.Column(sa.BIGINT, sa.ForeignKey("user.id"), nullable=False)
-    repository_id: Mapped[int] = sa.Column(sa.BIGINT, sa.ForeignKey("repository.id"), nullable=False)
+    repository_id: Mapped[int] = sa.Column(sa.BIGINT, sa.ForeignKey("repository.id"), nullable=False, index=True)
     created_at: Mapped[datetime.datetime] = sa.Column(sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP)
     updated_at: Mapped[datetime.datetime] = sa.Column(sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP)
 
@@ -64,4 +176,28 @@ class UserRepository(BaseModel, Base):
     repository: Mapped["Repository"] = relationship("Repository")
 
 
-Base.metadata.create_all(create_engine(f"sqlite:///{DB_NAME}"))
+class Outbox(BaseModel, Base):
+    __tablename__ = "outbox"
+
+    id: Mapped[int] = sa.Column(sa.INT, primary_key=True, nullable=False, unique=True, autoincrement=True)
+    chat_id: Mapped[int] = sa.Column(sa.BIGINT, nullable=False)
+    text: Mapped[str] = sa.Column(sa.TEXT, nullable=False)
+    parse_mode: Mapped[str] = sa.Column(sa.VARCHAR(20), nullable=True)
+    digest: Mapped[bool] = sa.Column(sa.BOOLEAN, nullable=False, server_default=sa.false())
+    claimed_at: Mapped[datetime.datetime] = sa.Column(sa.TIMESTAMP, nullable=True)
+    # Failed sending attempts, the next one is not before `available_at`
+    attempts: Mapped[int] = sa.Column(sa.INT, nullable=False, server_default="0")
+    available_at: Mapped[datetime.datetime] = sa.Column(sa.TIMESTAMP, nullable=True)
+    created_at: Mapped[datetime.datetime] = sa.Column(sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP)
+    updated_at: Mapped[datetime.datetime] = sa.Column(sa.TIMESTAMP, nullable=False, server_default=STMT_NOW_TIMESTAMP)
+
+
+# Deferred: selected by the release monitor only, see `db_helper.STMT_REPOSITORY_RECORD`
+Repository.subscribers_count = column_property(
+    sa.select(sa.func.count(UserRepository.id))  # pylint: disable=not-callable
+    .where(UserRepository.repository_id == Repository.id)
+    .correlate_except(UserRepository)
+    .scalar_subquery(),
+    deferred=True,
+    expire_on_flush=False,
+)
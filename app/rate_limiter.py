@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Async token bucket.
+
+    Tokens are refilled continuously with `rate` tokens per second up to `capacity`.
+    The budget may be re-adjusted at runtime, e.g. from the rate limit headers of an API.
+    Priority callers get the tokens in front of the waiting regular ones.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+        self._priority_waiters = 0
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    async def acquire(self, priority: bool = False) -> None:
+        if not priority:
+            async with self._lock:
+                await self._take(priority)
+            return
+
+        self._priority_waiters += 1
+        try:
+            await self._take(priority)
+        finally:
+            self._priority_waiters -= 1
+
+    async def _take(self, priority: bool) -> None:
+        while True:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                await asyncio.sleep(self._blocked_until - now)
+                continue
+
+            if not priority and self._priority_waiters:
+                # The next token goes to a priority caller
+                await asyncio.sleep(1 / self._rate)
+                continue
+
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self._tokens) / self._rate)
+
+    def set_budget(self, tokens: float, period: float) -> None:
+        """Spend no more than `tokens` evenly during the next `period` seconds."""
+        now = time.monotonic()
+        period = max(period, 1.0)
+        self._refill(now)
+        if tokens < 1:
+            # Nothing left: wait for the next window of the quota and start it with a full bucket
+            self._tokens = self._capacity
+            self._blocked_until = now + period
+            return
+
+        self._rate = tokens / period
+        self._tokens = min(self._tokens, tokens)
+        self._blocked_until = 0.0
+
+    def refund(self) -> None:
+        """Give back a token that was not spent, e.g. on a request the API didn't count."""
+        self._tokens = min(self._capacity, self._tokens + 1)
+
+    def pause(self, period: float) -> None:
+        """Hand out nothing for `period` seconds, then start over with an empty bucket instead of a burst."""
+        now = time.monotonic()
+        self._tokens = 0.0
+        self._updated_at = max(self._updated_at, now + period)
+        self._blocked_until = max(self._blocked_until, now + period)
+
+    def _refill(self, now: float) -> None:
+        # Nothing is refilled during a pause
+        if now > self._updated_at:
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+            self._updated_at = now
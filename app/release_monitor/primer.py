@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+import sqlalchemy as sa
+
+import db_helper
+from db_helper import RepositoryRecord
+from models import Repository, async_session
+from release_monitor.services.github_client import priority_requests
+from release_monitor.tag_writer import TagWriter
+
+
+class Primer:
+    """
+    Priority fetch of the repositories of new subscriptions, in front of the regular schedule.
+
+    Concurrent requests for the same repository (many users subscribing to a trending project at once) share one
+    in-flight fetch. Repositories with a known tag are left to the regular schedule.
+    """
+
+    def __init__(self, check: Callable[[RepositoryRecord], Awaitable[bool]], tag_writer: TagWriter, timeout: float):
+        self._check = check
+        self._tag_writer = tag_writer
+        self._timeout = timeout
+        self._in_flight: Dict[int, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    async def prime(self, repository_ids: Iterable[int]) -> Dict[int, Optional[str]]:
+        """Latest tags of the repositories fetched within the timeout, the slower fetches go on in background."""
+        tasks = {repository_id: self._get_task(repository_id) for repository_id in repository_ids}
+        if not tasks:
+            return {}
+
+        # A timeout doesn't cancel the fetches: they are shared with the other callers
+        await asyncio.wait(tasks.values(), timeout=self._timeout)
+        return {repository_id: task.result() if task.done() and not task.cancelled() else None for repository_id, task in tasks.items()}
+
+    async def stop(self) -> None:
+        tasks = list(self._in_flight.values())
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _get_task(self, repository_id: int) -> asyncio.Task:
+        task = self._in_flight.get(repository_id)
+        if task is None:
+            task = asyncio.create_task(self._fetch(repository_id))
+            self._in_flight[repository_id] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(repository_id, None))
+
+        return task
+
+    async def _fetch(self, repository_id: int) -> Optional[str]:
+        try:
+            return await self._fetch_latest_tag(repository_id)
+        except Exception as ex:
+            logging.exception("Unexpected exception: %r", ex, exc_info=ex)
+            return None
+
+    async def _fetch_latest_tag(self, repository_id: int) -> Optional[str]:
+        async with async_session() as db_session:
+            repositories = await db_helper.get_repository_records(db_session, [repository_id])
+
+        if not repositories or repositories[0].latest_tag is not None:
+            return repositories[0].latest_tag if repositories else None
+
+        # The context of the task: only the requests of this fetch are prioritized
+        priority_requests.set(True)
+        await self._check(repositories[0])
+        await self._tag_writer.flush()
+        logging.info("[%s] Primed", repositories[0].short_name)
+        async with async_session() as db_session:
+            return await db_session.scalar(sa.select(Repository.latest_tag).where(Repository.id == repository_id))
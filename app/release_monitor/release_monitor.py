@@ -1,62 +1,303 @@
 import asyncio
+import functools
 import logging
+import time
 from asyncio import CancelledError
+from http import HTTPStatus
+from typing import AsyncIterator, List, Optional
 
-import aiohttp
 from aiogram.enums import ParseMode
 from aiohttp.web_runner import GracefulExit
 
 import db_helper
+import metrics
 import settings
 from bot_controller import BotController
-from models import Repository, UserRepository, async_session
-from release_monitor.services import github
+from db_helper import RepositoryRecord
+from models import async_session, utcnow
+from release_monitor.primer import Primer
+from release_monitor.scheduler import Scheduler
+from release_monitor.services import github, github_graphql
+from release_monitor.services.github_client import GitHubClient
+from release_monitor.tag_writer import TagWriter
 
+GITHUB_BACKEND_GRAPHQL = "graphql"
 
-async def check_last_repository_tag(
-    http_session: aiohttp.ClientSession,
-    bot_controller: BotController,
-    repository: Repository,
-):
-    latest_tag, tag_url = await github.get_latest_tag_from_release_uri(http_session, repository.short_name)
-    if latest_tag is None and tag_url is None:
-        latest_tag, tag_url = await github.get_latest_tag_from_tag_uri(http_session, repository.short_name)
 
+def use_graphql(client: GitHubClient) -> bool:
+    """The GraphQL API has no anonymous access, the REST backend is used until a token is configured."""
+    return settings.GITHUB_BACKEND == GITHUB_BACKEND_GRAPHQL and client.has_token
+
+
+def get_http_validator(repository: RepositoryRecord, endpoint: str) -> Optional[github.HttpValidator]:
+    http_cache = repository.http_cache.get(endpoint)
+    return None if http_cache is None else github.HttpValidator(*http_cache)
+
+
+def make_new_releases(repository: RepositoryRecord, response: github.TagResponse) -> List[db_helper.NewRelease]:
+    """New releases of the response, oldest first, the ones to notify about have an answer."""
+    releases = list(response.releases)
+    if not releases and response.latest_tag not in (None, repository.latest_tag):
+        # The tags endpoint and the GraphQL backend report the latest tag only
+        releases = [github.ReleaseInfo(tag=response.latest_tag, url=response.tag_url)]
+
+    # Without the history (the first check or a gap) only the latest release is announced
+    announce_all = repository.latest_tag is not None and not response.truncated
+    new_releases = []
+    for release in releases:
+        announce = not release.prerelease and (announce_all or release.tag == response.latest_tag)
+        answer = f"<b>Release tag</b>: {release.url}" if announce else None
+        new_releases.append(db_helper.NewRelease(release.tag, release.url, release.published_at, release.prerelease, answer))
+
+    return new_releases[::-1]
+
+
+async def update_latest_tag(
+    tag_writer: TagWriter,
+    repository: RepositoryRecord,
+    response: github.TagResponse,
+    endpoint: Optional[str] = None,
+) -> bool:
+    latest_tag = response.latest_tag or repository.latest_tag
     if latest_tag is None:
         logging.error("[%s] Tag is NONE?", repository.short_name)
-        return
+        return False
 
-    if repository.latest_tag == latest_tag:
+    releases = make_new_releases(repository, response)
+    if not releases:
         logging.info("[%s] Tag %s exists", repository.short_name, latest_tag)
-        return
+        if endpoint is not None and get_http_validator(repository, endpoint) != response.validator:
+            validator = {"repository_id": repository.id, "endpoint": endpoint, **response.validator._asdict()}
+            async with async_session() as db_session:
+                await db_helper.upsert_repository_http_cache(db_session, [validator])
+                await db_session.commit()
+        return False
+
+    pending_change = tag_writer.pending_change(repository.id)
+    if pending_change is not None and pending_change.releases == tuple(releases):
+        logging.info("[%s] Tag %s is pending", repository.short_name, latest_tag)
+        return False
+
+    # The validator of a new tag is written by the tag writer together with the tag
+    etag, last_modified = response.validator if endpoint is not None else (None, None)
+    await tag_writer.add(
+        db_helper.TagChange(
+            repository_id=repository.id,
+            short_name=repository.short_name,
+            latest_tag=latest_tag,
+            releases=tuple(releases),
+            parse_mode=ParseMode.HTML,
+            endpoint=endpoint,
+            etag=etag,
+            last_modified=last_modified,
+        )
+    )
+    return True
+
+
+def should_probe_releases(repository: RepositoryRecord) -> bool:
+    """Repositories known to have no releases skip the releases endpoint, but re-check it from time to time."""
+    if repository.tag_source != github.TAGS_ENDPOINT:
+        return True
 
-    async with async_session() as db_session:
-        await db_helper.update_repository_latest_tag(db_session, repository, latest_tag)
-        answer = f"<b>Release tag</b>: {tag_url}"
-        for user in await db_session.scalars(db_helper.STMT_USER_WITH_REPOSITORIES.where(UserRepository.repository_id == repository.id)):
-            await bot_controller.send_message(user.external_id, answer, parse_mode=ParseMode.HTML)
-            logging.info("[%s] Sending to %s", repository.short_name, user.external_id)
+    checked_at = repository.tag_source_checked_at
+    return checked_at is None or utcnow() - checked_at > settings.TAG_SOURCE_REVALIDATE_PERIOD
 
 
-async def data_collector(bot_controller: BotController):
-    async with async_session() as db_session:
-        all_repositories = (await db_session.scalars(db_helper.STMT_REPOSITORY)).all()
+async def check_last_repository_tag(client: GitHubClient, tag_writer: TagWriter, repository: RepositoryRecord) -> bool:
+    tag_source = repository.tag_source
+    probe_releases = should_probe_releases(repository)
+    endpoint = github.RELEASE_ENDPOINT
+    response = github.TagResponse()
+    if probe_releases:
+        response = await github.get_releases_from_release_uri(
+            client,
+            repository.short_name,
+            get_http_validator(repository, endpoint),
+            last_seen_tag=repository.last_seen_tag or repository.latest_tag,
+            page_size=settings.RELEASES_PAGE_SIZE,
+            max_pages=settings.RELEASES_MAX_PAGES,
+        )
+        if response.status == HTTPStatus.NOT_FOUND:
+            tag_source = github.TAGS_ENDPOINT
+        elif response.status in (HTTPStatus.OK, HTTPStatus.NOT_MODIFIED):
+            tag_source = github.RELEASE_ENDPOINT
 
-    async with aiohttp.ClientSession() as http_session:
-        for repository in all_repositories:
+    if response.status not in (HTTPStatus.OK, HTTPStatus.NOT_MODIFIED):
+        endpoint = github.TAGS_ENDPOINT
+        response = await github.get_latest_tag_from_tag_uri(
+            client,
+            repository.short_name,
+            get_http_validator(repository, endpoint),
+            include=settings.TAG_INCLUDE_PATTERN,
+            exclude=settings.TAG_EXCLUDE_PATTERN,
+            max_pages=settings.TAGS_MAX_PAGES,
+        )
+
+    if tag_source != repository.tag_source or (probe_releases and tag_source == github.TAGS_ENDPOINT):
+        async with async_session() as db_session:
+            await db_helper.update_repository_tag_source(db_session, repository, tag_source)
+
+    if response.not_modified:
+        logging.info("[%s] Not modified", repository.short_name)
+        return False
+
+    return await update_latest_tag(tag_writer, repository, response, endpoint)
+
+
+async def check_repositories_rest(
+    client: GitHubClient,
+    tag_writer: TagWriter,
+    scheduler: Scheduler,
+    repositories: List[RepositoryRecord],
+):
+    for repository in repositories:
+        changed = False
+        try:
+            changed = await check_last_repository_tag(client, tag_writer, repository)
+        except Exception as ex:
+            logging.exception("[%s] Unexpected exception: %r", repository.short_name, ex, exc_info=ex)
+        finally:
+            scheduler.reschedule(repository, changed)
+
+
+async def check_repositories_graphql(
+    client: GitHubClient,
+    tag_writer: TagWriter,
+    scheduler: Scheduler,
+    repositories: List[RepositoryRecord],
+):
+    try:
+        responses = await github_graphql.get_latest_tags(
+            client,
+            [repository.short_name for repository in repositories],
+            (settings.TAG_INCLUDE_PATTERN, settings.TAG_EXCLUDE_PATTERN),
+            tags_count=settings.GITHUB_GRAPHQL_TAGS_COUNT,
+            releases_count=settings.RELEASES_PAGE_SIZE,
+            last_seen_tags={repository.short_name: repository.last_seen_tag or repository.latest_tag for repository in repositories},
+        )
+    except Exception as ex:
+        logging.exception("Unexpected exception: %r", ex, exc_info=ex)
+        responses = {}
+
+    for repository in repositories:
+        changed = False
+        try:
+            changed = await update_latest_tag(tag_writer, repository, responses.get(repository.short_name, github.TagResponse()))
+        except Exception as ex:
+            logging.exception("[%s] Unexpected exception: %r", repository.short_name, ex, exc_info=ex)
+        finally:
+            scheduler.reschedule(repository, changed)
+
+
+async def fetching_worker(
+    queue: asyncio.Queue,
+    client: GitHubClient,
+    tag_writer: TagWriter,
+    scheduler: Scheduler,
+):
+    while True:
+        repositories: List[RepositoryRecord] = await queue.get()
+        try:
+            if use_graphql(client):
+                await check_repositories_graphql(client, tag_writer, scheduler, repositories)
+            else:
+                await check_repositories_rest(client, tag_writer, scheduler, repositories)
+        except Exception as ex:
+            logging.exception("Unexpected exception: %r", ex, exc_info=ex)
+        finally:
+            queue.task_done()
+
+
+async def iter_repositories(repository_ids: List[int], chunk_size: int) -> AsyncIterator[List[RepositoryRecord]]:
+    """Subscribed repositories by chunks in the order of ids, every chunk is read by its own short session."""
+    repository_ids = sorted(repository_ids)
+    for start in range(0, len(repository_ids), chunk_size):
+        end = start + chunk_size
+        async with async_session() as db_session:
+            repositories = await db_helper.get_repository_records(db_session, repository_ids[start:end])
+
+        if repositories:
+            yield repositories
+
+
+async def data_collector(client: GitHubClient, tag_writer: TagWriter, scheduler: Scheduler, repository_ids: List[int]):
+    # The GraphQL backend fetches a whole batch of repositories per request
+    batch_size = settings.GITHUB_GRAPHQL_BATCH_SIZE if use_graphql(client) else 1
+    queue: asyncio.Queue = asyncio.Queue(maxsize=settings.FETCHING_WORKERS * 2)
+    workers = [asyncio.create_task(fetching_worker(queue, client, tag_writer, scheduler)) for _ in range(settings.FETCHING_WORKERS)]
+    started_at = time.perf_counter()
+    checked = 0
+    try:
+        # The bounded queue applies backpressure: only a few chunks are in memory at a time
+        async for repositories in iter_repositories(repository_ids, settings.FETCHING_CHUNK_SIZE):
+            checked += len(repositories)
+            for start in range(0, len(repositories), batch_size):
+                end = start + batch_size
+                await queue.put(repositories[start:end])
+
+        await queue.join()
+    finally:
+        for worker in workers:
+            worker.cancel()
+
+        await asyncio.gather(*workers, return_exceptions=True)
+        await scheduler.flush()
+        duration = time.perf_counter() - started_at
+        metrics.SWEEP_DURATION.observe(duration)
+        metrics.SWEEP_REPOSITORIES.inc(checked)
+        metrics.SWEEP_REPOSITORIES_RATE.set(checked / duration if duration else 0.0)
+
+
+async def run_release_monitor(bot_controller: BotController):
+    # Each token starts with the configured pace, then follows GitHub rate limit headers
+    client = GitHubClient(
+        tokens=settings.GITHUB_TOKENS,
+        rate=1 / settings.FETCHING_STEP_PERIOD,
+        capacity=settings.FETCHING_WORKERS,
+        connections=settings.GITHUB_CONNECTIONS,
+    )
+    tag_writer = TagWriter(settings.TAG_WRITER_BATCH_SIZE, settings.TAG_WRITER_FLUSH_PERIOD, on_flush=bot_controller.notify_outbox)
+    scheduler = Scheduler()
+    tag_writer.start()
+    heartbeat = asyncio.create_task(keep_leases(scheduler))
+    primer = Primer(functools.partial(check_last_repository_tag, client, tag_writer), tag_writer, settings.PRIMING_TIMEOUT)
+    try:
+        async with client:
+            bot_controller.set_repository_primer(primer.prime)
             try:
-                await check_last_repository_tag(http_session, bot_controller, repository)
-            except Exception as ex:
-                logging.exception("[%s] Unexpected exception: %r", repository.short_name, ex, exc_info=ex)
+                await monitor_loop(client, tag_writer, scheduler)
             finally:
-                await asyncio.sleep(settings.FETCHING_STEP_PERIOD)
+                bot_controller.set_repository_primer(None)
+                await primer.stop()
+    finally:
+        heartbeat.cancel()
+        await asyncio.gather(heartbeat, return_exceptions=True)
+        await tag_writer.stop()
+        # The buffered tags are written first: the next owner of a released repository doesn't fetch them again
+        await scheduler.release_leases()
 
 
-async def run_release_monitor(bot_controller: BotController):
+async def keep_leases(scheduler: Scheduler):
+    # A few heartbeats per lease period: a single failed one doesn't lose the leases
+    while True:
+        await asyncio.sleep(scheduler.lease_ttl.total_seconds() / 3)
+        try:
+            await scheduler.prolong_leases()
+        except Exception as ex:
+            logging.exception("Unexpected exception: %r", ex, exc_info=ex)
+
+
+async def monitor_loop(client: GitHubClient, tag_writer: TagWriter, scheduler: Scheduler):
+    logging.info("Release monitor instance %s", scheduler.owner)
     while True:
-        logging.info("Run data collector")
         try:
-            await data_collector(bot_controller)
+            await scheduler.load()
+            repository_ids = scheduler.pop_due()
+            if repository_ids:
+                logging.info("Run data collector for %s repositories", len(repository_ids))
+                await data_collector(client, tag_writer, scheduler, repository_ids)
+                logging.info("Data collector is finished")
         except (GracefulExit, KeyboardInterrupt, CancelledError):
             logging.info("Close release monitor...")
             return
@@ -65,5 +306,4 @@ async def run_release_monitor(bot_controller: BotController):
         except BaseException as ex:
             logging.critical("Critical exception: %r", ex, exc_info=ex)
 
-        logging.info("Data collector is finished")
-        await asyncio.sleep(settings.SURVEY_PERIOD)
+        await asyncio.sleep(scheduler.sleep_time())
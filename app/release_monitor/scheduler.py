@@ -0,0 +1,201 @@
+import datetime
+import heapq
+import logging
+import math
+import os
+import random
+import socket
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import sqlalchemy as sa
+
+import settings
+from db_helper import RepositoryRecord
+from models import Repository, UserRepository, async_session, utcnow
+
+# Poll a repository a few times per its usual release interval
+POLLS_PER_RELEASE_INTERVAL = 4
+# Weight of the latest sample in the moving average of release intervals
+RELEASE_INTERVAL_SMOOTHING = 0.3
+
+
+def make_lease_owner() -> str:
+    """Unique name of a monitor instance: containers often share the pid and restarted ones the hostname."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def clamp_interval(interval: float) -> float:
+    return min(max(interval, settings.SCHEDULER_MIN_INTERVAL), settings.SCHEDULER_MAX_INTERVAL)
+
+
+def next_check_interval(repository: RepositoryRecord, changed: bool, now: datetime.datetime) -> Dict[str, object]:
+    """New schedule of the repository after a check: a release resets the interval, silence backs it off."""
+    interval = repository.check_interval or settings.SURVEY_PERIOD
+    release_interval = repository.release_interval
+    last_release_at = repository.last_release_at
+    if changed:
+        if last_release_at is not None:
+            sample = (now - last_release_at).total_seconds()
+            release_interval = int(
+                sample
+                if release_interval is None
+                else RELEASE_INTERVAL_SMOOTHING * sample + (1 - RELEASE_INTERVAL_SMOOTHING) * release_interval
+            )
+
+        last_release_at = now
+        interval = settings.SCHEDULER_MIN_INTERVAL
+    else:
+        interval *= settings.SCHEDULER_BACKOFF_FACTOR
+        if release_interval:
+            interval = min(interval, release_interval / POLLS_PER_RELEASE_INTERVAL)
+
+    interval = clamp_interval(interval)
+    # Popular repositories are polled more often: x2 for 10 subscribers, x3 for 100...
+    delay = interval / (1 + math.log10(max(repository.subscribers_count or 1, 1)))
+    delay = clamp_interval(delay * random.uniform(1 - settings.SCHEDULER_JITTER, 1 + settings.SCHEDULER_JITTER))  # noqa: S311
+    return {
+        "id": repository.id,
+        "next_check_at": now + datetime.timedelta(seconds=delay),
+        "check_interval": int(interval),
+        "release_interval": release_interval,
+        "last_release_at": last_release_at,
+    }
+
+
+class Scheduler:
+    """
+    Min-heap of repositories by the next check time.
+
+    `Repository.next_check_at` is the persistent key, the heap holds only the repositories due within the next
+    `SCHEDULER_LOAD_PERIOD`, so it stays small and picks up the repositories bumped by other components on each load.
+
+    Several release monitor instances share the repositories by leases: `load` leases a batch of due repositories to
+    this instance, `prolong_leases` is called while the instance is alive and a reschedule releases the lease.
+    The leases of a crashed instance expire after `lease_ttl` seconds and are taken over by the other instances.
+    """
+
+    def __init__(
+        self,
+        owner: Optional[str] = None,
+        lease_ttl: int = settings.SCHEDULER_LEASE_TTL,
+        batch_size: int = settings.SCHEDULER_LEASE_BATCH_SIZE,
+    ):
+        self.owner = owner or make_lease_owner()
+        self.lease_ttl = datetime.timedelta(seconds=lease_ttl)
+        self._batch_size = batch_size
+        self._heap: List[Tuple[datetime.datetime, int]] = []
+        self._due_at: Dict[int, datetime.datetime] = {}
+        self._updates: List[Dict[str, object]] = []
+        # More repositories are due than a batch, the next one is leased without a pause
+        self._saturated = False
+
+    def __len__(self) -> int:
+        return len(self._due_at)
+
+    async def load(self) -> None:
+        now = utcnow()
+        horizon = now + datetime.timedelta(seconds=settings.SCHEDULER_LOAD_PERIOD)
+        # Free, expired and own leases: the own ones are read again to pick up their bumped check time
+        leasable = (
+            sa.select(Repository.id)
+            .where(
+                sa.or_(Repository.next_check_at.is_(None), Repository.next_check_at <= horizon),
+                sa.or_(Repository.lease_owner.is_(None), Repository.lease_expires_at < now, Repository.lease_owner == self.owner),
+                # Repositories without subscribers cost no API calls until somebody subscribes again
+                sa.exists().where(UserRepository.repository_id == Repository.id),
+            )
+            .order_by(Repository.next_check_at.nullsfirst())
+            .limit(self._batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        async with async_session() as session:
+            rows = (
+                await session.execute(
+                    sa.update(Repository)
+                    .where(Repository.id.in_(leasable))
+                    .values(lease_owner=self.owner, lease_expires_at=now + self.lease_ttl)
+                    .returning(Repository.id, Repository.next_check_at)
+                )
+            ).all()
+            await session.commit()
+
+        for repository_id, next_check_at in rows:
+            self.push(repository_id, next_check_at or now)
+
+        self._saturated = len(rows) >= self._batch_size and any(next_check_at is None or next_check_at <= now for _, next_check_at in rows)
+
+    def push(self, repository_id: int, due_at: datetime.datetime) -> None:
+        if self._due_at.get(repository_id) == due_at:
+            return
+
+        # The previous entry of the repository (if any) becomes stale and is skipped by `pop_due`
+        self._due_at[repository_id] = due_at
+        heapq.heappush(self._heap, (due_at, repository_id))
+
+    def pop_due(self) -> List[int]:
+        now = utcnow()
+        repository_ids: List[int] = []
+        while self._heap and self._heap[0][0] <= now:
+            due_at, repository_id = heapq.heappop(self._heap)
+            if self._due_at.get(repository_id) != due_at:
+                continue
+
+            del self._due_at[repository_id]
+            repository_ids.append(repository_id)
+
+        return repository_ids
+
+    def sleep_time(self) -> float:
+        """Seconds until the next due repository, but no longer than the next load."""
+        if self._saturated:
+            return 0.0
+
+        sleep_time = float(settings.SCHEDULER_LOAD_PERIOD)
+        if self._heap:
+            sleep_time = min(sleep_time, (self._heap[0][0] - utcnow()).total_seconds())
+
+        return max(sleep_time, 0.0)
+
+    def reschedule(self, repository: RepositoryRecord, changed: bool) -> None:
+        now = utcnow()
+        update = next_check_interval(repository, changed, now)
+        # The lease is kept for the repositories due before the next load, the other ones are released
+        update.update(lease_owner=None, lease_expires_at=None)
+        if update["next_check_at"] <= now + datetime.timedelta(seconds=settings.SCHEDULER_LOAD_PERIOD):
+            update.update(lease_owner=self.owner, lease_expires_at=now + self.lease_ttl)
+            self.push(repository.id, update["next_check_at"])
+
+        self._updates.append(update)
+
+    async def flush(self) -> None:
+        if not self._updates:
+            return
+
+        updates, self._updates = self._updates, []
+        async with async_session() as session:
+            # ORM bulk UPDATE by primary key: a single executemany, the repositories leased by another instance
+            # after an expired lease are left to it
+            await session.execute(
+                sa.update(Repository).where(Repository.lease_owner == self.owner).execution_options(synchronize_session=None),
+                updates,
+            )
+            await session.commit()
+
+        logging.info("Scheduler: %s repositories rescheduled", len(updates))
+
+    async def prolong_leases(self) -> None:
+        async with async_session() as session:
+            await session.execute(
+                sa.update(Repository).where(Repository.lease_owner == self.owner).values(lease_expires_at=utcnow() + self.lease_ttl)
+            )
+            await session.commit()
+
+    async def release_leases(self) -> None:
+        async with async_session() as session:
+            await session.execute(
+                sa.update(Repository).where(Repository.lease_owner == self.owner).values(lease_owner=None, lease_expires_at=None)
+            )
+            await session.commit()
+
+        self._heap, self._due_at = [], {}
@@ -1,61 +1,202 @@
+import datetime
 import logging
-import re
 from http import HTTPStatus
-from operator import itemgetter
-from typing import List, Optional, Tuple
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
-import aiohttp
 import orjson
 
-GITHUB_TAG_URI_PATTERN = re.compile(r"refs\/tags\/([\w\d\-\.]+)")  # noqa
-GITHUB_API_RELEASE_URL_MASK = "https://api.github.com/repos/{repo_uri}/releases/latest"
-GITHUB_API_TAGS_URL_MASK = "https://api.github.com/repos/{repo_uri}/git/refs/tags"
+import settings
+from release_monitor.services.github_client import GitHubClient
+from release_monitor.services.versions import LatestTagResolver
+
+GITHUB_API_RELEASES_URL_MASK = "{api_url}/repos/{repo_uri}/releases?per_page={per_page}"
+GITHUB_API_TAGS_URL_MASK = "{api_url}/repos/{repo_uri}/tags?per_page={per_page}"
+TAGS_PAGE_SIZE = 100
 GITHUB_API_RELEASE_TAG_MASK = "https://github.com/{repo_uri}/releases/tag/{tag}"
+# Endpoint names of the conditional requests cache
+RELEASE_ENDPOINT = "release"
+TAGS_ENDPOINT = "tags"
 
 
-async def get_latest_tag_from_release_uri(http_session: aiohttp.ClientSession, repo_uri: str) -> Tuple[Optional[str], Optional[str]]:
-    latest_tag: Optional[str] = None
-    tag_url: Optional[str] = None
-    # try to get the latest release
-    api_url = GITHUB_API_RELEASE_URL_MASK.format(repo_uri=repo_uri)
-    async with http_session.get(api_url) as response:
-        logging.info("Fetching data from %s", api_url)
-        result: dict = await response.json(loads=orjson.loads)
-        if response.status != HTTPStatus.OK:
-            logging.warning(
-                "[%s] Failed to fetch data code=%s: %s",
-                repo_uri,
-                response.status,
-                await response.text(),
-            )
-            return latest_tag, tag_url
-
-        latest_tag: str = result["tag_name"]
-        tag_url: str = result["html_url"]
-
-    return latest_tag, tag_url
-
-
-async def get_latest_tag_from_tag_uri(http_session: aiohttp.ClientSession, repo_uri: str) -> Tuple[Optional[str], Optional[str]]:
+class HttpValidator(NamedTuple):
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+class ReleaseInfo(NamedTuple):
+    tag: str
+    url: str
+    published_at: Optional[datetime.datetime] = None
+    prerelease: bool = False
+
+
+class TagResponse(NamedTuple):
     latest_tag: Optional[str] = None
     tag_url: Optional[str] = None
-    # try to get git refs with tags
-    api_url = GITHUB_API_TAGS_URL_MASK.format(repo_uri=repo_uri)
-    async with http_session.get(api_url) as response:
-        logging.info("Fetching data from %s", api_url)
-        result: List = await response.json(loads=orjson.loads)
-        if response.status != HTTPStatus.OK:
-            logging.warning(
-                "[%s] Failed to fetch data code=%s: %s",
-                repo_uri,
-                response.status,
-                await response.text(),
-            )
-            return latest_tag, tag_url
-
-        result.sort(key=itemgetter("ref"))
-        last_tag_info = result[-1]
-        latest_tag = re.findall(GITHUB_TAG_URI_PATTERN, last_tag_info["ref"])[0]
-        tag_url = GITHUB_API_RELEASE_TAG_MASK.format(repo_uri=repo_uri, tag=latest_tag)
-
-    return latest_tag, tag_url
+    validator: HttpValidator = HttpValidator()
+    not_modified: bool = False
+    status: Optional[int] = None
+    # New releases, newest first
+    releases: Tuple[ReleaseInfo, ...] = ()
+    # The history of releases has a gap: the last seen release was not found
+    truncated: bool = False
+
+
+def parse_datetime(value: Optional[str]) -> Optional[datetime.datetime]:
+    if not value:
+        return None
+
+    # Naive UTC, the same as the database timestamps
+    return datetime.datetime.fromisoformat(value).astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def make_conditional_headers(validator: Optional[HttpValidator]) -> Dict[str, str]:
+    headers = {}
+    if validator is None:
+        return headers
+
+    if validator.etag:
+        headers["If-None-Match"] = validator.etag
+    if validator.last_modified:
+        headers["If-Modified-Since"] = validator.last_modified
+
+    return headers
+
+
+async def get_releases_from_release_uri(
+    client: GitHubClient,
+    repo_uri: str,
+    validator: Optional[HttpValidator] = None,
+    *,
+    last_seen_tag: Optional[str] = None,
+    page_size: int = 10,
+    max_pages: int = 10,
+) -> TagResponse:
+    """
+    Releases newer than `last_seen_tag`: pages are fetched newest first until the first already seen release.
+
+    The latest tag is the newest new final release, `None` if there is none. A repository without final releases
+    gets the `NOT_FOUND` status, the same as from the `releases/latest` endpoint.
+    """
+    api_url = GITHUB_API_RELEASES_URL_MASK.format(api_url=settings.GITHUB_API_URL, repo_uri=repo_uri, per_page=page_size)
+    response_validator = HttpValidator()
+    releases: List[ReleaseInfo] = []
+    # Nothing to catch up with: the first page is enough
+    pages_left = max_pages if last_seen_tag else 1
+    first_page = True
+    found = False
+    while api_url is not None and not found and pages_left > 0:
+        headers = make_conditional_headers(validator) if first_page else None
+        async with client.get(api_url, headers=headers) as response:
+            logging.info("Fetching data from %s", api_url)
+            if response.status == HTTPStatus.NOT_MODIFIED:
+                return TagResponse(validator=validator, not_modified=True, status=response.status)
+
+            if response.status != HTTPStatus.OK:
+                logging.warning(
+                    "[%s] Failed to fetch data code=%s: %s",
+                    repo_uri,
+                    response.status,
+                    await response.text(),
+                )
+                return TagResponse(status=response.status)
+
+            result: List = await response.json(loads=orjson.loads)
+            if first_page:
+                # New releases always land on the first page
+                response_validator = HttpValidator(response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+            for release_info in result:
+                if release_info["tag_name"] == last_seen_tag:
+                    found = True
+                    break
+
+                releases.append(
+                    ReleaseInfo(
+                        tag=release_info["tag_name"],
+                        url=release_info["html_url"],
+                        published_at=parse_datetime(release_info.get("published_at")),
+                        prerelease=release_info.get("prerelease", False),
+                    )
+                )
+
+            next_page = response.links.get("next")
+            api_url = str(next_page["url"]) if next_page else None
+            pages_left -= 1
+            first_page = False
+
+    latest_release = next((release for release in releases if not release.prerelease), None)
+    if latest_release is None and not found:
+        logging.info("[%s] No releases", repo_uri)
+        return TagResponse(status=HTTPStatus.NOT_FOUND)
+
+    return TagResponse(
+        latest_tag=latest_release.tag if latest_release else None,
+        tag_url=latest_release.url if latest_release else None,
+        validator=response_validator,
+        status=HTTPStatus.OK,
+        releases=tuple(releases),
+        truncated=bool(last_seen_tag) and not found,
+    )
+
+
+async def get_latest_tag_from_tag_uri(
+    client: GitHubClient,
+    repo_uri: str,
+    validator: Optional[HttpValidator] = None,
+    *,
+    include: Optional[str] = None,
+    exclude: Optional[str] = None,
+    max_pages: int = 10,
+) -> TagResponse:
+    """
+    The greatest version of the tags, no more than `max_pages` pages of them.
+
+    The ETag of a page covers that page only. A list on one partly filled page keeps the validator: a new tag lands on
+    that page and changes it, an unchanged repository costs one conditional request. Longer lists are read in full.
+    """
+    resolver = LatestTagResolver(name=repo_uri.rsplit("/", 1)[-1], include=include, exclude=exclude)
+    api_url = GITHUB_API_TAGS_URL_MASK.format(api_url=settings.GITHUB_API_URL, repo_uri=repo_uri, per_page=TAGS_PAGE_SIZE)
+    response_validator = HttpValidator()
+    pages_left = max_pages
+    first_page = True
+    while api_url is not None and pages_left > 0:
+        headers = make_conditional_headers(validator) if first_page else None
+        async with client.get(api_url, headers=headers) as response:
+            logging.info("Fetching data from %s", api_url)
+            if response.status == HTTPStatus.NOT_MODIFIED:
+                return TagResponse(validator=validator, not_modified=True)
+
+            if response.status != HTTPStatus.OK:
+                logging.warning(
+                    "[%s] Failed to fetch data code=%s: %s",
+                    repo_uri,
+                    response.status,
+                    await response.text(),
+                )
+                return TagResponse()
+
+            result: List = await response.json(loads=orjson.loads)
+            for tag_info in result:
+                resolver.feed(tag_info["name"])
+
+            next_page = response.links.get("next")
+            if first_page and next_page is None and len(result) < TAGS_PAGE_SIZE:
+                response_validator = HttpValidator(response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+            api_url = str(next_page["url"]) if next_page else None
+            pages_left -= 1
+            first_page = False
+
+    if api_url is not None:
+        logging.info("[%s] Tags are limited to %s pages", repo_uri, max_pages)
+
+    latest_tag = resolver.latest_tag
+    if latest_tag is None:
+        return TagResponse()
+
+    return TagResponse(
+        latest_tag=latest_tag,
+        tag_url=GITHUB_API_RELEASE_TAG_MASK.format(repo_uri=repo_uri, tag=latest_tag),
+        validator=response_validator,
+    )
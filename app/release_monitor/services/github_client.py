@@ -0,0 +1,153 @@
+import asyncio
+import contextlib
+import contextvars
+import logging
+import time
+from http import HTTPStatus
+from typing import AsyncIterator, Dict, List, Mapping, Optional
+
+import aiohttp
+import yarl
+
+import metrics
+from rate_limiter import TokenBucket
+
+GITHUB_API_HEADERS = {
+    "Accept": "application/vnd.github+json",
+    "Accept-Encoding": "gzip",
+    "X-GitHub-Api-Version": "2022-11-28",
+    "User-Agent": "github-release-monitor-bot",
+}
+
+# Requests made by the current task go in front of the regular ones, e.g. the priming fetch of a new subscription
+priority_requests: contextvars.ContextVar[bool] = contextvars.ContextVar("priority_requests", default=False)
+
+
+def get_endpoint_label(url: str) -> str:
+    """`.../repos/{owner}/{name}/releases` -> `releases`, `.../graphql` -> `graphql`."""
+    segments = yarl.URL(url).path.strip("/").split("/")
+    if "repos" in segments:
+        index = segments.index("repos") + 3
+        return segments[index] if index < len(segments) else "repository"
+
+    return segments[-1] or "other"
+
+
+class TokenState:
+    """Quota of one GitHub token (or of the anonymous access) by the latest response headers."""
+
+    def __init__(self, token: Optional[str], rate: float, capacity: float):
+        self.token = token
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+        self.rate_limiter = TokenBucket(rate=rate, capacity=capacity)
+
+    @property
+    def name(self) -> str:
+        return f"...{self.token[-4:]}" if self.token else "anonymous"
+
+    def is_parked(self, now: float) -> bool:
+        return self.remaining == 0 and self.reset_at > now
+
+    def update(self, headers: Mapping[str, str]) -> None:
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+
+        self.remaining = int(remaining)
+        self.reset_at = float(reset)
+        self.rate_limiter.set_budget(self.remaining, self.reset_at - time.time())
+        metrics.GITHUB_RATE_LIMIT_REMAINING.labels(token=self.name).set(self.remaining)
+        if self.remaining == 0:
+            logging.warning("GitHub token %s is exhausted until %s", self.name, time.ctime(self.reset_at))
+
+
+class GitHubClient:
+    """
+    Long-lived GitHub API client: one keep-alive connection pool for all sweeps and a pool of tokens.
+
+    Each request goes to the token with the most remaining quota, exhausted tokens are parked until their reset time.
+    """
+
+    def __init__(self, tokens: List[str], rate: float, capacity: float, connections: int):
+        self._tokens = [TokenState(token, rate, capacity) for token in tokens] or [TokenState(None, rate, capacity)]
+        self._connections = connections
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "GitHubClient":
+        connector = aiohttp.TCPConnector(
+            limit=self._connections,
+            ttl_dns_cache=300,
+            keepalive_timeout=60,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers=GITHUB_API_HEADERS,
+            timeout=aiohttp.ClientTimeout(total=60),
+        )
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def has_token(self) -> bool:
+        return self._tokens[0].token is not None
+
+    @contextlib.asynccontextmanager
+    async def request(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        **kwargs,
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        token_state = await self._acquire_token()
+        headers = dict(headers or {})
+        if token_state.token:
+            headers["Authorization"] = f"Bearer {token_state.token}"
+
+        endpoint = get_endpoint_label(url)
+        started_at = time.perf_counter()
+        responded = False
+        try:
+            async with self._session.request(method, url, headers=headers, **kwargs) as response:
+                responded = True
+                metrics.GITHUB_REQUEST_DURATION.labels(endpoint=endpoint, status=str(response.status)).observe(
+                    time.perf_counter() - started_at
+                )
+                token_state.update(response.headers)
+                if response.status == HTTPStatus.NOT_MODIFIED:
+                    # Conditional requests answered by 304 don't count against the quota: neither do they against the pace
+                    token_state.rate_limiter.refund()
+
+                yield response
+        finally:
+            if not responded:
+                metrics.GITHUB_REQUEST_DURATION.labels(endpoint=endpoint, status="error").observe(time.perf_counter() - started_at)
+
+    def get(self, url: str, **kwargs) -> contextlib.AbstractAsyncContextManager:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> contextlib.AbstractAsyncContextManager:
+        return self.request("POST", url, **kwargs)
+
+    async def _acquire_token(self) -> TokenState:
+        while True:
+            now = time.time()
+            available = [token_state for token_state in self._tokens if not token_state.is_parked(now)]
+            if available:
+                # Unknown quota (no responses yet) goes first
+                token_state = max(available, key=lambda item: float("inf") if item.remaining is None else item.remaining)
+                await token_state.rate_limiter.acquire(priority=priority_requests.get())
+                return token_state
+
+            reset_at = min(token_state.reset_at for token_state in self._tokens)
+            logging.warning("All GitHub tokens are exhausted, wait %.0f seconds", reset_at - now)
+            await asyncio.sleep(max(reset_at - now, 1.0))
@@ -0,0 +1,136 @@
+import logging
+from http import HTTPStatus
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+
+import settings
+from release_monitor.services.github import GITHUB_API_RELEASE_TAG_MASK, ReleaseInfo, TagResponse, parse_datetime
+from release_monitor.services.github_client import GitHubClient
+from release_monitor.services.versions import LatestTagResolver
+
+GITHUB_GRAPHQL_REPOSITORY_FRAGMENT = """
+  r{index}: repository(owner: $owner{index}, name: $name{index}) {{
+    latestRelease {{ tagName url }}
+    releases(first: {releases_count}, orderBy: {{field: CREATED_AT, direction: DESC}}) {{
+      nodes {{ tagName url publishedAt isPrerelease }}
+    }}
+    refs(refPrefix: "refs/tags/", first: {tags_count}, orderBy: {{field: TAG_COMMIT_DATE, direction: DESC}}) {{ nodes {{ name }} }}
+  }}"""
+# Regular expressions `(include, exclude)` of the tags of repositories without releases
+TagFilter = Tuple[Optional[str], Optional[str]]
+
+
+def build_latest_tags_query(repo_uris: List[str], tags_count: int = 1, releases_count: int = 10) -> Tuple[str, Dict[str, str]]:
+    arguments: List[str] = []
+    fragments: List[str] = []
+    variables: Dict[str, str] = {}
+    for index, repo_uri in enumerate(repo_uris):
+        owner, name = repo_uri.split("/", 1)
+        arguments.append(f"$owner{index}: String!, $name{index}: String!")
+        fragments.append(GITHUB_GRAPHQL_REPOSITORY_FRAGMENT.format(index=index, tags_count=tags_count, releases_count=releases_count))
+        variables[f"owner{index}"] = owner
+        variables[f"name{index}"] = name
+
+    query = f"query({', '.join(arguments)}) {{{''.join(fragments)}\n}}"
+    return query, variables
+
+
+def parse_releases(nodes: List[dict], last_seen_tag: Optional[str]) -> Tuple[List[ReleaseInfo], bool]:
+    """Releases newer than `last_seen_tag`, newest first, and whether the last seen one was found."""
+    releases = []
+    for node in nodes:
+        if node["tagName"] == last_seen_tag:
+            return releases, True
+
+        releases.append(
+            ReleaseInfo(
+                tag=node["tagName"],
+                url=node["url"],
+                published_at=parse_datetime(node.get("publishedAt")),
+                prerelease=node.get("isPrerelease", False),
+            )
+        )
+
+    return releases, False
+
+
+def parse_repository_node(
+    repo_uri: str,
+    node: Optional[dict],
+    tag_filter: TagFilter = (None, None),
+    last_seen_tag: Optional[str] = None,
+) -> TagResponse:
+    """
+    New releases and the latest one or, without releases, the greatest version of the newest tags, the same as the REST backend.
+
+    Only the newest releases of the query are seen: more new releases than that are a gap in the history.
+    """
+    if not node:
+        return TagResponse()
+
+    releases, found = parse_releases((node.get("releases") or {}).get("nodes") or [], last_seen_tag)
+    latest_release = next((release for release in releases if not release.prerelease), None)
+    if latest_release is None and not found and node.get("latestRelease"):
+        # The newest releases are pre-releases: the latest final one is older
+        latest_release = ReleaseInfo(tag=node["latestRelease"]["tagName"], url=node["latestRelease"]["url"])
+        releases.append(latest_release)
+
+    if latest_release is not None or found:
+        return TagResponse(
+            latest_tag=latest_release.tag if latest_release else None,
+            tag_url=latest_release.url if latest_release else None,
+            status=HTTPStatus.OK,
+            releases=tuple(releases),
+            truncated=bool(last_seen_tag) and not found,
+        )
+
+    include, exclude = tag_filter
+    resolver = LatestTagResolver(name=repo_uri.rsplit("/", 1)[-1], include=include, exclude=exclude)
+    for tag_info in (node.get("refs") or {}).get("nodes") or []:
+        resolver.feed(tag_info["name"])
+
+    latest_tag = resolver.latest_tag
+    if latest_tag is None:
+        return TagResponse()
+
+    return TagResponse(latest_tag=latest_tag, tag_url=GITHUB_API_RELEASE_TAG_MASK.format(repo_uri=repo_uri, tag=latest_tag))
+
+
+async def get_latest_tags(
+    client: GitHubClient,
+    repo_uris: List[str],
+    tag_filter: TagFilter = (None, None),
+    *,
+    tags_count: int = 1,
+    releases_count: int = 10,
+    last_seen_tags: Optional[Dict[str, Optional[str]]] = None,
+) -> Dict[str, TagResponse]:
+    """
+    Latest tags of a batch of repositories, `tags_count` newest tags of each one are filtered and ordered by version.
+
+    The new releases are the ones of the `releases_count` newest releases published after `last_seen_tags[repo_uri]`.
+    """
+    query, variables = build_latest_tags_query(repo_uris, tags_count, releases_count)
+    async with client.post(
+        settings.GITHUB_GRAPHQL_URL,
+        data=orjson.dumps({"query": query, "variables": variables}),
+        headers={"Content-Type": "application/json"},
+    ) as response:
+        logging.info("Fetching data for %s repositories from %s", len(repo_uris), settings.GITHUB_GRAPHQL_URL)
+        if response.status != HTTPStatus.OK:
+            logging.warning("Failed to fetch GraphQL data code=%s: %s", response.status, await response.text())
+            return {}
+
+        result: dict = await response.json(loads=orjson.loads)
+
+    # Partial results are fine: unknown repositories come as `null` with an entry in `errors`
+    for error in result.get("errors") or []:
+        logging.warning("GraphQL error: %s", error.get("message"))
+
+    data = result.get("data") or {}
+    last_seen_tags = last_seen_tags or {}
+    return {
+        repo_uri: parse_repository_node(repo_uri, data.get(f"r{index}"), tag_filter, last_seen_tags.get(repo_uri))
+        for index, repo_uri in enumerate(repo_uris)
+    }
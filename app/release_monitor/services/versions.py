@@ -0,0 +1,93 @@
+import functools
+import re
+from typing import Optional, Tuple
+
+# Known prefix (`v`, `release-` or `<repository name>-`), dotted `X.Y[.Z]` release, optional pre/post/dev suffix and
+# build metadata. Any other tag (`nightly-29`, `build-1234`) is not a version.
+VERSION_PATTERN_TEMPLATE = r"""
+    ^(?:v|release-{name_prefix})?
+    (?P<release>\d+\.\d+(?:\.\d+)?)
+    (?:[-.]?(?P<stage>dev|alpha|a|beta|b|preview|pre|rc|c|post)[-.]?(?P<stage_number>\d*))?
+    (?:[+].*)?$
+    """
+STAGE_ORDER = {
+    "dev": 0,
+    "alpha": 1,
+    "a": 1,
+    "beta": 2,
+    "b": 2,
+    "preview": 3,
+    "pre": 3,
+    "rc": 3,
+    "c": 3,
+    None: 4,  # final release
+    "post": 5,
+}
+
+VersionKey = Tuple[int, Tuple[int, ...], int, int, str]
+
+
+@functools.lru_cache(maxsize=1024)
+def get_version_pattern(name: Optional[str] = None) -> re.Pattern:
+    """Version pattern of the tags of a repository: `<name>-` is a known prefix besides `v` and `release-`."""
+    name_prefix = f"|{re.escape(name)}-" if name else ""
+    return re.compile(VERSION_PATTERN_TEMPLATE.format(name_prefix=name_prefix), re.IGNORECASE | re.VERBOSE)
+
+
+def version_key(tag: str, name: Optional[str] = None) -> VersionKey:
+    """
+    Sort key of a tag: semver/PEP 440-like versions by their numbers, so `v10.0` > `v9.0` and `1.0rc1` < `1.0`.
+
+    Tags without a version are ordered lexically below all versions.
+    """
+    match = get_version_pattern(name).match(tag)
+    if match is None:
+        return 0, (), 0, 0, tag
+
+    release = [int(number) for number in match.group("release").split(".")]
+    while len(release) > 1 and release[-1] == 0:
+        release.pop()
+
+    stage = match.group("stage")
+    stage = stage.lower() if stage else None
+    return 1, tuple(release), STAGE_ORDER[stage], int(match.group("stage_number") or 0), tag
+
+
+def is_prerelease(key: VersionKey) -> bool:
+    return key[0] == 1 and key[2] < STAGE_ORDER[None]
+
+
+class LatestTagResolver:
+    """
+    Keeps only the running maximum of the fed tags: constant memory regardless of the tags count.
+
+    Pre-releases (`2.0.0-rc1`, `1.0b2`) are skipped like on the releases endpoint, unless there is no other version.
+    """
+
+    def __init__(self, name: Optional[str] = None, include: Optional[str] = None, exclude: Optional[str] = None):
+        self._name = name
+        self._include = re.compile(include) if include else None
+        self._exclude = re.compile(exclude) if exclude else None
+        self._latest_key: Optional[VersionKey] = None
+        self._latest_prerelease_key: Optional[VersionKey] = None
+
+    @property
+    def latest_tag(self) -> Optional[str]:
+        if self._latest_key is not None and self._latest_key[0] == 1:
+            return self._latest_key[-1]
+
+        key = self._latest_prerelease_key or self._latest_key
+        return None if key is None else key[-1]
+
+    def feed(self, tag: str) -> None:
+        if self._include is not None and not self._include.search(tag):
+            return
+        if self._exclude is not None and self._exclude.search(tag):
+            return
+
+        key = version_key(tag, self._name)
+        if is_prerelease(key):
+            if self._latest_prerelease_key is None or key > self._latest_prerelease_key:
+                self._latest_prerelease_key = key
+        elif self._latest_key is None or key > self._latest_key:
+            self._latest_key = key
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, List, Optional
+
+import db_helper
+from models import async_session
+from subscriptions_cache import subscriptions_cache
+
+
+async def write_changes(changes: List[db_helper.TagChange]) -> None:
+    async with async_session() as session:
+        await db_helper.update_repositories_latest_tags(session, changes)
+
+
+class TagWriter:
+    """
+    Write-behind buffer of the new latest tags.
+
+    Changes are written by one transaction per batch: the tags, the release history, the HTTP validators of the changed
+    repositories and the matching notifications, so a crash loses either all of them or nothing and the next check finds the release again.
+    After a failed batch the changes are written one by one and the failing ones are dropped: an unwritable change
+    (e.g. a tag longer than the column) must not block the other ones, and a dropped one is found again by the next check.
+    """
+
+    def __init__(self, batch_size: int, flush_period: float, on_flush: Optional[Callable[[], None]] = None):
+        self._batch_size = batch_size
+        self._flush_period = flush_period
+        self._on_flush = on_flush
+        # The latest change of each repository wins
+        self._changes: Dict[int, db_helper.TagChange] = {}
+        self._first_change_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._changes)
+
+    def pending_change(self, repository_id: int) -> Optional[db_helper.TagChange]:
+        return self._changes.get(repository_id)
+
+    async def add(self, change: db_helper.TagChange) -> None:
+        if not self._changes:
+            self._first_change_at = time.monotonic()
+
+        self._changes[change.repository_id] = change
+        if len(self._changes) >= self._batch_size or time.monotonic() - self._first_change_at >= self._flush_period:
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._changes:
+                return
+
+            changes, self._changes = list(self._changes.values()), {}
+            self._first_change_at = None
+            try:
+                changes = await self._write(changes)
+            except BaseException:
+                # Keep the changes for the next flush unless newer ones arrived meanwhile
+                for change in changes:
+                    self._changes.setdefault(change.repository_id, change)
+                self._first_change_at = self._first_change_at or time.monotonic()
+                raise
+
+        if not changes:
+            return
+
+        subscriptions_cache.invalidate_repositories(change.repository_id for change in changes)
+        logging.info("Tag writer: %s new tags", len(changes))
+        if self._on_flush is not None:
+            self._on_flush()
+
+    @staticmethod
+    async def _write(changes: List[db_helper.TagChange]) -> List[db_helper.TagChange]:
+        """Written changes of the batch."""
+        try:
+            await write_changes(changes)
+            return changes
+        except Exception as error:
+            logging.warning("Tag writer: failed to write %s new tags, writing one by one: %r", len(changes), error)
+
+        written = []
+        for change in changes:
+            try:
+                await write_changes([change])
+            except Exception as error:
+                logging.exception("[%s] Tag %s dropped: %r", change.short_name, change.latest_tag, error, exc_info=error)
+            else:
+                written.append(change)
+
+        return written
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._flush_period)
+            try:
+                await self.flush()
+            except Exception as error:
+                logging.exception("Unexpected error: %r", error, exc_info=error)
@@ -0,0 +1,74 @@
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, NamedTuple, Optional, Tuple
+
+import settings
+
+# `(after, before)` repository ids of a keyset page, `(None, None)` is the first page
+PageKey = Tuple[Optional[int], Optional[int]]
+
+
+class SubscriptionsPage(NamedTuple):
+    text: str
+    repository_ids: FrozenSet[int]
+    previous_before: Optional[int] = None
+    next_after: Optional[int] = None
+
+
+class SubscriptionsCache:
+    """
+    Bounded LRU cache of the rendered `/my_subscriptions` pages per user, entries expire after `ttl` seconds.
+
+    A subscription change drops all pages of the user, a new tag of a repository drops the pages of its subscribers.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, user_id: int, key: PageKey) -> Optional[SubscriptionsPage]:
+        item = self._items.get(user_id)
+        if item is None or item[1] < time.monotonic():
+            self._items.pop(user_id, None)
+            return None
+
+        self._items.move_to_end(user_id)
+        return item[0].get(key)
+
+    def put(self, user_id: int, key: PageKey, page: SubscriptionsPage) -> None:
+        if self.maxsize <= 0:
+            return
+
+        pages: Dict[PageKey, SubscriptionsPage] = {}
+        expires_at = time.monotonic() + self.ttl
+        if user_id in self._items:
+            pages, expires_at = self._items[user_id]
+
+        pages[key] = page
+        self._items[user_id] = (pages, expires_at)
+        self._items.move_to_end(user_id)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        self._items.pop(user_id, None)
+
+    def invalidate_repositories(self, repository_ids: Iterable[int]) -> None:
+        repository_ids = frozenset(repository_ids)
+        stale_user_ids = [
+            user_id
+            for user_id, (pages, _) in self._items.items()
+            if any(not repository_ids.isdisjoint(page.repository_ids) for page in pages.values())
+        ]
+        for user_id in stale_user_ids:
+            del self._items[user_id]
+
+    def clear(self) -> None:
+        self._items.clear()
+
+
+subscriptions_cache = SubscriptionsCache(maxsize=settings.SUBSCRIPTIONS_CACHE_SIZE, ttl=settings.SUBSCRIPTIONS_CACHE_TTL)
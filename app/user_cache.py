@@ -0,0 +1,61 @@
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+import sqlalchemy as sa
+
+import metrics
+import settings
+from models import User
+
+
+class CachedUser(NamedTuple):
+    id: int
+    external_id: int
+
+
+class UserCache:
+    """Bounded LRU cache of `external_id -> user identity` with entries expiring after `ttl` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, external_id: int) -> Optional[CachedUser]:
+        item = self._items.get(external_id)
+        if item is None or item[1] < time.monotonic():
+            self._items.pop(external_id, None)
+            metrics.USER_CACHE_LOOKUPS.labels(result="miss").inc()
+            return None
+
+        self._items.move_to_end(external_id)
+        metrics.USER_CACHE_LOOKUPS.labels(result="hit").inc()
+        return item[0]
+
+    def put(self, user: User) -> None:
+        if self.maxsize <= 0:
+            return
+
+        self._items[user.external_id] = (CachedUser(user.id, user.external_id), time.monotonic() + self.ttl)
+        self._items.move_to_end(user.external_id)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def invalidate(self, external_id: int) -> None:
+        self._items.pop(external_id, None)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+
+user_cache = UserCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL)
+
+
+@sa.event.listens_for(User, "after_update")
+@sa.event.listens_for(User, "after_delete")
+def _invalidate_user(_mapper, _connection, target: User) -> None:
+    user_cache.invalidate(target.external_id)
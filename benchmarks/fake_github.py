@@ -0,0 +1,220 @@
+import asyncio
+import collections
+import hashlib
+import json
+import re
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from aiohttp import web
+
+# Generated repositories are `owner/repo-{index}`
+REPOSITORY_OWNER = "benchmark"
+# Aliases `r{index}: repository(...)`, the tags count `refs(..., first: N, ...)` and the releases count
+# `releases(first: N, ...)` of the GraphQL backend queries
+GRAPHQL_ALIAS_PATTERN = re.compile(r"\br(\d+): repository\(")
+GRAPHQL_REFS_COUNT_PATTERN = re.compile(r"\brefs\([^)]*\bfirst: (\d+)")
+GRAPHQL_RELEASES_COUNT_PATTERN = re.compile(r"\breleases\([^)]*\bfirst: (\d+)")
+
+
+def repository_index(name: str) -> int:
+    return int(name.rsplit("-", 1)[-1])
+
+
+class GeneratedRepositories(NamedTuple):
+    """
+    Shape of the generated repositories: `initial_releases` releases tagged `v1.0.{number}` after `tags_count` old tags.
+
+    Every `no_releases_every`-th repository publishes tags only, every `missing_every`-th one does not exist (404).
+    """
+
+    initial_releases: int = 3
+    tags_count: int = 30
+    no_releases_every: int = 5
+    missing_every: int = 0
+
+    def is_missing(self, name: str) -> bool:
+        return bool(self.missing_every) and repository_index(name) % self.missing_every == 0
+
+    def has_releases(self, name: str) -> bool:
+        return not (self.no_releases_every and repository_index(name) % self.no_releases_every == 0)
+
+    def tag_names(self, release_count: int) -> List[str]:
+        # Old tags without a version go first, the order of the tags endpoint is not the version order
+        names = [f"nightly-{number}" for number in range(self.tags_count)]
+        names += [f"v1.0.{number}" for number in range(1, release_count + 1)]
+        return names
+
+
+class RateLimit:
+    """`limit` requests per `window` seconds, the quota is renewed at the reset time."""
+
+    def __init__(self, limit: int = 1_000_000, window: float = 3600):
+        self.limit = limit
+        self.window = window
+        self.remaining = limit
+        self.reset_at = time.time() + window
+
+    def headers(self) -> Dict[str, str]:
+        now = time.time()
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.window
+
+        return {"X-RateLimit-Remaining": str(self.remaining), "X-RateLimit-Reset": str(int(self.reset_at))}
+
+
+class FakeGitHub:
+    """
+    GitHub API double for the releases and tags endpoints of generated repositories and for the GraphQL queries of them.
+
+    Responses carry ETags (a matching `If-None-Match` gets 304) and rate limit headers: when the quota of the window
+    is spent, requests get 403 until the reset time.
+    """
+
+    def __init__(
+        self,
+        repositories: Optional[GeneratedRepositories] = None,
+        rate_limit: Optional[RateLimit] = None,
+        latency: float = 0.0,
+    ):
+        self.repositories = repositories if repositories is not None else GeneratedRepositories()
+        self.rate_limit = rate_limit if rate_limit is not None else RateLimit()
+        self.latency = latency
+        self.requests: Dict[str, int] = collections.Counter()
+        self._releases: Dict[str, int] = {}
+
+    @property
+    def total_requests(self) -> int:
+        return sum(self.requests.values())
+
+    def publish(self, names: Iterable[str]) -> None:
+        """A new release (or a new tag) of each repository."""
+        for name in names:
+            self._releases[name] = self._get_release_count(name) + 1
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/repos/{owner}/{name}/releases", self.handle_releases)
+        app.router.add_get("/repos/{owner}/{name}/tags", self.handle_tags)
+        app.router.add_post("/graphql", self.handle_graphql)
+        return app
+
+    async def handle_releases(self, request: web.Request) -> web.Response:
+        return await self._handle(request, "releases")
+
+    async def handle_tags(self, request: web.Request) -> web.Response:
+        return await self._handle(request, "tags")
+
+    async def handle_graphql(self, request: web.Request) -> web.Response:
+        """Aliased `repository` fields: `latestRelease`, the `releases` and the `refs` of tags, newest first."""
+        self.requests["graphql"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        headers = self.rate_limit.headers()
+        if self.rate_limit.remaining <= 0:
+            return web.json_response({"message": "API rate limit exceeded"}, status=403, headers=headers)
+
+        self.rate_limit.remaining -= 1
+        headers.update(self.rate_limit.headers())
+        body = await request.json()
+        variables = body.get("variables") or {}
+        refs_count = GRAPHQL_REFS_COUNT_PATTERN.search(body["query"])
+        releases_count = GRAPHQL_RELEASES_COUNT_PATTERN.search(body["query"])
+        data: Dict[str, Optional[dict]] = {}
+        errors: List[dict] = []
+        for index in GRAPHQL_ALIAS_PATTERN.findall(body["query"]):
+            name = f"{variables[f'owner{index}']}/{variables[f'name{index}']}"
+            data[f"r{index}"] = self._repository_node(
+                name, int(refs_count.group(1)) if refs_count else 1, int(releases_count.group(1)) if releases_count else 0
+            )
+            if data[f"r{index}"] is None:
+                # Unknown repositories don't fail the whole query: `null` data and an entry in `errors`
+                errors.append(
+                    {"type": "NOT_FOUND", "path": [f"r{index}"], "message": f"Could not resolve to a Repository with the name '{name}'."}
+                )
+
+        return web.json_response({"data": data, "errors": errors} if errors else {"data": data}, headers=headers)
+
+    def _get_release_count(self, name: str) -> int:
+        return self._releases.get(name, self.repositories.initial_releases)
+
+    async def _handle(self, request: web.Request, endpoint: str) -> web.Response:
+        self.requests[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        headers = self.rate_limit.headers()
+        if self.rate_limit.remaining <= 0:
+            return web.json_response({"message": "API rate limit exceeded"}, status=403, headers=headers)
+
+        name = f"{request.match_info['owner']}/{request.match_info['name']}"
+        if self.repositories.is_missing(name):
+            self.rate_limit.remaining -= 1
+            return web.json_response({"message": "Not Found"}, status=404, headers=self.rate_limit.headers())
+
+        release_count = self._get_release_count(name)
+        page = int(request.query.get("page", 1))
+        per_page = int(request.query.get("per_page", 30))
+        has_releases = self.repositories.has_releases(name)
+        if endpoint == "releases":
+            items = self._releases_page(name, release_count if has_releases else 0, page, per_page)
+            total = release_count if has_releases else 0
+        else:
+            items = self._tags_page(release_count, page, per_page)
+            total = release_count + self.repositories.tags_count
+
+        # Like GitHub: the ETag of a page is a digest of its own body
+        etag = f'W/"{hashlib.sha256(json.dumps(items).encode()).hexdigest()}"'
+        headers["ETag"] = etag
+        if request.headers.get("If-None-Match") == etag:
+            # Conditional requests answered by 304 don't count against the quota
+            return web.Response(status=304, headers=headers)
+
+        self.rate_limit.remaining -= 1
+        headers.update(self.rate_limit.headers())
+        if page * per_page < total:
+            next_url = request.url.update_query(page=page + 1)
+            headers["Link"] = f'<{next_url}>; rel="next"'
+
+        return web.json_response(items, headers=headers)
+
+    @staticmethod
+    def _releases_page(name: str, release_count: int, page: int, per_page: int) -> List[dict]:
+        numbers = range(release_count - (page - 1) * per_page, max(release_count - page * per_page, 0), -1)
+        return [
+            {
+                "tag_name": f"v1.0.{number}",
+                "html_url": f"https://github.com/{name}/releases/tag/v1.0.{number}",
+                "published_at": "2024-01-01T00:00:00Z",
+                "prerelease": False,
+            }
+            for number in numbers
+        ]
+
+    def _tags_page(self, release_count: int, page: int, per_page: int) -> List[dict]:
+        start, end = (page - 1) * per_page, page * per_page
+        return [{"name": name} for name in self.repositories.tag_names(release_count)[start:end]]
+
+    def _repository_node(self, name: str, refs_count: int, releases_count: int) -> Optional[dict]:
+        if self.repositories.is_missing(name):
+            return None
+
+        release_count = self._get_release_count(name) if self.repositories.has_releases(name) else 0
+        latest_release = None
+        if release_count:
+            latest_release = {"tagName": f"v1.0.{release_count}", "url": f"https://github.com/{name}/releases/tag/v1.0.{release_count}"}
+
+        releases = [
+            {
+                "tagName": release["tag_name"],
+                "url": release["html_url"],
+                "publishedAt": release["published_at"],
+                "isPrerelease": release["prerelease"],
+            }
+            for release in self._releases_page(name, release_count, 1, releases_count)
+        ]
+        # By the commit date, newest first
+        tags = self.repositories.tag_names(self._get_release_count(name))[::-1][:refs_count]
+        return {"latestRelease": latest_release, "releases": {"nodes": releases}, "refs": {"nodes": [{"name": tag} for tag in tags]}}
@@ -0,0 +1,131 @@
+import asyncio
+import collections
+import math
+import time
+from typing import Deque, Dict, List, Tuple
+
+from aiohttp import web
+
+
+class FloodLimits:
+    """No more than `rate` messages per second overall and one message per `chat_period` seconds to the same chat."""
+
+    def __init__(self, rate: float, chat_period: float):
+        self.rate = rate
+        self.chat_period = chat_period
+        self._sent_at: Deque[float] = collections.deque()
+        self._chat_sent_at: Dict[str, float] = {}
+
+    def get_retry_after(self, chat_id: str, now: float) -> int:
+        """Seconds to wait before sending to the chat, 0 counts the message as sent."""
+        while self._sent_at and self._sent_at[0] <= now - 1:
+            self._sent_at.popleft()
+
+        if len(self._sent_at) >= self.rate:
+            return math.ceil(self._sent_at[0] + 1 - now)
+
+        chat_sent_at = self._chat_sent_at.get(chat_id)
+        if chat_sent_at is not None and now - chat_sent_at < self.chat_period:
+            return math.ceil(chat_sent_at + self.chat_period - now)
+
+        self._sent_at.append(now)
+        self._chat_sent_at[chat_id] = now
+        return 0
+
+
+class FakeTelegram:
+    """
+    Telegram Bot API double: records the sent `(chat_id, text)` and enforces the flood limits on `sendMessage`.
+
+    The requests over the `FloodLimits` get 429 with `retry_after` like the real API. `editMessageText` updates a recorded
+    message and fails like the real API when the text is the same, `answerCallbackQuery` records the callback query id.
+    `chat_errors` are the `(error_code, description)` answers to every message to a chat, e.g. of a blocked bot.
+    """
+
+    def __init__(self, rate: float = 30, chat_period: float = 1.0, latency: float = 0.0):
+        self.limits = FloodLimits(rate, chat_period)
+        self.latency = latency
+        self.flood_errors = 0
+        # The message id is the position in the list plus one
+        self.messages: List[Tuple[int, str]] = []
+        self.answered_callbacks: List[str] = []
+        self.chat_errors: Dict[int, Tuple[int, str]] = {}
+
+    @property
+    def sent(self) -> int:
+        return len(self.messages)
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        method = request.match_info["method"]
+        if method == "getMe":
+            return web.json_response(
+                {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "benchmark", "username": "benchmark_bot"}}
+            )
+
+        data = await request.post()
+        if method == "editMessageText":
+            return self._edit_message(int(data["chat_id"]), int(data["message_id"]), data.get("text", ""))
+
+        if method == "answerCallbackQuery":
+            self.answered_callbacks.append(data["callback_query_id"])
+
+        if method != "sendMessage":
+            return web.json_response({"ok": True, "result": True})
+
+        chat_id = str(data["chat_id"])
+        if int(chat_id) in self.chat_errors:
+            error_code, description = self.chat_errors[int(chat_id)]
+            return web.json_response({"ok": False, "error_code": error_code, "description": description}, status=error_code)
+
+        retry_after = self.limits.get_retry_after(chat_id, time.monotonic())
+        if retry_after:
+            self.flood_errors += 1
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                },
+                status=429,
+            )
+
+        self.messages.append((int(chat_id), data.get("text", "")))
+        return self._message_response(len(self.messages))
+
+    def _edit_message(self, chat_id: int, message_id: int, text: str) -> web.Response:
+        if self.messages[message_id - 1] == (chat_id, text):
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 400,
+                    "description": "Bad Request: message is not modified: specified new message content and reply markup are "
+                    "exactly the same as a current content and reply markup of the message",
+                },
+                status=400,
+            )
+
+        self.messages[message_id - 1] = (chat_id, text)
+        return self._message_response(message_id)
+
+    def _message_response(self, message_id: int) -> web.Response:
+        chat_id, text = self.messages[message_id - 1]
+        return web.json_response(
+            {
+                "ok": True,
+                "result": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "text": text,
+                },
+            }
+        )
@@ -0,0 +1,292 @@
+import argparse
+import asyncio
+import contextlib
+import datetime
+import logging
+import random
+import resource
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import sqlalchemy as sa
+from aiogram import types
+from aiogram.exceptions import TelegramRetryAfter
+from aiohttp import ClientSession, web
+
+import metrics
+import settings
+from bot_controller import BotController
+from bot_controller.bot_controller import BOT_MODE_WEBHOOK
+from models import Outbox, Repository, User, UserRepository, async_session, init_db
+from rate_limiter import TokenBucket
+from release_monitor.release_monitor import data_collector
+from release_monitor.scheduler import Scheduler
+from release_monitor.services.github_client import GitHubClient
+from release_monitor.tag_writer import TagWriter
+
+from .fake_github import REPOSITORY_OWNER, FakeGitHub, GeneratedRepositories, RateLimit
+from .fake_telegram import FakeTelegram
+
+BOT_TOKEN = "123456:benchmark"
+WEBHOOK_SECRET = "benchmark"
+BOT_COMMANDS = ["/start", "/my_subscriptions", "/subscribe {url}", "/unsubscribe {url}"]
+
+
+async def start_server(app: web.Application, port: int = 0) -> Tuple[web.AppRunner, str]:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+def repository_url(index: int) -> str:
+    return f"https://github.com/{REPOSITORY_OWNER}/repo-{index}"
+
+
+async def seed(repositories: int, users: int, subscriptions: int, rng: random.Random) -> List[int]:
+    async with async_session() as session:
+        await session.execute(
+            sa.insert(Repository),
+            [{"url": repository_url(index), "short_name": f"{REPOSITORY_OWNER}/repo-{index}"} for index in range(1, repositories + 1)],
+        )
+        await session.execute(sa.insert(User), [{"external_id": external_id} for external_id in range(1, users + 1)])
+        await session.execute(
+            sa.insert(UserRepository),
+            [
+                {"user_id": user_id, "repository_id": repository_id}
+                for user_id in range(1, users + 1)
+                for repository_id in rng.sample(range(1, repositories + 1), min(subscriptions, repositories))
+            ],
+        )
+        await session.commit()
+        return list((await session.scalars(sa.select(Repository.id))).all())
+
+
+def make_update(update_id: int, user_id: int, text: str) -> types.Update:
+    user = types.User(id=user_id, is_bot=False, first_name=f"user-{user_id}")
+    message = types.Message(
+        message_id=update_id,
+        date=datetime.datetime.now(datetime.timezone.utc),
+        chat=types.Chat(id=user_id, type="private"),
+        from_user=user,
+        text=text,
+    )
+    return types.Update(update_id=update_id, message=message)
+
+
+async def run_instance(client: GitHubClient, tag_writer: TagWriter, scheduler: Scheduler) -> None:
+    """One release monitor instance: leases and checks batches of repositories until none is due."""
+    while True:
+        await scheduler.load()
+        repository_ids = scheduler.pop_due()
+        if not repository_ids:
+            return
+
+        await data_collector(client, tag_writer, scheduler, repository_ids)
+        await tag_writer.flush()
+
+
+async def run_sweeps(
+    options: argparse.Namespace,
+    fake_github: FakeGitHub,
+    tag_writers: List[TagWriter],
+    repository_ids: List[int],
+    rng: random.Random,
+) -> Dict[str, float]:
+    # Every instance has its own GitHub client and leases, as separate processes would
+    clients = [
+        GitHubClient(
+            tokens=["benchmark"], rate=options.github_rate, capacity=settings.FETCHING_WORKERS, connections=settings.GITHUB_CONNECTIONS
+        )
+        for _ in tag_writers
+    ]
+    schedulers = [Scheduler(batch_size=options.lease_batch_size) for _ in tag_writers]
+    sweep_times: List[float] = []
+    db_count, db_time = metrics.get_summary(metrics.DB_QUERY_DURATION)
+    async with contextlib.AsyncExitStack() as stack:
+        for client in clients:
+            await stack.enter_async_context(client)
+
+        for sweep in range(options.sweeps):
+            if sweep:
+                published = rng.sample(range(1, options.repositories + 1), int(options.repositories * options.publish_ratio))
+                fake_github.publish(f"{REPOSITORY_OWNER}/repo-{index}" for index in published)
+
+            # Every repository is due on every sweep, the adaptive schedule is not a part of the measurement
+            async with async_session() as session:
+                await session.execute(sa.update(Repository).values(next_check_at=None))
+                await session.commit()
+
+            started_at = time.perf_counter()
+            await asyncio.gather(*map(run_instance, clients, tag_writers, schedulers))
+            sweep_times.append(time.perf_counter() - started_at)
+            logging.info("Sweep %s: %.2f seconds", sweep + 1, sweep_times[-1])
+
+    db_count_after, db_time_after = metrics.get_summary(metrics.DB_QUERY_DURATION)
+    return {
+        "sweep time, first (s)": sweep_times[0],
+        "sweep time, next average (s)": sum(sweep_times[1:]) / max(len(sweep_times) - 1, 1),
+        "repositories per second": len(repository_ids) * len(sweep_times) / sum(sweep_times),
+        "github requests per repository": fake_github.total_requests / (len(repository_ids) * len(sweep_times)),
+        "db statements per sweep": (db_count_after - db_count) / len(sweep_times),
+        "db time per sweep (s)": (db_time_after - db_time) / len(sweep_times),
+    }
+
+
+async def run_notifications(bot_controller: BotController, fake_telegram: FakeTelegram, timeout: float) -> Dict[str, float]:
+    async with async_session() as session:
+        queued = await session.scalar(sa.select(sa.func.count(Outbox.id)))  # pylint: disable=not-callable
+
+    started_at = time.perf_counter()
+    bot_controller.start_workers()
+    bot_controller.notify_outbox()
+    left = queued
+    while left and time.perf_counter() - started_at < timeout:
+        await asyncio.sleep(0.2)
+        async with async_session() as session:
+            left = await session.scalar(sa.select(sa.func.count(Outbox.id)))  # pylint: disable=not-callable
+
+    elapsed = time.perf_counter() - started_at
+    await bot_controller.stop_workers()
+    return {
+        "notifications queued": queued,
+        "notifications sent": fake_telegram.sent,
+        "notifications left (timeout)": left,
+        "notifications per second": fake_telegram.sent / elapsed if elapsed else 0.0,
+        "telegram flood errors": fake_telegram.flood_errors,
+    }
+
+
+async def post_update(session: ClientSession, webhook_url: str, update: types.Update) -> None:
+    headers = {"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET, "Content-Type": "application/json"}
+    async with session.post(webhook_url, data=update.model_dump_json(exclude_none=True), headers=headers) as response:
+        response.raise_for_status()
+
+
+async def run_handlers(
+    options: argparse.Namespace,
+    bot_controller: BotController,
+    fake_telegram: FakeTelegram,
+    rng: random.Random,
+    webhook_url: Optional[str] = None,
+) -> Dict[str, float]:
+    # Replies obey the Telegram limits too: one update per user, at the global rate
+    rate_limiter = TokenBucket(rate=settings.NOTIFICATION_RATE_LIMIT, capacity=1)
+    count_before, time_before = metrics.get_summary(metrics.COMMAND_DURATION)
+    flood_errors_before = fake_telegram.flood_errors
+    users = rng.sample(range(1, options.users + 1), min(options.handler_updates, options.users))
+    # Let the chat windows of the notifications expire
+    await asyncio.sleep(options.telegram_chat_period)
+    async with ClientSession() as session:
+        for update_id, user_id in enumerate(users, start=1):
+            command = rng.choice(BOT_COMMANDS).format(url=repository_url(rng.randint(1, options.repositories)))
+            update = make_update(update_id, user_id, command)
+            await rate_limiter.acquire()
+            if webhook_url is not None:
+                await post_update(session, webhook_url, update)
+                continue
+
+            with contextlib.suppress(TelegramRetryAfter):
+                await bot_controller.feed_update(update)
+
+    # The webhook answers at once and handles the updates in background
+    started_at = time.perf_counter()
+    while (
+        metrics.get_summary(metrics.COMMAND_DURATION)[0] - count_before < len(users)
+        and time.perf_counter() - started_at < options.notification_timeout
+    ):
+        await asyncio.sleep(0.1)
+
+    count, total = metrics.get_summary(metrics.COMMAND_DURATION)
+    handled = count - count_before
+    return {
+        "handler updates": handled,
+        "handler latency, average (ms)": (total - time_before) / handled * 1000 if handled else 0.0,
+        "handler reply flood errors": fake_telegram.flood_errors - flood_errors_before,
+    }
+
+
+async def run(options: argparse.Namespace) -> Dict[str, float]:
+    rng = random.Random(options.seed)
+    fake_github = FakeGitHub(
+        GeneratedRepositories(tags_count=options.tags, no_releases_every=options.no_releases_every, missing_every=options.missing_every),
+        RateLimit(options.github_rate_limit),
+        latency=options.github_latency,
+    )
+    fake_telegram = FakeTelegram(rate=options.telegram_rate, chat_period=options.telegram_chat_period)
+    github_runner, settings.GITHUB_API_URL = await start_server(fake_github.make_app())
+    telegram_runner, settings.TELEGRAM_API_URL = await start_server(fake_telegram.make_app())
+    settings.GITHUB_BACKEND = "rest"
+    settings.WEBHOOK_SECRET = WEBHOOK_SECRET
+
+    report: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        engine = await init_db(f"sqlite+aiosqlite:///{directory}/benchmark.sqlite3")
+        bot_controller = BotController(BOT_TOKEN)
+        webhook_runner = await bot_controller.start_webhook("127.0.0.1", 0) if options.bot_mode == BOT_MODE_WEBHOOK else None
+        try:
+            started_at = time.perf_counter()
+            repository_ids = await seed(options.repositories, options.users, options.subscriptions, rng)
+            report["seed time (s)"] = time.perf_counter() - started_at
+
+            tag_writers = [
+                TagWriter(settings.TAG_WRITER_BATCH_SIZE, settings.TAG_WRITER_FLUSH_PERIOD, on_flush=bot_controller.notify_outbox)
+                for _ in range(options.instances)
+            ]
+            report.update(await run_sweeps(options, fake_github, tag_writers, repository_ids, rng))
+            report.update(await run_notifications(bot_controller, fake_telegram, options.notification_timeout))
+            webhook_url = None
+            if webhook_runner is not None:
+                host, port = webhook_runner.addresses[0][:2]
+                webhook_url = f"http://{host}:{port}{settings.WEBHOOK_PATH}"
+            report.update(await run_handlers(options, bot_controller, fake_telegram, rng, webhook_url))
+        finally:
+            if webhook_runner is not None:
+                await webhook_runner.cleanup()
+            await bot_controller.close()
+            await engine.dispose()
+            await github_runner.cleanup()
+            await telegram_runner.cleanup()
+
+    # Kilobytes on Linux
+    report["peak rss (MiB)"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return report
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Release monitor benchmark against local fake GitHub and Telegram servers")
+    parser.add_argument("--repositories", type=int, default=1000, help="number of repositories")
+    parser.add_argument("--users", type=int, default=200, help="number of users")
+    parser.add_argument("--subscriptions", type=int, default=20, help="subscriptions per user")
+    parser.add_argument("--sweeps", type=int, default=3, help="number of sweeps over all repositories")
+    parser.add_argument("--instances", type=int, default=1, help="release monitor instances sharing the repositories by leases")
+    parser.add_argument("--lease-batch-size", type=int, default=100, help="repositories leased by an instance at a time")
+    parser.add_argument("--publish-ratio", type=float, default=0.05, help="share of repositories with a new release per sweep")
+    parser.add_argument("--tags", type=int, default=30, help="tags of every repository without releases")
+    parser.add_argument("--no-releases-every", type=int, default=5, help="every N-th repository has tags only")
+    parser.add_argument("--missing-every", type=int, default=0, help="every N-th repository does not exist (404)")
+    parser.add_argument("--github-latency", type=float, default=0.02, help="latency of the fake GitHub API, seconds")
+    parser.add_argument("--github-rate-limit", type=int, default=1_000_000, help="GitHub requests per hour")
+    parser.add_argument("--github-rate", type=float, default=1000, help="initial GitHub requests per second of the client")
+    parser.add_argument("--telegram-rate", type=float, default=30, help="Telegram messages per second")
+    parser.add_argument("--telegram-chat-period", type=float, default=1.0, help="seconds between messages to one chat")
+    parser.add_argument("--notification-timeout", type=float, default=120, help="max seconds to drain the outbox")
+    parser.add_argument(
+        "--bot-mode", choices=["polling", BOT_MODE_WEBHOOK], default="polling", help="feed the updates directly or post them to the webhook"
+    )
+    parser.add_argument("--handler-updates", type=int, default=100, help="number of bot commands to handle")
+    parser.add_argument("--seed", type=int, default=42, help="random seed")
+    parser.add_argument("--verbose", action="store_true", help="show the application logs")
+    return parser.parse_args()
+
+
+def main() -> None:
+    options = parse_args()
+    logging.basicConfig(level=logging.INFO if options.verbose else logging.ERROR, format="%(levelname)9s | %(message)s")
+    report = asyncio.run(run(options))
+    width = max(map(len, report))
+    for name, value in report.items():
+        print(f"{name:<{width}}  {value:>12.2f}" if isinstance(value, float) else f"{name:<{width}}  {value:>12}")
@@ -0,0 +1,103 @@
+import asyncio
+import contextlib
+import socket
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, Sequence
+
+import pytest
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+import settings
+from benchmarks.fake_github import FakeGitHub
+from benchmarks.fake_telegram import FakeTelegram
+from benchmarks.harness import BOT_TOKEN, start_server
+from bot_controller import BotController
+from models import init_db
+from release_monitor.services.github_client import GitHubClient
+from subscriptions_cache import subscriptions_cache
+from user_cache import user_cache
+
+
+@pytest.fixture
+def run_with_db(tmp_path) -> Callable[[Callable[[], Awaitable[Any]]], Any]:
+    """Runs a coroutine function in a new event loop against a fresh SQLite database and empty caches."""
+
+    def run(scenario: Callable[[], Awaitable[Any]]) -> Any:
+        async def main() -> Any:
+            engine = await init_db(f"sqlite+aiosqlite:///{tmp_path}/test.sqlite3")
+            user_cache.clear()
+            subscriptions_cache.clear()
+            try:
+                return await scenario()
+            finally:
+                await engine.dispose()
+
+        return asyncio.run(main())
+
+    return run
+
+
+@pytest.fixture
+def serve_github(monkeypatch) -> Callable[..., contextlib.AbstractAsyncContextManager]:
+    """Serves a fake GitHub, points the API urls to it and yields a client of it."""
+
+    @contextlib.asynccontextmanager
+    async def serve(fake_github: FakeGitHub, tokens: Sequence[str] = ("test",), rate: float = 1000) -> AsyncIterator[GitHubClient]:
+        runner, url = await start_server(fake_github.make_app())
+        monkeypatch.setattr(settings, "GITHUB_API_URL", url)
+        monkeypatch.setattr(settings, "GITHUB_GRAPHQL_URL", f"{url}/graphql")
+        try:
+            async with GitHubClient(tokens=list(tokens), rate=rate, capacity=min(rate, 100), connections=10) as client:
+                yield client
+        finally:
+            await runner.cleanup()
+
+    return serve
+
+
+@pytest.fixture(name="telegram_api_port", scope="session")
+def fixture_telegram_api_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def bot_controller(telegram_api_port) -> Iterator[BotController]:
+    """One controller for all the tests: the routers of the services are attached to a single dispatcher."""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(settings, "TELEGRAM_API_URL", f"http://127.0.0.1:{telegram_api_port}")
+        yield BotController(BOT_TOKEN)
+
+
+@pytest.fixture
+def serve_telegram(telegram_api_port) -> Callable[[FakeTelegram], contextlib.AbstractAsyncContextManager]:
+    """Serves a fake Telegram at the API url of the `bot_controller`."""
+
+    @contextlib.asynccontextmanager
+    async def serve(fake_telegram: FakeTelegram) -> AsyncIterator[None]:
+        runner, _ = await start_server(fake_telegram.make_app(), telegram_api_port)
+        try:
+            yield
+        finally:
+            await runner.cleanup()
+
+    return serve
+
+
+@pytest.fixture
+def serve_bot() -> Callable[[FakeTelegram], contextlib.AbstractAsyncContextManager]:
+    """Serves a fake Telegram and yields a bot of it."""
+
+    @contextlib.asynccontextmanager
+    async def serve(fake_telegram: FakeTelegram) -> AsyncIterator[Bot]:
+        runner, url = await start_server(fake_telegram.make_app())
+        bot = Bot(token=BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(url)))
+        try:
+            yield bot
+        finally:
+            await bot.session.close()
+            await runner.cleanup()
+
+    return serve
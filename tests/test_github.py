@@ -0,0 +1,60 @@
+import asyncio
+
+from benchmarks.fake_github import REPOSITORY_OWNER, FakeGitHub, GeneratedRepositories
+from release_monitor.services.github import HttpValidator, get_latest_tag_from_tag_uri
+
+REPOSITORY = f"{REPOSITORY_OWNER}/repo-1"
+
+
+def test_tags_page_limit(serve_github):
+    # 250 tags without a version first, then `v1.0.1`...`v1.0.3`: 3 pages of 100 tags
+    fake_github = FakeGitHub(GeneratedRepositories(initial_releases=3, tags_count=250))
+
+    async def scenario():
+        async with serve_github(fake_github) as client:
+            limited = await get_latest_tag_from_tag_uri(client, REPOSITORY, max_pages=2)
+            complete = await get_latest_tag_from_tag_uri(client, REPOSITORY, max_pages=10)
+        return limited, complete
+
+    limited, complete = asyncio.run(scenario())
+    assert limited.latest_tag == "nightly-99"
+    assert complete.latest_tag == "v1.0.3"
+    assert fake_github.requests == {"tags": 5}
+
+
+def test_tags_validator_of_long_list(serve_github):
+    """A new tag lands on the last page: the unchanged first page says nothing about the list."""
+    fake_github = FakeGitHub(GeneratedRepositories(initial_releases=3, tags_count=250))
+
+    async def scenario():
+        async with serve_github(fake_github) as client:
+            first = await get_latest_tag_from_tag_uri(client, REPOSITORY)
+            fake_github.publish([REPOSITORY])
+            changed = await get_latest_tag_from_tag_uri(client, REPOSITORY, first.validator)
+        return first, changed
+
+    first, changed = asyncio.run(scenario())
+    assert first.latest_tag == "v1.0.3"
+    assert first.validator == HttpValidator()
+    assert changed.latest_tag == "v1.0.4"
+    assert fake_github.requests == {"tags": 6}
+
+
+def test_tags_validator_of_short_list(serve_github):
+    fake_github = FakeGitHub(GeneratedRepositories(initial_releases=3, tags_count=5))
+
+    async def scenario():
+        async with serve_github(fake_github) as client:
+            first = await get_latest_tag_from_tag_uri(client, REPOSITORY)
+            unchanged = await get_latest_tag_from_tag_uri(client, REPOSITORY, first.validator)
+            fake_github.publish([REPOSITORY])
+            changed = await get_latest_tag_from_tag_uri(client, REPOSITORY, first.validator)
+        return first, unchanged, changed
+
+    first, unchanged, changed = asyncio.run(scenario())
+    assert first.latest_tag == "v1.0.3"
+    assert first.validator.etag
+    assert unchanged.not_modified
+    assert changed.latest_tag == "v1.0.4"
+    assert changed.validator not in (HttpValidator(), first.validator)
+    assert fake_github.requests == {"tags": 3}
@@ -0,0 +1,24 @@
+import asyncio
+import time
+
+from benchmarks.fake_github import REPOSITORY_OWNER, FakeGitHub, RateLimit
+from release_monitor.services.github import get_releases_from_release_uri
+
+REPOSITORY = f"{REPOSITORY_OWNER}/repo-1"
+
+
+def test_not_modified_is_not_paced(serve_github):
+    """The pace follows the quota (20 requests per 10 seconds here), 304 responses cost none of it."""
+    fake_github = FakeGitHub(rate_limit=RateLimit(20, window=10))
+
+    async def scenario() -> float:
+        async with serve_github(fake_github, rate=2) as client:
+            first = await get_releases_from_release_uri(client, REPOSITORY)
+            started_at = time.monotonic()
+            for _ in range(10):
+                assert (await get_releases_from_release_uri(client, REPOSITORY, first.validator)).not_modified
+
+            return time.monotonic() - started_at
+
+    assert asyncio.run(scenario()) < 1.0
+    assert fake_github.rate_limit.remaining == 19
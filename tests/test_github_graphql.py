@@ -0,0 +1,209 @@
+import asyncio
+import datetime
+import logging
+import random
+from http import HTTPStatus
+
+import pytest
+import sqlalchemy as sa
+
+import settings
+from benchmarks.fake_github import REPOSITORY_OWNER, FakeGitHub, GeneratedRepositories, RateLimit
+from benchmarks.harness import run_instance, seed
+from models import Outbox, Release, Repository, async_session, utcnow
+from release_monitor.release_monitor import GITHUB_BACKEND_GRAPHQL
+from release_monitor.scheduler import Scheduler
+from release_monitor.services.github import ReleaseInfo, TagResponse
+from release_monitor.services.github_graphql import build_latest_tags_query, get_latest_tags, parse_repository_node
+from release_monitor.tag_writer import TagWriter
+
+
+def repository_name(index: int) -> str:
+    return f"{REPOSITORY_OWNER}/repo-{index}"
+
+
+def test_build_latest_tags_query():
+    query, variables = build_latest_tags_query(["owner/first", "other/second"])
+
+    assert query.startswith("query($owner0: String!, $name0: String!, $owner1: String!, $name1: String!) {")
+    assert "r0: repository(owner: $owner0, name: $name0)" in query
+    assert "r1: repository(owner: $owner1, name: $name1)" in query
+    assert variables == {"owner0": "owner", "name0": "first", "owner1": "other", "name1": "second"}
+
+
+@pytest.mark.parametrize("node", [None, {}, {"latestRelease": None, "refs": None}, {"latestRelease": None, "refs": {"nodes": []}}])
+def test_parse_empty_repository_node(node):
+    assert parse_repository_node("owner/name", node) == TagResponse()
+
+
+def release_node(tag: str, prerelease: bool = False) -> dict:
+    return {"tagName": tag, "url": f"https://github.com/owner/name/releases/tag/{tag}", "publishedAt": None, "isPrerelease": prerelease}
+
+
+def release_info(tag: str, prerelease: bool = False) -> ReleaseInfo:
+    return ReleaseInfo(tag, f"https://github.com/owner/name/releases/tag/{tag}", prerelease=prerelease)
+
+
+def test_parse_repository_node():
+    release = {"latestRelease": release_node("v2.0"), "releases": {"nodes": [release_node("v2.0")]}, "refs": None}
+    tag = {"latestRelease": None, "refs": {"nodes": [{"name": "v1.0"}]}}
+
+    assert parse_repository_node("owner/name", release) == TagResponse(
+        "v2.0", "https://github.com/owner/name/releases/tag/v2.0", status=HTTPStatus.OK, releases=(release_info("v2.0"),)
+    )
+    assert parse_repository_node("owner/name", tag) == TagResponse("v1.0", "https://github.com/owner/name/releases/tag/v1.0")
+
+
+def test_parse_repository_node_releases():
+    """The releases newer than the last seen one, the same as the REST backend."""
+    node = {
+        "latestRelease": release_node("v1.2"),
+        "releases": {"nodes": [release_node("v2.0rc1", prerelease=True), release_node("v1.2"), release_node("v1.1"), release_node("v1.0")]},
+    }
+
+    caught_up = parse_repository_node("owner/name", node, last_seen_tag="v1.0")
+    assert caught_up.latest_tag == "v1.2"
+    assert caught_up.releases == (release_info("v2.0rc1", prerelease=True), release_info("v1.2"), release_info("v1.1"))
+    assert not caught_up.truncated
+
+    prerelease = parse_repository_node("owner/name", node, last_seen_tag="v1.2")
+    assert prerelease.latest_tag is None
+    assert prerelease.releases == (release_info("v2.0rc1", prerelease=True),)
+
+    unchanged = parse_repository_node("owner/name", node, last_seen_tag="v2.0rc1")
+    assert (unchanged.latest_tag, unchanged.releases, unchanged.status) == (None, (), HTTPStatus.OK)
+
+    # The last seen release is older than the fetched ones
+    gap = parse_repository_node("owner/name", node, last_seen_tag="v0.9")
+    assert gap.latest_tag == "v1.2"
+    assert len(gap.releases) == 4
+    assert gap.truncated
+
+
+def test_parse_repository_node_prereleases_only():
+    """The latest final release is older than the fetched pre-releases."""
+    node = {"latestRelease": release_node("v1.0"), "releases": {"nodes": [release_node("v2.0rc2", True), release_node("v2.0rc1", True)]}}
+
+    response = parse_repository_node("owner/name", node, last_seen_tag="v0.9")
+    assert response.latest_tag == "v1.0"
+    assert response.releases == (release_info("v2.0rc2", True), release_info("v2.0rc1", True), release_info("v1.0"))
+
+
+def test_parse_repository_node_by_version():
+    node = {
+        "latestRelease": None,
+        "refs": {"nodes": [{"name": "nightly-29"}, {"name": "v1.0.3"}, {"name": "name-1.0.10rc1"}, {"name": "v1.0.10"}]},
+    }
+
+    assert parse_repository_node("owner/name", node).latest_tag == "v1.0.10"
+    assert parse_repository_node("owner/name", node, (None, r"^v")).latest_tag == "name-1.0.10rc1"
+    assert parse_repository_node("owner/name", node, (r"^nightly", None)).latest_tag == "nightly-29"
+    assert parse_repository_node("owner/name", node, (r"^release-", None)) == TagResponse()
+
+
+def test_get_latest_tags_filters(serve_github):
+    # Tags only: `nightly-0`, `nightly-1`, `v1.0.1`, `v1.0.2`, `v1.0.3`
+    fake_github = FakeGitHub(GeneratedRepositories(initial_releases=3, tags_count=2, no_releases_every=1))
+    names = [repository_name(index) for index in (1, 2)]
+
+    async def scenario():
+        async with serve_github(fake_github) as client:
+            return await get_latest_tags(client, names, (None, r"^v1\.0\.3$"), tags_count=100)
+
+    responses = asyncio.run(scenario())
+    assert [responses[name].latest_tag for name in names] == ["v1.0.2", "v1.0.2"]
+
+
+def test_get_latest_tags_partial_errors(serve_github, caplog):
+    # repo-1 has releases, repo-2 has tags only, repo-3 doesn't exist
+    fake_github = FakeGitHub(GeneratedRepositories(initial_releases=3, tags_count=2, no_releases_every=2, missing_every=3))
+
+    async def scenario():
+        async with serve_github(fake_github) as client:
+            return await get_latest_tags(client, [repository_name(index) for index in (1, 2, 3)])
+
+    with caplog.at_level(logging.WARNING):
+        responses = asyncio.run(scenario())
+
+    assert {name: (response.latest_tag, response.tag_url, len(response.releases)) for name, response in responses.items()} == {
+        repository_name(1): ("v1.0.3", f"https://github.com/{repository_name(1)}/releases/tag/v1.0.3", 3),
+        repository_name(2): ("v1.0.3", f"https://github.com/{repository_name(2)}/releases/tag/v1.0.3", 0),
+        repository_name(3): (None, None, 0),
+    }
+    assert fake_github.requests == {"graphql": 1}
+    assert "Could not resolve to a Repository" in caplog.text
+
+
+def test_get_latest_tags_failed_request(serve_github):
+    fake_github = FakeGitHub(rate_limit=RateLimit(0))
+
+    async def scenario():
+        async with serve_github(fake_github) as client:
+            return await get_latest_tags(client, [repository_name(1)])
+
+    assert not asyncio.run(scenario())
+
+
+@pytest.mark.parametrize(("tokens", "requests"), [(("test",), {"graphql": 3}), ((), {"releases": 5})])
+def test_check_repositories(run_with_db, serve_github, monkeypatch, tokens, requests):
+    """Batches of `GITHUB_GRAPHQL_BATCH_SIZE` repositories per query, the REST backend without a token."""
+    monkeypatch.setattr(settings, "GITHUB_BACKEND", GITHUB_BACKEND_GRAPHQL)
+    monkeypatch.setattr(settings, "GITHUB_GRAPHQL_BATCH_SIZE", 2)
+    fake_github = FakeGitHub(GeneratedRepositories(no_releases_every=0))
+
+    async def scenario():
+        await seed(5, 1, 5, random.Random(0))
+        async with serve_github(fake_github, tokens=tokens) as client:
+            tag_writer = TagWriter(batch_size=100, flush_period=60)
+            await run_instance(client, tag_writer, Scheduler())
+
+        async with async_session() as session:
+            return (await session.scalars(sa.select(Repository.latest_tag))).all()
+
+    assert run_with_db(scenario) == ["v1.0.3"] * 5
+    assert fake_github.requests == requests
+
+
+def test_check_repositories_failed_query(run_with_db, serve_github, monkeypatch):
+    """A failed query doesn't stop the sweep: the repositories of the batch are rescheduled and checked by the next sweeps."""
+    monkeypatch.setattr(settings, "GITHUB_BACKEND", GITHUB_BACKEND_GRAPHQL)
+    fake_github = FakeGitHub(rate_limit=RateLimit(0))
+
+    async def scenario():
+        await seed(3, 1, 3, random.Random(0))
+        async with serve_github(fake_github) as client:
+            await run_instance(client, TagWriter(batch_size=100, flush_period=60), Scheduler())
+
+        async with async_session() as session:
+            return (await session.execute(sa.select(Repository.latest_tag, Repository.next_check_at))).all()
+
+    started_at = utcnow()
+    assert all(latest_tag is None and next_check_at > started_at for latest_tag, next_check_at in run_with_db(scenario))
+    assert fake_github.requests == {"graphql": 1}
+
+
+@pytest.mark.parametrize("tokens", [("test",), ()])
+def test_release_history(run_with_db, serve_github, monkeypatch, tokens):
+    """Every release published between two checks is stored and announced by both backends."""
+    monkeypatch.setattr(settings, "GITHUB_BACKEND", GITHUB_BACKEND_GRAPHQL)
+    fake_github = FakeGitHub(GeneratedRepositories(initial_releases=3, no_releases_every=0))
+
+    async def scenario():
+        await seed(1, 1, 1, random.Random(0))
+        async with serve_github(fake_github, tokens=tokens) as client:
+            await run_instance(client, TagWriter(batch_size=100, flush_period=60), Scheduler())
+            fake_github.publish([repository_name(1)] * 2)
+            async with async_session() as session:
+                await session.execute(sa.update(Repository).values(next_check_at=utcnow() - datetime.timedelta(seconds=1)))
+                await session.commit()
+
+            await run_instance(client, TagWriter(batch_size=100, flush_period=60), Scheduler())
+
+        async with async_session() as session:
+            releases = (await session.scalars(sa.select(Release.tag).order_by(Release.id))).all()
+            notifications = (await session.scalars(sa.select(Outbox.text).order_by(Outbox.id))).all()
+        return releases, notifications
+
+    releases, notifications = run_with_db(scenario)
+    assert releases == [f"v1.0.{number}" for number in range(1, 6)]
+    assert [text.rsplit("/", 1)[-1] for text in notifications] == ["v1.0.3", "v1.0.4", "v1.0.5"]
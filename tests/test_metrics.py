@@ -0,0 +1,31 @@
+import asyncio
+
+from prometheus_client import Histogram
+from prometheus_client.parser import text_string_to_metric_families
+
+import metrics
+
+
+def test_metrics_endpoint():
+    """The metrics are served in the Prometheus text format, with the runtime metrics of the process."""
+    metrics.NOTIFICATIONS.labels(result="sent").inc()
+    metrics.COMMAND_DURATION.labels(command="/test").observe(0.02)
+
+    response = asyncio.run(metrics.handle_metrics(None))
+    families = {family.name: family for family in text_string_to_metric_families(response.text)}
+    assert response.content_type == "text/plain"
+    assert families["notifications"].type == "counter"
+    assert any(sample.labels == {"result": "sent"} and sample.value >= 1 for sample in families["notifications"].samples)
+    assert any(
+        sample.labels == {"command": "/test", "le": "0.025"} and sample.value >= 1
+        for sample in families["bot_command_duration_seconds"].samples
+    )
+    assert "python_info" in families
+
+
+def test_histogram_summary():
+    histogram = Histogram("test_summary_seconds", "Test histogram.", ["label"], registry=None)
+    histogram.labels(label="first").observe(1.0)
+    histogram.labels(label="second").observe(2.5)
+    histogram.labels(label="second").observe(0.5)
+    assert metrics.get_summary(histogram) == (3, 4.0)
@@ -0,0 +1,23 @@
+import asyncio
+
+import sqlalchemy as sa
+
+from migrations import MIGRATIONS, schema_version
+from models import create_engine, init_db
+
+
+def test_concurrent_migrations(tmp_path):
+    """Processes started at once against a new database: one applies the migrations, the other ones wait for it."""
+    database_url = f"sqlite+aiosqlite:///{tmp_path}/test.sqlite3"
+
+    async def scenario():
+        engines = await asyncio.gather(*(init_db(database_url) for _ in range(4)))
+        await asyncio.gather(*(engine.dispose() for engine in engines))
+        engine = create_engine(database_url)
+        try:
+            async with engine.connect() as connection:
+                return (await connection.scalars(sa.select(schema_version.c.version))).all()
+        finally:
+            await engine.dispose()
+
+    assert asyncio.run(scenario()) == [migration.VERSION for migration in MIGRATIONS]
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from typing import Tuple
+
+from benchmarks.fake_telegram import FakeTelegram
+from bot_controller.notifications import Notification, NotificationDispatcher
+from rate_limiter import TokenBucket
+
+
+async def measure(coroutine) -> float:
+    started_at = time.monotonic()
+    await coroutine
+    return time.monotonic() - started_at
+
+
+def test_no_burst_above_rate(serve_bot):
+    fake_telegram = FakeTelegram(rate=10, chat_period=0)
+
+    async def scenario():
+        async with serve_bot(fake_telegram) as bot:
+            dispatcher = NotificationDispatcher(bot, rate=10, chat_period=0, max_retries=3)
+            dispatcher.start(10)
+            try:
+                return await measure(dispatcher.dispatch([Notification(chat_id, "text") for chat_id in range(1, 16)]))
+            finally:
+                await dispatcher.stop()
+
+    # One message at once, the other ones at the rate
+    assert asyncio.run(scenario()) >= 1.3
+    assert fake_telegram.sent == 15
+    assert fake_telegram.flood_errors == 0
+
+
+def test_token_bucket_pause_resumes_empty():
+    async def scenario():
+        rate_limiter = TokenBucket(rate=10, capacity=5)
+        rate_limiter.pause(0.3)
+        return await measure(asyncio.gather(*(rate_limiter.acquire() for _ in range(2))))
+
+    assert asyncio.run(scenario()) >= 0.45
+
+
+def test_busy_chat_holds_no_worker(serve_bot):
+    """Messages of a chat waiting for its turn don't hold back the other chats, even with a single worker."""
+    fake_telegram = FakeTelegram(rate=1000, chat_period=0)
+
+    async def scenario() -> Tuple[float, float]:
+        async with serve_bot(fake_telegram) as bot:
+            dispatcher = NotificationDispatcher(bot, rate=1000, chat_period=0.5, max_retries=3)
+            dispatcher.start(1)
+            try:
+                notifications = [Notification(1, "first"), Notification(1, "second"), Notification(1, "third")]
+                notifications += [Notification(chat_id, "other") for chat_id in range(2, 6)]
+                task = asyncio.create_task(dispatcher.dispatch(notifications))
+                started_at = time.monotonic()
+                while fake_telegram.sent < 5:
+                    await asyncio.sleep(0.01)
+
+                return time.monotonic() - started_at, await measure(task)
+            finally:
+                await dispatcher.stop()
+
+    other_time, busy_time = asyncio.run(scenario())
+    assert [text for chat_id, text in fake_telegram.messages if chat_id == 1] == ["first", "second", "third"]
+    assert other_time < 0.3
+    # Two turns of the chat, paced a bit under its limit
+    assert other_time + busy_time >= 2 * 0.5 / 0.9
+
+
+def test_flood_control_of_chat(serve_bot):
+    """`retry_after` of chats that went over their limit (no chat pacing here) doesn't hold back the other chats."""
+    fake_telegram = FakeTelegram(rate=1000, chat_period=1.0)
+
+    async def scenario() -> Tuple[float, float]:
+        async with serve_bot(fake_telegram) as bot:
+            dispatcher = NotificationDispatcher(bot, rate=1000, chat_period=0, max_retries=3)
+            dispatcher.start(2)
+            try:
+                notifications = [Notification(chat_id, text) for text in ("first", "second") for chat_id in (1, 2)]
+                notifications += [Notification(chat_id, "other") for chat_id in range(3, 8)]
+                task = asyncio.create_task(dispatcher.dispatch(notifications))
+                started_at = time.monotonic()
+                while fake_telegram.sent < len(notifications) - 2:
+                    await asyncio.sleep(0.01)
+
+                return time.monotonic() - started_at, await measure(task)
+            finally:
+                await dispatcher.stop()
+
+    other_time, flooded_time = asyncio.run(scenario())
+    assert fake_telegram.sent == 9
+    assert fake_telegram.flood_errors == 2
+    assert other_time < 0.5
+    assert other_time + flooded_time >= 0.9
+
+
+def test_flood_control_of_bot(serve_bot):
+    """`retry_after` of a chat within its pace is the global limit: every worker pauses instead of hammering the API."""
+    fake_telegram = FakeTelegram(rate=3, chat_period=0)
+
+    async def scenario():
+        async with serve_bot(fake_telegram) as bot:
+            dispatcher = NotificationDispatcher(bot, rate=1000, chat_period=1.0, max_retries=5)
+            dispatcher.start(4)
+            try:
+                await dispatcher.dispatch([Notification(chat_id, "text") for chat_id in range(1, 10)])
+            finally:
+                await dispatcher.stop()
+
+    asyncio.run(scenario())
+    assert fake_telegram.sent == 9
+    assert fake_telegram.flood_errors <= 8
@@ -0,0 +1,143 @@
+import asyncio
+import datetime
+from typing import List
+
+import sqlalchemy as sa
+
+import db_helper
+from benchmarks.fake_telegram import FakeTelegram
+from bot_controller.notifications import NotificationDispatcher
+from bot_controller.outbox import OutboxConsumer, get_retry_delay, make_notifications
+from models import Outbox, async_session, utcnow
+
+DIGEST_PERIOD = datetime.timedelta(minutes=15)
+CLAIM_TIMEOUT = datetime.timedelta(minutes=5)
+RETRY_PERIOD = datetime.timedelta(minutes=1)
+
+
+async def add_outbox(*rows: Outbox) -> None:
+    async with async_session() as session:
+        session.add_all(rows)
+        await session.commit()
+
+
+def make_row(chat_id: int, text: str, age: datetime.timedelta, digest: bool = True) -> Outbox:
+    return Outbox(chat_id=chat_id, text=text, parse_mode="HTML", digest=digest, created_at=utcnow() - age)
+
+
+def test_claim_digest_of_chat_together(run_with_db):
+    async def scenario():
+        await add_outbox(
+            make_row(1, "first", datetime.timedelta(minutes=20)),
+            make_row(2, "not due", datetime.timedelta(minutes=1)),
+            make_row(1, "second", datetime.timedelta(minutes=10)),
+            make_row(1, "third", datetime.timedelta(seconds=1)),
+            make_row(3, "regular", datetime.timedelta(seconds=1), digest=False),
+        )
+        async with async_session() as session:
+            return await db_helper.claim_outbox(session, 1, CLAIM_TIMEOUT, DIGEST_PERIOD)
+
+    rows = run_with_db(scenario)
+    assert sorted((row.chat_id, row.text) for row in rows) == [(1, "first"), (1, "second"), (1, "third"), (3, "regular")]
+    ids = {row.text: row.id for row in rows}
+    assert [(notification.chat_id, notification.text, row_ids) for notification, row_ids in make_notifications(rows)] == [
+        (3, "regular", [ids["regular"]]),
+        (1, "first\nsecond\nthird", [ids["first"], ids["second"], ids["third"]]),
+    ]
+
+
+def test_claim_digest_not_due(run_with_db):
+    async def scenario():
+        await add_outbox(make_row(1, "new", datetime.timedelta(minutes=1)), make_row(1, "newer", datetime.timedelta(seconds=1)))
+        async with async_session() as session:
+            return await db_helper.claim_outbox(session, 10, CLAIM_TIMEOUT, DIGEST_PERIOD)
+
+    assert not run_with_db(scenario)
+
+
+def test_claimed_rows_are_skipped(run_with_db):
+    async def scenario():
+        await add_outbox(make_row(1, "old", datetime.timedelta(minutes=20)), make_row(2, "regular", datetime.timedelta(0), digest=False))
+        async with async_session() as session:
+            first = await db_helper.claim_outbox(session, 10, CLAIM_TIMEOUT, DIGEST_PERIOD)
+            second = await db_helper.claim_outbox(session, 10, CLAIM_TIMEOUT, DIGEST_PERIOD)
+        return first, second
+
+    first, second = run_with_db(scenario)
+    assert len(first) == 2
+    assert not second
+
+
+def test_postponed_rows_wait(run_with_db):
+    async def scenario():
+        await add_outbox(make_row(1, "regular", datetime.timedelta(0), digest=False))
+        async with async_session() as session:
+            rows = await db_helper.claim_outbox(session, 10, CLAIM_TIMEOUT, DIGEST_PERIOD)
+            await db_helper.postpone_outbox(session, {row.id: RETRY_PERIOD for row in rows})
+            waiting = await db_helper.claim_outbox(session, 10, CLAIM_TIMEOUT, DIGEST_PERIOD)
+            await session.execute(sa.update(Outbox).values(available_at=utcnow()))
+            await session.commit()
+            available = await db_helper.claim_outbox(session, 10, CLAIM_TIMEOUT, DIGEST_PERIOD)
+        return waiting, available
+
+    waiting, available = run_with_db(scenario)
+    assert not waiting
+    assert [(row.text, row.attempts) for row in available] == [("regular", 1)]
+
+
+def test_retry_delay():
+    assert [get_retry_delay(attempts, RETRY_PERIOD) for attempts in (0, 1, 3)] == [RETRY_PERIOD, 2 * RETRY_PERIOD, 8 * RETRY_PERIOD]
+    assert get_retry_delay(1000, RETRY_PERIOD) == datetime.timedelta(days=1)
+
+
+def test_undelivered_rows_are_postponed(run_with_db, serve_bot):
+    """Delivered rows and the ones that can't be delivered at all are deleted, the failed ones are sent again later."""
+    fake_telegram = FakeTelegram(chat_period=0)
+    fake_telegram.chat_errors = {
+        2: (403, "Forbidden: bot was blocked by the user"),
+        3: (400, "Bad Request: chat not found"),
+        4: (500, "Internal Server Error"),
+        5: (500, "Internal Server Error"),
+    }
+
+    async def get_outbox() -> List[Outbox]:
+        async with async_session() as session:
+            return (await session.execute(sa.select(Outbox).order_by(Outbox.id))).scalars().all()
+
+    async def scenario():
+        await add_outbox(
+            *(make_row(chat_id, f"regular-{chat_id}", datetime.timedelta(0), digest=False) for chat_id in (1, 2, 3, 4)),
+            make_row(5, "first", datetime.timedelta(minutes=20)),
+            make_row(5, "second", datetime.timedelta(minutes=20)),
+        )
+        async with serve_bot(fake_telegram) as bot:
+            dispatcher = NotificationDispatcher(bot, rate=1000, chat_period=0, max_retries=1)
+            consumer = OutboxConsumer(
+                dispatcher,
+                batch_size=10,
+                poll_period=60,
+                claim_timeout=CLAIM_TIMEOUT,
+                digest_period=DIGEST_PERIOD,
+                retry_period=RETRY_PERIOD,
+            )
+            dispatcher.start(2)
+            consumer.start()
+            try:
+                # Processed: the delivered rows are deleted, the claim of the other ones is released
+                while len(rows := await get_outbox()) > 3 or any(row.claimed_at for row in rows):
+                    await asyncio.sleep(0.05)
+            finally:
+                await consumer.stop()
+                await dispatcher.stop()
+
+        return await get_outbox()
+
+    started_at = utcnow()
+    rows = run_with_db(scenario)
+    assert fake_telegram.messages == [(1, "regular-1")]
+    assert [(row.chat_id, row.text, row.attempts, row.claimed_at) for row in rows] == [
+        (4, "regular-4", 1, None),
+        (5, "first", 1, None),
+        (5, "second", 1, None),
+    ]
+    assert all(row.available_at >= started_at + RETRY_PERIOD for row in rows)
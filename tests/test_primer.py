@@ -0,0 +1,93 @@
+import asyncio
+import functools
+import logging
+import random
+
+from benchmarks.fake_github import REPOSITORY_OWNER, FakeGitHub, GeneratedRepositories, RateLimit
+from benchmarks.harness import seed
+from release_monitor.primer import Primer
+from release_monitor.release_monitor import check_last_repository_tag
+from release_monitor.services.github import get_latest_tag_from_tag_uri
+from release_monitor.tag_writer import TagWriter
+
+
+def make_primer(client, tag_writer: TagWriter, check=check_last_repository_tag) -> Primer:
+    return Primer(functools.partial(check, client, tag_writer), tag_writer, timeout=5)
+
+
+def test_concurrent_primes_share_fetch(run_with_db, serve_github):
+    fake_github = FakeGitHub(GeneratedRepositories(initial_releases=3), latency=0.1)
+
+    async def scenario():
+        await seed(1, 1, 1, random.Random(0))
+        tag_writer = TagWriter(100, 60)
+        async with serve_github(fake_github) as client:
+            primer = make_primer(client, tag_writer)
+            concurrent = await asyncio.gather(*(primer.prime([1]) for _ in range(10)))
+            in_flight = len(primer)
+            # The tag is known now: the repository is left to the regular schedule
+            known = await primer.prime([1])
+        return concurrent, in_flight, known
+
+    concurrent, in_flight, known = run_with_db(scenario)
+    assert concurrent == [{1: "v1.0.3"}] * 10
+    assert in_flight == 0
+    assert known == {1: "v1.0.3"}
+    assert fake_github.requests == {"releases": 1}
+
+
+def test_prime_jumps_bucket_queue(run_with_db, serve_github):
+    """The primed repository gets the next token in front of the regular checks already waiting for the bucket."""
+    # The budget of the quota is about 4 requests per second
+    fake_github = FakeGitHub(GeneratedRepositories(initial_releases=3), RateLimit(limit=40, window=10))
+    finished = []
+
+    async def fetch_tags(client, index: int):
+        await get_latest_tag_from_tag_uri(client, f"{REPOSITORY_OWNER}/repo-{index}")
+        finished.append(f"repo-{index}")
+
+    async def prime(primer: Primer):
+        await primer.prime([1])
+        finished.append("primed")
+
+    async def scenario():
+        await seed(1, 1, 1, random.Random(0))
+        tag_writer = TagWriter(100, 60)
+        async with serve_github(fake_github, rate=4) as client:
+            regular = [asyncio.create_task(fetch_tags(client, index)) for index in range(2, 10)]
+            await asyncio.sleep(0.05)
+            await asyncio.gather(prime(make_primer(client, tag_writer)), *regular)
+
+    run_with_db(scenario)
+    assert len(finished) == 9
+    assert finished.index("primed") <= 5
+
+
+def test_failed_prime_is_retried(run_with_db, serve_github, caplog):
+    fake_github = FakeGitHub(GeneratedRepositories(initial_releases=3))
+    failures = [RuntimeError("Check failed")]
+
+    async def check(client, tag_writer, repository):
+        if failures:
+            raise failures.pop()
+
+        return await check_last_repository_tag(client, tag_writer, repository)
+
+    async def scenario():
+        await seed(1, 1, 1, random.Random(0))
+        tag_writer = TagWriter(100, 60)
+        async with serve_github(fake_github) as client:
+            primer = make_primer(client, tag_writer, check)
+            failed = await primer.prime([1])
+            in_flight = len(primer)
+            retried = await primer.prime([1])
+        return failed, in_flight, retried
+
+    with caplog.at_level(logging.ERROR):
+        failed, in_flight, retried = run_with_db(scenario)
+
+    assert failed == {1: None}
+    assert in_flight == 0
+    assert retried == {1: "v1.0.3"}
+    assert "Check failed" in caplog.text
+    assert fake_github.requests == {"releases": 1}
@@ -0,0 +1,239 @@
+import asyncio
+import datetime
+import random
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+import sqlalchemy as sa
+
+import db_helper
+import settings
+from benchmarks.fake_github import FakeGitHub, GeneratedRepositories
+from benchmarks.harness import run_instance, seed
+from db_helper import RepositoryRecord
+from models import Outbox, Repository, async_session, utcnow
+from release_monitor.scheduler import Scheduler, next_check_interval
+from release_monitor.tag_writer import TagWriter
+
+Lease = Tuple[Optional[str], Optional[datetime.datetime]]
+NOW = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+HOUR = 3600
+
+
+@pytest.fixture(name="no_jitter")
+def fixture_no_jitter(monkeypatch):
+    monkeypatch.setattr(settings, "SCHEDULER_JITTER", 0.0)
+
+
+def make_repository(**fields) -> RepositoryRecord:
+    defaults = {
+        "id": 1,
+        "short_name": "owner/repo",
+        "latest_tag": "v1.0.0",
+        "check_interval": None,
+        "release_interval": None,
+        "last_release_at": None,
+        "tag_source": None,
+        "tag_source_checked_at": None,
+        "subscribers_count": 1,
+        "last_seen_tag": None,
+        "http_cache": {},
+    }
+    return RepositoryRecord(**{**defaults, **fields})
+
+
+def get_delay(schedule: Dict[str, object]) -> float:
+    return (schedule["next_check_at"] - NOW).total_seconds()
+
+
+async def get_leases() -> Dict[int, Lease]:
+    async with async_session() as session:
+        rows = await session.execute(sa.select(Repository.id, Repository.lease_owner, Repository.lease_expires_at))
+        return {repository_id: (owner, expires_at) for repository_id, owner, expires_at in rows}
+
+
+async def expire_leases(owner: str) -> None:
+    """The instance crashed `lease_ttl` seconds ago."""
+    async with async_session() as session:
+        await session.execute(
+            sa.update(Repository).where(Repository.lease_owner == owner).values(lease_expires_at=utcnow() - datetime.timedelta(seconds=1))
+        )
+        await session.commit()
+
+
+async def load_all(scheduler: Scheduler) -> List[int]:
+    await scheduler.load()
+    return sorted(scheduler.pop_due())
+
+
+def test_lease_is_exclusive_until_expired(run_with_db):
+    first, second = Scheduler(owner="first"), Scheduler(owner="second")
+
+    async def scenario():
+        repository_ids = await seed(3, 1, 3, random.Random(0))
+        assert await load_all(first) == repository_ids
+        assert await load_all(second) == []
+
+        await expire_leases("first")
+        assert await load_all(second) == repository_ids
+        return await get_leases()
+
+    assert {owner for owner, _ in run_with_db(scenario).values()} == {"second"}
+
+
+def test_stale_owner_flush_is_ignored(run_with_db):
+    """An instance that lost its leases doesn't overwrite the schedule of the new owner."""
+    first, second = Scheduler(owner="first"), Scheduler(owner="second")
+
+    async def scenario():
+        repository_ids = await seed(3, 1, 3, random.Random(0))
+        await load_all(first)
+        await expire_leases("first")
+        await load_all(second)
+        async with async_session() as session:
+            repositories = await db_helper.get_repository_records(session, repository_ids)
+
+        for repository in repositories:
+            first.reschedule(repository, changed=True)
+        await first.flush()
+
+        async with async_session() as session:
+            return (await session.execute(sa.select(Repository.lease_owner, Repository.check_interval, Repository.last_release_at))).all()
+
+    assert run_with_db(scenario) == [("second", None, None)] * 3
+
+
+def test_reschedule_releases_lease(run_with_db):
+    """A repository checked and due after the next load is released for any instance, the unchecked one stays leased."""
+    scheduler = Scheduler(owner="first")
+
+    async def scenario():
+        repository_ids = await seed(2, 1, 2, random.Random(0))
+        await load_all(scheduler)
+        async with async_session() as session:
+            repositories = await db_helper.get_repository_records(session, repository_ids)
+
+        scheduler.reschedule(repositories[0], changed=False)
+        await scheduler.flush()
+        return await get_leases(), repository_ids
+
+    leases, repository_ids = run_with_db(scenario)
+    assert leases[repository_ids[0]] == (None, None)
+    assert leases[repository_ids[1]][0] == "first"
+
+
+def test_prolong_leases(run_with_db):
+    scheduler = Scheduler(owner="first", lease_ttl=300)
+
+    async def scenario():
+        await seed(2, 1, 2, random.Random(0))
+        await load_all(scheduler)
+        async with async_session() as session:
+            await session.execute(sa.update(Repository).values(lease_expires_at=utcnow() + datetime.timedelta(seconds=1)))
+            await session.commit()
+
+        await scheduler.prolong_leases()
+        return await get_leases()
+
+    started_at = utcnow()
+    leases = run_with_db(scenario)
+    assert all(owner == "first" and expires_at >= started_at + datetime.timedelta(seconds=299) for owner, expires_at in leases.values())
+
+
+def test_release_leases_on_shutdown(run_with_db):
+    first, second = Scheduler(owner="first"), Scheduler(owner="second")
+
+    async def scenario():
+        repository_ids = await seed(3, 1, 3, random.Random(0))
+        await first.load()
+        await first.release_leases()
+        assert len(first) == 0
+        assert set((await get_leases()).values()) == {(None, None)}
+        return repository_ids, await load_all(second)
+
+    repository_ids, second_ids = run_with_db(scenario)
+    assert second_ids == repository_ids
+
+
+def test_instances_share_repositories(run_with_db, serve_github):
+    """Two instances check every repository once: the leases, not the unique releases, keep the notifications single."""
+    fake_github = FakeGitHub(GeneratedRepositories(no_releases_every=0))
+
+    async def scenario():
+        await seed(20, 3, 20, random.Random(0))
+        async with serve_github(fake_github) as client:
+            await asyncio.gather(
+                *(
+                    run_instance(client, TagWriter(batch_size=100, flush_period=60), Scheduler(owner=owner, batch_size=5))
+                    for owner in ("first", "second")
+                )
+            )
+
+        async with async_session() as session:
+            return (await session.execute(sa.select(Outbox.chat_id, Outbox.text))).all()
+
+    notifications = run_with_db(scenario)
+    assert fake_github.requests == {"releases": 20}
+    assert len(notifications) == 3 * 20
+    assert len(set(notifications)) == len(notifications)
+
+
+@pytest.mark.usefixtures("no_jitter")
+def test_backoff_of_unchanged_checks(monkeypatch):
+    monkeypatch.setattr(settings, "SURVEY_PERIOD", HOUR)
+    repository = make_repository()
+    intervals = []
+    for _ in range(3):
+        schedule = next_check_interval(repository, changed=False, now=NOW)
+        intervals.append((schedule["check_interval"], get_delay(schedule)))
+        repository = repository._replace(check_interval=schedule["check_interval"])
+
+    # x1.5 per check from `SURVEY_PERIOD`
+    assert intervals == [(interval, interval) for interval in (5400, 8100, 12150)]
+
+
+@pytest.mark.usefixtures("no_jitter")
+def test_backoff_within_release_interval():
+    """A repository releasing every 8 hours is polled at least every 2 hours."""
+    schedule = next_check_interval(make_repository(check_interval=4 * HOUR, release_interval=8 * HOUR), changed=False, now=NOW)
+    assert schedule["check_interval"] == 2 * HOUR
+
+
+@pytest.mark.usefixtures("no_jitter")
+def test_release_resets_interval():
+    first = next_check_interval(make_repository(check_interval=12 * HOUR), changed=True, now=NOW)
+    assert first["check_interval"] == settings.SCHEDULER_MIN_INTERVAL
+    assert first["last_release_at"] == NOW
+    assert first["release_interval"] is None
+
+    # The release interval is a moving average of the intervals between the releases: 0.3 * 10 h + 0.7 * 20 h
+    repository = make_repository(check_interval=12 * HOUR, release_interval=20 * HOUR, last_release_at=NOW - datetime.timedelta(hours=10))
+    second = next_check_interval(repository, changed=True, now=NOW)
+    assert second["check_interval"] == settings.SCHEDULER_MIN_INTERVAL
+    assert second["release_interval"] == 17 * HOUR
+    assert get_delay(second) == settings.SCHEDULER_MIN_INTERVAL
+
+
+@pytest.mark.usefixtures("no_jitter")
+def test_interval_bounds():
+    dormant = next_check_interval(make_repository(check_interval=settings.SCHEDULER_MAX_INTERVAL), changed=False, now=NOW)
+    assert dormant["check_interval"] == settings.SCHEDULER_MAX_INTERVAL
+    assert get_delay(dormant) == settings.SCHEDULER_MAX_INTERVAL
+
+    # 100 subscribers: a third of the interval, but not below the minimum
+    popular = make_repository(check_interval=6 * HOUR, subscribers_count=100)
+    assert get_delay(next_check_interval(popular, changed=False, now=NOW)) == 3 * HOUR
+    assert get_delay(next_check_interval(popular, changed=True, now=NOW)) == settings.SCHEDULER_MIN_INTERVAL
+
+
+def test_jitter_bounds(monkeypatch):
+    monkeypatch.setattr(settings, "SCHEDULER_JITTER", 0.1)
+    repository = make_repository(check_interval=2 * HOUR)
+    delays = [get_delay(next_check_interval(repository, changed=False, now=NOW)) for _ in range(1000)]
+    assert all(0.9 * 3 * HOUR <= delay <= 1.1 * 3 * HOUR for delay in delays)
+    assert max(delays) - min(delays) > 0.1 * 3 * HOUR
+
+    # The jitter doesn't break the bounds
+    dormant = make_repository(check_interval=settings.SCHEDULER_MAX_INTERVAL)
+    assert max(get_delay(next_check_interval(dormant, changed=False, now=NOW)) for _ in range(100)) == settings.SCHEDULER_MAX_INTERVAL
+    assert min(get_delay(next_check_interval(repository, changed=True, now=NOW)) for _ in range(100)) == settings.SCHEDULER_MIN_INTERVAL
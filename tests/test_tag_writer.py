@@ -0,0 +1,60 @@
+import sqlalchemy as sa
+
+import db_helper
+from models import Release, Repository, async_session
+from release_monitor.tag_writer import TagWriter
+
+# `repository.latest_tag` is VARCHAR(50): PostgreSQL rejects longer tags, SQLite doesn't check the length
+MAX_TAG_LENGTH = 50
+
+
+def make_change(repository_id: int, tag: str) -> db_helper.TagChange:
+    return db_helper.TagChange(
+        repository_id=repository_id,
+        short_name=f"owner/name{repository_id}",
+        latest_tag=tag,
+        releases=(db_helper.NewRelease(tag, f"https://github.com/owner/name{repository_id}/releases/tag/{tag}"),),
+    )
+
+
+async def add_repositories(count: int) -> None:
+    async with async_session() as session:
+        session.add_all(
+            [Repository(url=f"https://github.com/owner/name{index}", short_name=f"owner/name{index}") for index in range(1, count + 1)]
+        )
+        await session.commit()
+
+
+def test_unwritable_change_is_dropped(run_with_db, monkeypatch):
+    update_repositories_latest_tags = db_helper.update_repositories_latest_tags
+
+    async def update_checked(session, changes):
+        if any(len(change.latest_tag) > MAX_TAG_LENGTH for change in changes):
+            raise sa.exc.DataError("UPDATE", {}, Exception("value too long for type character varying(50)"))
+
+        await update_repositories_latest_tags(session, changes)
+
+    monkeypatch.setattr(db_helper, "update_repositories_latest_tags", update_checked)
+    flushed = []
+
+    async def scenario():
+        await add_repositories(3)
+        tag_writer = TagWriter(batch_size=10, flush_period=60, on_flush=lambda: flushed.append(True))
+        await tag_writer.add(make_change(1, "v1.0"))
+        await tag_writer.add(make_change(2, "v" + "1" * MAX_TAG_LENGTH))
+        await tag_writer.add(make_change(3, "v3.0"))
+        await tag_writer.flush()
+        assert not tag_writer
+
+        await tag_writer.add(make_change(1, "v1.1"))
+        await tag_writer.flush()
+        async with async_session() as session:
+            tags = dict((await session.execute(sa.select(Repository.id, Repository.latest_tag))).all())
+            releases = (await session.scalars(sa.select(Release.tag).order_by(Release.id))).all()
+
+        return tags, releases
+
+    tags, releases = run_with_db(scenario)
+    assert tags == {1: "v1.1", 2: None, 3: "v3.0"}
+    assert releases == ["v1.0", "v3.0", "v1.1"]
+    assert len(flushed) == 2
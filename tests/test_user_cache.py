@@ -0,0 +1,47 @@
+from prometheus_client import REGISTRY
+
+from models import User
+from user_cache import CachedUser, UserCache
+
+
+def get_lookups(result: str) -> float:
+    return REGISTRY.get_sample_value("user_cache_lookups_total", {"result": result}) or 0.0
+
+
+def make_user(user_id: int) -> User:
+    return User(id=user_id, external_id=1000 + user_id)
+
+
+def test_lookups():
+    cache = UserCache(maxsize=10, ttl=60)
+    hits, misses = get_lookups("hit"), get_lookups("miss")
+    assert cache.get(1001) is None
+    cache.put(make_user(1))
+    assert cache.get(1001) == CachedUser(1, 1001)
+    assert (get_lookups("hit") - hits, get_lookups("miss") - misses) == (1, 1)
+
+
+def test_least_recently_used_are_evicted():
+    cache = UserCache(maxsize=2, ttl=60)
+    cache.put(make_user(1))
+    cache.put(make_user(2))
+    cache.get(1001)
+    cache.put(make_user(3))
+    assert [cache.get(external_id) is not None for external_id in (1001, 1002, 1003)] == [True, False, True]
+
+
+def test_expired_and_invalidated():
+    expired, cache = UserCache(maxsize=10, ttl=-1), UserCache(maxsize=10, ttl=60)
+    expired.put(make_user(1))
+    cache.put(make_user(1))
+    cache.invalidate(1001)
+    assert expired.get(1001) is None
+    assert cache.get(1001) is None
+    assert not expired
+    assert not cache
+
+
+def test_disabled():
+    cache = UserCache(maxsize=0, ttl=60)
+    cache.put(make_user(1))
+    assert cache.get(1001) is None
@@ -0,0 +1,79 @@
+import pytest
+
+from release_monitor.services.versions import LatestTagResolver, version_key
+
+
+@pytest.mark.parametrize(
+    ("older", "newer"),
+    [
+        ("v9.0", "v10.0"),
+        ("1.0rc1", "1.0"),
+        ("1.0.dev1", "1.0a1"),
+        ("1.0", "1.0.post1"),
+        ("v1.0.3", "release-1.1"),
+        ("project-2.0", "v2.1"),
+        ("nightly-29", "v1.0.3"),
+        ("build-1234", "v2.0.0"),
+        ("20240101", "0.1"),
+        ("latest", "v0.1"),
+    ],
+)
+def test_version_order(older, newer):
+    assert version_key(older, "project") < version_key(newer, "project")
+
+
+@pytest.mark.parametrize("tag", ["v1.0", "V1.0.0", "release-1.0", "1.0", "v1.0+build.5"])
+def test_same_version(tag):
+    assert version_key(tag)[:4] == version_key("1.0")[:4]
+
+
+@pytest.mark.parametrize("tag", ["nightly-29", "build-1234", "other-1.0", "rel_1.0", "v1", "1.2.3.4", "20240101", "1.0-final"])
+def test_not_a_version(tag):
+    assert version_key(tag, "project")[0] == 0
+
+
+def test_name_prefix():
+    assert version_key("project-1.0", "project")[0] == 1
+    assert version_key("project-1.0")[0] == 0
+    assert version_key("my.project-1.0", "my.project")[0] == 1
+    assert version_key("myxproject-1.0", "my.project")[0] == 0
+
+
+def test_resolver_skips_tags_without_version():
+    resolver = LatestTagResolver(name="project")
+    for tag in ["v1.0.3", "nightly-29", "build-1234", "project-1.0.4", "v1.0.4rc1"]:
+        resolver.feed(tag)
+
+    assert resolver.latest_tag == "project-1.0.4"
+
+
+def test_resolver_lexical_fallback():
+    resolver = LatestTagResolver()
+    for tag in ["nightly-29", "nightly-3", "build-1234"]:
+        resolver.feed(tag)
+
+    assert resolver.latest_tag == "nightly-3"
+
+
+def test_resolver_filters():
+    resolver = LatestTagResolver(include=r"^v", exclude=r"rc")
+    for tag in ["v1.0", "v2.0rc1", "release-3.0", "v1.1"]:
+        resolver.feed(tag)
+
+    assert resolver.latest_tag == "v1.1"
+
+
+def test_resolver_skips_prereleases():
+    resolver = LatestTagResolver()
+    for tag in ["v1.9.0", "v2.0.0-rc1", "v2.0.0b1", "v1.9.0.post1", "nightly-29"]:
+        resolver.feed(tag)
+
+    assert resolver.latest_tag == "v1.9.0.post1"
+
+
+def test_resolver_prereleases_only():
+    resolver = LatestTagResolver()
+    for tag in ["v0.1.0-beta", "v0.2.0-rc1", "nightly-29"]:
+        resolver.feed(tag)
+
+    assert resolver.latest_tag == "v0.2.0-rc1"
@@ -0,0 +1,105 @@
+import asyncio
+import contextlib
+import datetime
+from typing import AsyncIterator, List, Tuple
+
+from aiogram import types
+from aiohttp import ClientSession
+
+import settings
+from benchmarks.fake_telegram import FakeTelegram
+from benchmarks.harness import WEBHOOK_SECRET, make_update, post_update, start_server
+from bot_controller import BotController
+from bot_controller.services.subscriptions import SubscriptionsPageCallback
+
+USER_ID = 42
+REPOSITORY_URL = "https://github.com/owner/name"
+
+
+@contextlib.asynccontextmanager
+async def serve_webhook(bot_controller: BotController) -> AsyncIterator[str]:
+    runner, url = await start_server(bot_controller.make_webhook_app())
+    try:
+        yield f"{url}{settings.WEBHOOK_PATH}"
+    finally:
+        await runner.cleanup()
+        await bot_controller.close()
+
+
+async def wait_messages(fake_telegram: FakeTelegram, count: int, timeout: float = 5.0) -> List[Tuple[int, str]]:
+    """The webhook answers at once and handles the update in background: wait for its replies."""
+    async with asyncio.timeout(timeout):
+        while len(fake_telegram.messages) < count:
+            await asyncio.sleep(0.01)
+
+    return fake_telegram.messages
+
+
+def make_callback_update(update_id: int, user_id: int, message_id: int, data: str) -> types.Update:
+    user = types.User(id=user_id, is_bot=False, first_name=f"user-{user_id}")
+    message = types.Message(
+        message_id=message_id,
+        date=datetime.datetime.now(datetime.timezone.utc),
+        chat=types.Chat(id=user_id, type="private"),
+        text="",
+    )
+    callback_query = types.CallbackQuery(id=str(update_id), from_user=user, chat_instance=str(user_id), message=message, data=data)
+    return types.Update(update_id=update_id, callback_query=callback_query)
+
+
+def test_webhook_commands(run_with_db, monkeypatch, bot_controller, serve_telegram):
+    monkeypatch.setattr(settings, "WEBHOOK_SECRET", WEBHOOK_SECRET)
+    fake_telegram = FakeTelegram(chat_period=0)
+    commands = ["/start", f"/subscribe {REPOSITORY_URL}", "/my_subscriptions"]
+
+    async def scenario():
+        async with serve_telegram(fake_telegram), serve_webhook(bot_controller) as webhook_url, ClientSession() as session:
+            for update_id, command in enumerate(commands, start=1):
+                await post_update(session, webhook_url, make_update(update_id, USER_ID, command))
+                await wait_messages(fake_telegram, update_id)
+
+    run_with_db(scenario)
+    start_chat, start_reply = fake_telegram.messages[0]
+    assert start_chat == USER_ID
+    assert "/subscribe" in start_reply and "/my_subscriptions" in start_reply
+    assert fake_telegram.messages[1:] == [
+        (USER_ID, f"Subscribed (1):\n{REPOSITORY_URL}"),
+        (USER_ID, f"Subscriptions (1):\n<fetch in progress> - {REPOSITORY_URL}"),
+    ]
+
+
+def test_webhook_secret(run_with_db, monkeypatch, bot_controller, serve_telegram):
+    monkeypatch.setattr(settings, "WEBHOOK_SECRET", "other")
+    fake_telegram = FakeTelegram(chat_period=0)
+
+    async def scenario() -> int:
+        async with serve_telegram(fake_telegram), serve_webhook(bot_controller) as webhook_url, ClientSession() as session:
+            headers = {"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET, "Content-Type": "application/json"}
+            update = make_update(1, USER_ID, "/start")
+            async with session.post(webhook_url, data=update.model_dump_json(), headers=headers) as response:
+                return response.status
+
+    assert run_with_db(scenario) == 401
+    assert not fake_telegram.messages
+
+
+def test_webhook_page_not_modified(run_with_db, monkeypatch, bot_controller, serve_telegram):
+    monkeypatch.setattr(settings, "WEBHOOK_SECRET", WEBHOOK_SECRET)
+    fake_telegram = FakeTelegram(chat_period=0)
+
+    async def scenario():
+        async with serve_telegram(fake_telegram), serve_webhook(bot_controller) as webhook_url, ClientSession() as session:
+            for update_id, command in enumerate([f"/subscribe {REPOSITORY_URL}", "/my_subscriptions"], start=1):
+                await post_update(session, webhook_url, make_update(update_id, USER_ID, command))
+                await wait_messages(fake_telegram, update_id)
+
+            # The page shown again as is: Telegram refuses the edit
+            update = make_callback_update(3, USER_ID, 2, SubscriptionsPageCallback().pack())
+            await post_update(session, webhook_url, update)
+            async with asyncio.timeout(5):
+                while not fake_telegram.answered_callbacks:
+                    await asyncio.sleep(0.01)
+
+    run_with_db(scenario)
+    assert fake_telegram.answered_callbacks == ["3"]
+    assert fake_telegram.messages[1] == (USER_ID, f"Subscriptions (1):\n<fetch in progress> - {REPOSITORY_URL}")